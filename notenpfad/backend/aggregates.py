@@ -0,0 +1,197 @@
+import sys
+
+from sqlalchemy import bindparam, func, insert, select, update
+import models, database
+
+# Maintenance of the student_score_aggregates table.
+#
+# Every write that adds or removes grades updates the matching
+# (student, subject, type) row in the same session, so the caller's
+# commit covers both. Deltas are applied as "col = col + x" updates,
+# which keeps concurrent writers from losing increments.
+
+Agg = models.StudentScoreAggregate
+
+# Running float sums may differ from a fresh SUM() in the last bits
+TOLERANCE = 1e-6
+
+
+def _weighting(db, subject_id):
+    subject = db.get(models.Subject, subject_id)
+    return subject.weighting if subject and subject.weighting is not None else 0.0
+
+
+def apply_delta(db, student_id, subject_id, g_type, value, count, weighting):
+    # value/count may be a whole batch: (sum of values, number of grades)
+    key = (Agg.student_id == student_id, Agg.subject_id == subject_id, Agg.type == g_type)
+    updated = db.query(Agg).filter(*key).update({
+        Agg.value_sum: Agg.value_sum + value,
+        Agg.value_count: Agg.value_count + count,
+        Agg.weighted_sum: Agg.weighted_sum + value * weighting,
+    }, synchronize_session=False)
+
+    if not updated and count > 0:
+        db.execute(insert(Agg).values(
+            student_id=student_id, subject_id=subject_id, type=g_type,
+            value_sum=value, value_count=count, weighted_sum=value * weighting,
+        ))
+    elif count < 0:
+        # Drop empty buckets so reads never see stale zero rows
+        db.query(Agg).filter(*key, Agg.value_count <= 0).delete(synchronize_session=False)
+
+
+def add_deltas(db, deltas):
+    # Batched apply_delta (bulk import, POST /sync), three statements
+    # however many buckets: find the existing rows, then one executemany
+    # UPDATE and one executemany INSERT. Negative deltas must hit existing
+    # buckets; buckets they empty are dropped with one more DELETE.
+    # deltas: [(student_id, subject_id, type, value sum, count, weighting)]
+    if not deltas:
+        return
+    existing = set(
+        db.query(Agg.student_id, Agg.subject_id, Agg.type)
+        .filter(Agg.student_id.in_({delta[0] for delta in deltas}))
+        .all()
+    )
+    updates, inserts = [], []
+    for student_id, subject_id, g_type, value, count, weighting in deltas:
+        if (student_id, subject_id, g_type) in existing:
+            updates.append({
+                "k_student": student_id, "k_subject": subject_id, "k_type": g_type,
+                "d_sum": value, "d_count": count, "d_weighted": value * weighting,
+            })
+        else:
+            inserts.append({
+                "student_id": student_id, "subject_id": subject_id, "type": g_type,
+                "value_sum": value, "value_count": count, "weighted_sum": value * weighting,
+            })
+
+    table = Agg.__table__
+    if updates:
+        db.execute(
+            update(table)
+            .where(
+                table.c.student_id == bindparam("k_student"),
+                table.c.subject_id == bindparam("k_subject"),
+                table.c.type == bindparam("k_type"),
+            )
+            .values(
+                value_sum=table.c.value_sum + bindparam("d_sum"),
+                value_count=table.c.value_count + bindparam("d_count"),
+                weighted_sum=table.c.weighted_sum + bindparam("d_weighted"),
+            ),
+            updates,
+        )
+    if inserts:
+        db.execute(insert(table), inserts)
+    removed = {delta[0] for delta in deltas if delta[4] < 0}
+    if removed:
+        db.query(Agg).filter(Agg.student_id.in_(removed), Agg.value_count <= 0).delete(synchronize_session=False)
+
+
+def add_grade(db, grade):
+    apply_delta(db, grade.student_id, grade.subject_id, grade.type, grade.value, 1,
+                _weighting(db, grade.subject_id))
+
+
+def remove_grade(db, grade):
+    apply_delta(db, grade.student_id, grade.subject_id, grade.type, -grade.value, -1,
+                _weighting(db, grade.subject_id))
+
+
+def remove_student(db, student_id):
+    db.query(Agg).filter(Agg.student_id == student_id).delete(synchronize_session=False)
+
+
+def _grouped_grades():
+    # What the table should contain, computed from the raw grades
+    weighting = func.coalesce(models.Subject.weighting, 0.0)
+    return (
+        select(
+            models.Grade.student_id,
+            models.Grade.subject_id,
+            models.Grade.type,
+            func.sum(models.Grade.value),
+            func.count(models.Grade.value),
+            func.sum(models.Grade.value * weighting),
+        )
+        .outerjoin(models.Subject, models.Grade.subject_id == models.Subject.id)
+        .where(models.Grade.value.isnot(None))
+        .group_by(models.Grade.student_id, models.Grade.subject_id, models.Grade.type)
+    )
+
+
+def rebuild(db):
+    db.query(Agg).delete(synchronize_session=False)
+    db.execute(insert(Agg).from_select(
+        ["student_id", "subject_id", "type", "value_sum", "value_count", "weighted_sum"],
+        _grouped_grades(),
+    ))
+
+
+def ensure_built(db):
+    # Databases created before the aggregate table existed start out empty
+    if db.query(Agg).first() is None and db.query(models.Grade).first() is not None:
+        rebuild(db)
+        db.commit()
+
+
+def verify(db):
+    # Returns a list of drifted buckets (empty list = table is consistent)
+    expected = {
+        (row[0], row[1], row[2]): row[3:]
+        for row in db.execute(_grouped_grades())
+    }
+    actual = {
+        (row.student_id, row.subject_id, row.type): (row.value_sum, row.value_count, row.weighted_sum)
+        for row in db.query(Agg)
+    }
+
+    drift = []
+    for key in sorted(expected.keys() | actual.keys(), key=str):
+        want = expected.get(key)
+        have = actual.get(key)
+        if want and have and want[1] == have[1] \
+                and abs(want[0] - have[0]) <= TOLERANCE and abs(want[2] - have[2]) <= TOLERANCE:
+            continue
+        drift.append({
+            "student_id": key[0],
+            "subject_id": key[1],
+            "type": key[2],
+            "expected": list(want) if want else None,
+            "actual": list(have) if have else None,
+        })
+    return drift
+
+
+def main(argv):
+    # python aggregates.py verify   -> report drift, exit 1 if any
+    # python aggregates.py rebuild  -> recompute the table from grades
+    command = argv[1] if len(argv) > 1 else "verify"
+    if command not in ("verify", "rebuild"):
+        print("Usage: python aggregates.py [verify|rebuild]")
+        return 2
+
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        if command == "rebuild":
+            rebuild(db)
+            db.commit()
+            print("Rebuilt student_score_aggregates from grades")
+
+        drift = verify(db)
+        for entry in drift:
+            print(f"Drift: student={entry['student_id']} subject={entry['subject_id']} "
+                  f"type={entry['type']!r} expected={entry['expected']} actual={entry['actual']}")
+        if drift:
+            print(f"❌ {len(drift)} bucket(s) out of sync (run 'python aggregates.py rebuild')")
+            return 1
+        print("✅ student_score_aggregates is consistent with grades")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,51 @@
+import importlib
+import os
+import time
+
+# Exam scan analyzers.
+#
+# An analyzer is a plain function analyze(path) -> dict with at least
+#   "grade"    the recognised grade (1-6)
+#   "subject"  subject name, as in the subjects table
+# and optionally "type" (grade type), "date" (ISO date) and "feedback".
+# It runs in a worker process of the job pool (see jobs.py), so it must
+# be importable by name: either a key of ANALYZERS or "package.module:function".
+# NOTENPFAD_ANALYZER picks one; the default is the mock below.
+#
+# This module is what the workers import, so it stays free of database
+# and web imports.
+
+DEFAULT_ANALYZER = os.getenv("NOTENPFAD_ANALYZER", "mock")
+# Seconds the mock pretends to work, to try the queue under load
+MOCK_DELAY = float(os.getenv("NOTENPFAD_MOCK_ANALYZER_DELAY", "0"))
+
+
+def mock(path):
+    if MOCK_DELAY > 0:
+        time.sleep(MOCK_DELAY)
+    return {
+        "grade": 5.0,
+        "subject": "Deutsch",
+        "type": "Aufsatz (Prüfung)",
+        "feedback": "Gute Arbeit bei der Textanalyse, aber achte mehr auf die Kommasetzung!"
+    }
+
+
+ANALYZERS = {"mock": mock}
+
+
+def resolve(name):
+    if name in ANALYZERS:
+        return ANALYZERS[name]
+    module, _, function = name.partition(":")
+    if not module or not function:
+        raise ValueError(f"Unknown analyzer {name!r} (expected one of {sorted(ANALYZERS)} or 'module:function')")
+    return getattr(importlib.import_module(module), function)
+
+
+def run(name, path):
+    # Entry point in the worker process
+    result = resolve(name)(path)
+    if not isinstance(result, dict):
+        raise TypeError(f"Analyzer {name!r} returned {type(result).__name__}, expected a dict")
+    return result
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# In-process load benchmark.
+#
+# 1. Seeds a scratch SQLite database (never database.db) with synthetic
+#    families: parents, students, subjects and grades with a realistic
+#    type mix. Scale is configurable; the defaults match a large school.
+# 2. Drives the ASGI app directly (no server, no sockets) with N
+#    concurrent clients per endpoint, so the numbers measure the app
+#    itself: routing, validation, SQL, serialisation.
+# 3. Reports p50/p95/p99 latency, throughput and SQL statements per
+#    request for every endpoint, and writes them to a JSON file so runs
+#    on different commits can be diffed.
+#
+#   python bench.py                                   # full scale
+#   python bench.py --parents 50 --students 150 --grades 20000 --requests 200
+#   python bench.py --db /tmp/bench.db --keep         # reuse the seeded database next time
+#
+# Login runs bcrypt at the configured cost, so it gets its own, smaller
+# request count (--login-requests).
+
+PASSWORD = "bench"
+
+SUBJECTS = [("Deutsch", 1.0), ("Mathematik", 1.0), ("Französisch", 1.0), ("NMG", 0.5)]
+
+# (type, share) for the two scored subjects; other subjects only get Vornoten
+TYPE_MIX = {
+    "Deutsch": [("Vornote", 0.35), ("Schulprüfung", 0.15), ("Aufsatz", 0.15), ("Sprachbetrachtung", 0.15),
+                ("Aufsatz (Prüfung)", 0.08), ("Sprachbetrachtung (Prüfung)", 0.08),
+                ("Aufsatz (Gymiprüfung)", 0.02), ("Sprachbetrachtung (Gymiprüfung)", 0.02)],
+    "Mathematik": [("Vornote", 0.45), ("Schulprüfung", 0.2), ("Prüfung", 0.3), ("Gymiprüfung", 0.05)],
+}
+
+SEED_BATCH = 20000
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="In-process Notenpfad benchmark")
+    parser.add_argument("--parents", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--grades", type=int, default=500000)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per endpoint")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--bulk-rows", type=int, default=200, help="rows per bulk import request")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="scratch database file (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    parser.add_argument("--output", default="bench-results.json")
+    return parser.parse_args(argv)
+
+# --- Synthetic data ---
+
+
+def seed(db, args, rng):
+    import models, aggregates, passwords, versioning
+
+    if db.query(models.Student.id).first() is not None:
+        print("Scratch database already seeded, reusing it")
+        return
+    print(f"Seeding {args.parents} parents, {args.students} students, {args.grades} grades ...")
+    started = time.perf_counter()
+
+    # One bcrypt hash shared by every account: seeding stays fast, login still pays the full cost
+    password_hash = passwords.pwd_context.hash(PASSWORD)
+    users = models.User.__table__
+    students = models.Student.__table__
+    subjects = models.Subject.__table__
+    grades = models.Grade.__table__
+
+    db.execute(subjects.insert(), [{"name": name, "weighting": weighting} for name, weighting in SUBJECTS])
+    subject_ids = dict(db.query(models.Subject.name, models.Subject.id))
+
+    db.execute(users.insert(), [
+        {"username": f"parent{i}", "password_hash": password_hash, "role": "parent"} for i in range(args.parents)
+    ])
+    parent_ids = [row.id for row in db.query(models.User.id).filter(models.User.role == "parent")
+                  .filter(models.User.username.like("parent%"))]
+    db.execute(users.insert(), [
+        {"username": f"student{i}", "password_hash": password_hash, "role": "student",
+         "parent_id": parent_ids[i % len(parent_ids)]}
+        for i in range(args.students)
+    ])
+    student_users = db.query(models.User.id, models.User.username).filter(models.User.username.like("student%")).all()
+    db.execute(students.insert(), [
+        {"name": f"Kind {username[7:]}", "target_school": "Gymnasium", "user_id": user_id}
+        for user_id, username in student_users
+    ])
+    student_ids = [row.id for row in db.query(models.Student.id)]
+
+    # Uneven histories: some students have many more grades than others
+    weights = [rng.uniform(0.2, 2.0) for _ in student_ids]
+    mixes = {name: ([t for t, _ in mix], [share for _, share in mix]) for name, mix in TYPE_MIX.items()}
+    other_subjects = [name for name, _ in SUBJECTS if name not in TYPE_MIX]
+    first_day = datetime.date(2022, 8, 15).toordinal()
+    batch = []
+    for _ in range(args.grades):
+        subject = rng.choices(["Deutsch", "Mathematik", "other"], weights=[0.4, 0.4, 0.2])[0]
+        if subject == "other":
+            subject, grade_type = rng.choice(other_subjects), "Vornote"
+        else:
+            grade_type = rng.choices(*mixes[subject])[0]
+        batch.append({
+            "value": min(6.0, max(1.0, round(rng.gauss(4.6, 0.7) * 4) / 4)),
+            "date": datetime.date.fromordinal(first_day + rng.randrange(3 * 365)),
+            "type": grade_type,
+            "student_id": rng.choices(student_ids, weights=weights)[0],
+            "subject_id": subject_ids[subject],
+        })
+        if len(batch) >= SEED_BATCH:
+            db.execute(grades.insert(), batch)
+            batch = []
+    if batch:
+        db.execute(grades.insert(), batch)
+
+    aggregates.rebuild(db)
+    db.commit()
+    versioning.ensure_epoch(db)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+# --- Minimal in-process ASGI client ---
+
+
+async def asgi_request(app, method, path, body=b"", content_type="application/json"):
+    # -> (status, response body)
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = [None]
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status[0], b"".join(chunks)
+
+
+async def lifespan(app, event):
+    # Runs the app's startup (or shutdown) handlers
+    messages = asyncio.Queue()
+    done = asyncio.get_running_loop().create_future()
+
+    async def receive():
+        return await messages.get()
+
+    async def send(message):
+        if message["type"].startswith(f"lifespan.{event}.") and not done.done():
+            done.set_result(message)
+
+    task = asyncio.ensure_future(app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+    await messages.put({"type": f"lifespan.{event}"})
+    result = await done
+    if result["type"].endswith("failed"):
+        raise RuntimeError(result.get("message"))
+    return task, messages
+
+# --- Scenarios ---
+
+
+def scenarios(args, ids, rng):
+    # name -> (request count, function returning (method, path, body, content type))
+    student_ids, parent_count = ids
+
+    def student():
+        return rng.choice(student_ids)
+
+    def bulk_body():
+        rows = ["value,subject_id,type,date"]
+        for _ in range(args.bulk_rows):
+            rows.append(f"{rng.choice([3.5, 4, 4.5, 5, 5.5])},{rng.choice([1, 2])},Vornote,2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}")
+        return "\n".join(rows).encode()
+
+    return {
+        "GET /subjects/": (args.requests, lambda: ("GET", "/subjects/", b"", "application/json")),
+        "GET /average/": (args.requests, lambda: ("GET", f"/average/?student_id={student()}", b"", "application/json")),
+        "GET /grades/": (args.requests, lambda: ("GET", f"/grades/?student_id={student()}", b"", "application/json")),
+        "GET /grades/?limit=20": (args.requests, lambda: ("GET", f"/grades/?student_id={student()}&limit=20", b"", "application/json")),
+        "GET /students/{id}/dashboard": (args.requests, lambda: ("GET", f"/students/{student()}/dashboard", b"", "application/json")),
+        "POST /prediction": (args.requests, lambda: (
+            "POST", f"/prediction?student_id={student()}",
+            json.dumps({"target_average": rng.choice([4.5, 4.75, 5.0])}).encode(), "application/json")),
+        "POST /login": (args.login_requests, lambda: (
+            "POST", "/login",
+            json.dumps({"username": f"parent{rng.randrange(parent_count)}", "password": PASSWORD}).encode(),
+            "application/json")),
+        "POST /students/{id}/grades/bulk": (max(1, args.requests // 10), lambda: (
+            "POST", f"/students/{student()}/grades/bulk", bulk_body(), "text/csv")),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_scenario(app, count, make_request, concurrency):
+    import query_budget
+
+    latencies, queries, statuses = [], [], {}
+    remaining = [count]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            method, path, body, content_type = make_request()
+            # Each client task has its own context, so the recorders don't mix
+            with query_budget.record_queries() as recorder:
+                started = time.perf_counter()
+                status, _ = await asgi_request(app, method, path, body, content_type)
+                latencies.append(time.perf_counter() - started)
+            queries.append(recorder.count)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(min(concurrency, count))))
+    elapsed = time.perf_counter() - started
+
+    ms = [value * 1000 for value in latencies]
+    return {
+        "requests": len(ms),
+        "errors": sum(n for status, n in statuses.items() if status is None or status >= 400),
+        "statuses": {str(status): n for status, n in sorted(statuses.items(), key=str)},
+        "throughput_rps": round(len(ms) / elapsed, 1),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(statistics.mean(ms), 2),
+        "queries_per_request": round(statistics.mean(queries), 2),
+        "max_queries": max(queries),
+    }
+
+
+async def run_benchmark(args, rng):
+    import main, database, models
+
+    db = database.SessionLocal()
+    try:
+        seed(db, args, rng)
+        student_ids = [row.id for row in db.query(models.Student.id)]
+        parent_count = db.query(models.User.id).filter(models.User.username.like("parent%")).count()
+    finally:
+        db.close()
+
+    lifespan_task, lifespan_messages = await lifespan(main.app, "startup")
+    results = {}
+    try:
+        for name, (count, make_request) in scenarios(args, (student_ids, parent_count), rng).items():
+            if count <= 0:
+                continue
+            result = await run_scenario(main.app, count, make_request, args.concurrency)
+            results[name] = result
+            print(f"{name:<34} {result['requests']:>6} req  {result['throughput_rps']:>8} req/s  "
+                  f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                  f"{result['queries_per_request']:>5} q/req  {result['errors']} errors")
+    finally:
+        await lifespan_messages.put({"type": "lifespan.shutdown"})
+        await lifespan_task
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(tempfile.gettempdir(), f"notenpfad-bench-{os.getpid()}.db")
+    db_path = os.path.abspath(db_path)
+    if os.path.abspath(db_path) == os.path.abspath(os.path.join(os.path.dirname(__file__), "database.db")):
+        print("Refusing to benchmark against database.db; pass a scratch file with --db")
+        return 2
+    # Must be set before database.py is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    rng = random.Random(args.seed)
+    try:
+        results = asyncio.run(run_benchmark(args, rng))
+    finally:
+        if not args.keep:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": {"parents": args.parents, "students": args.students, "grades": args.grades},
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
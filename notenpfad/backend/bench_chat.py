@@ -0,0 +1,104 @@
+import argparse
+import random
+import time
+
+import chat
+
+# Micro-benchmark for the /chat intent matcher (no server, no database).
+#
+# 1. Match latency of the real catalogue (chat_intents.json) over a set
+#    of typical messages.
+# 2. Scaling: synthetic catalogues of growing size, matched with the
+#    Aho-Corasick automaton and with the old approach (one `in` scan of
+#    the message per pattern, intent by intent). The automaton should
+#    stay flat while the scan grows with the catalogue.
+#
+#   python bench_chat.py
+#   python bench_chat.py --sizes 10 100 1000 10000 --rounds 2000
+
+MESSAGES = [
+    "Hallo!",
+    "Wie ist mein Schnitt?",
+    "Ich habe Angst vor der Gymiprüfung nächste Woche",
+    "Kannst du mir bei Brüchen helfen? Ich verstehe das Kürzen nicht.",
+    "Reicht es für das Gymi, wenn ich im Aufsatz eine 5 schreibe?",
+    "Was ist mein schwächstes Fach?",
+    "Ich habe heute überhaupt keine Lust zu lernen",
+    "Wie viele Noten habe ich schon eingetragen?",
+    "Das Wetter ist heute schön und wir gehen nachher in die Badi",
+    "Tschüss, bis morgen!",
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sta", "bel", "tor", "wen", "dri", "po", "gu", "fex", "zan", "qui"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_per_message(match, messages, rounds):
+    # -> list of microseconds per call
+    samples = []
+    for _ in range(rounds):
+        for message in messages:
+            start = time.perf_counter()
+            match(message)
+            samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def synthetic_catalogue(size, rng, patterns_per_intent=5):
+    intents = []
+    for index in range(size):
+        patterns = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))) for _ in range(patterns_per_intent)]
+        intents.append({"name": f"intent{index}", "patterns": patterns, "responses": ["ok"]})
+    return {"fallback": ["?"], "intents": intents}
+
+
+def naive_matcher(spec):
+    # What the old if/elif chain does: normalise, then scan per pattern
+    intents = [[chat.normalize(p).strip() for p in intent["patterns"]] for intent in spec["intents"]]
+
+    def match(message):
+        text = chat.normalize(message)
+        for index, patterns in enumerate(intents):
+            for pattern in patterns:
+                if pattern in text:
+                    return index
+        return None
+
+    return match
+
+
+def run(args):
+    rng = random.Random(args.seed)
+
+    print(f"Real catalogue: {len(chat.CATALOGUE.intents)} intents, {len(chat.CATALOGUE.automaton.goto)} automaton states")
+    samples = time_per_message(chat.CATALOGUE.match, MESSAGES, args.rounds)
+    print(f"  match: p50 {percentile(samples, 50):.1f} us, p99 {percentile(samples, 99):.1f} us")
+
+    print()
+    print(f"{'intents':>8} {'patterns':>9} {'compile ms':>11} {'automaton p50 us':>17} {'scan p50 us':>12}")
+    for size in args.sizes:
+        spec = synthetic_catalogue(size, rng)
+        start = time.perf_counter()
+        catalogue = chat.Catalogue(spec)
+        compile_ms = (time.perf_counter() - start) * 1000
+        # Messages that hit nothing, plus one that hits the last intent: worst case for the scan
+        messages = MESSAGES + [f"Das ist {spec['intents'][-1]['patterns'][0]} oder?"]
+        rounds = max(1, args.rounds // 10)
+        automaton = time_per_message(catalogue.match, messages, rounds)
+        scan = time_per_message(naive_matcher(spec), messages, rounds) if size <= args.max_scan else None
+        print(f"{size:>8} {size * 5:>9} {compile_ms:>11.1f} {percentile(automaton, 50):>17.1f} "
+              f"{(f'{percentile(scan, 50):.1f}' if scan else '-'):>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chat intent matcher")
+    parser.add_argument("--rounds", type=int, default=1000, help="passes over the message set")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--max-scan", type=int, default=10000, help="largest catalogue to also time with the naive scan")
+    parser.add_argument("--seed", type=int, default=7)
+    run(parser.parse_args())
@@ -0,0 +1,134 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Login storm benchmark against a running server (default :8000).
+#
+# 1. Measures GET /grades/ latency on an idle server.
+# 2. Hammers POST /login from many threads (bcrypt on every call) and
+#    measures GET /grades/ latency again while the storm is running.
+#
+# With hashing in the passwords process pool the read latency should
+# stay close to the idle numbers; logins beyond the pool's capacity get
+# 503 + Retry-After instead of queueing in the request threadpool.
+#
+#   python -m uvicorn main:app --port 8000
+#   python bench_login.py --storm-threads 64 --duration 10
+
+BASE_URL = "http://localhost:8000"
+
+
+def call(endpoint, method="GET", data=None):
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    req = urllib.request.Request(f"{BASE_URL}{endpoint}", data=body, method=method)
+    req.add_header("Content-Type", "application/json")
+    start = time.perf_counter()
+    retry_after = None
+    try:
+        with urllib.request.urlopen(req) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+        retry_after = e.headers.get("Retry-After")
+    return status, time.perf_counter() - start, retry_after
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    ms = [v * 1000 for v in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+        "max_ms": round(max(ms), 2) if ms else None,
+        "mean_ms": round(statistics.mean(ms), 2) if ms else None,
+    }
+
+
+def measure_reads(student_id, stop_event=None, count=None, pause=0.02):
+    latencies = []
+    while (stop_event is None or not stop_event.is_set()) and (count is None or len(latencies) < count):
+        status, elapsed, _ = call(f"/grades/?student_id={student_id}")
+        if status == 200:
+            latencies.append(elapsed)
+        time.sleep(pause)
+    return latencies
+
+
+def login_worker(username, password, stop_event, results, lock):
+    while not stop_event.is_set():
+        status, elapsed, retry_after = call("/login", "POST", {"username": username, "password": password})
+        with lock:
+            results.setdefault(status, []).append(elapsed)
+        if status == 503:
+            # Behave like a polite client and honour Retry-After
+            stop_event.wait(float(retry_after or 1))
+
+
+def run_benchmark(args):
+    print("--- Login Storm Benchmark ---")
+    status, _, _ = call("/status")
+    if status != 200:
+        print(f"Server at {BASE_URL} not reachable")
+        return
+
+    baseline = measure_reads(args.student_id, count=args.read_samples)
+    print("Idle /grades/:", summarize(baseline))
+
+    stop_event = threading.Event()
+    results, lock = {}, threading.Lock()
+    workers = [
+        threading.Thread(target=login_worker, args=(args.username, args.password, stop_event, results, lock))
+        for _ in range(args.storm_threads)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(1)  # let the storm build up
+
+    storm_reads = []
+    reader = threading.Thread(target=lambda: storm_reads.extend(measure_reads(args.student_id, stop_event)))
+    reader.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    for worker in workers + [reader]:
+        worker.join()
+
+    elapsed = args.duration + 1
+    ok = len(results.get(200, []))
+    rejected = len(results.get(503, []))
+    print(f"Logins: {ok} ok ({ok / elapsed:.1f}/s), {rejected} rejected with 503, "
+          f"other statuses: { {k: len(v) for k, v in results.items() if k not in (200, 503)} }")
+    print("Login latency (200):", summarize(results.get(200, [])))
+    print("/grades/ during storm:", summarize(storm_reads))
+
+    idle_p95 = percentile(baseline, 95)
+    storm_p95 = percentile(storm_reads, 95)
+    if idle_p95 and storm_p95:
+        print(f"p95 read latency ratio storm/idle: {storm_p95 / idle_p95:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login storm benchmark")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--student-id", type=int, default=1)
+    parser.add_argument("--storm-threads", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--read-samples", type=int, default=100)
+    args = parser.parse_args()
+    BASE_URL = args.base_url
+    run_benchmark(args)
@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import database
+import metrics
+import versioning
+
+# In-process read-through caches (LRU with an optional TTL).
+#
+# Write endpoints invalidate what they changed right after their commit,
+# so within one process a cache never answers with data older than the
+# last write. A load that was already running when the invalidation
+# happened is not stored (each cache counts invalidations and a load only
+# keeps its result if the count did not move meanwhile).
+#
+# Caches are shared by the threadpool that runs the sync endpoints: every
+# cache has its own lock, held only around dictionary operations, never
+# while the loader queries the database. Two threads missing on the same
+# key may both load it; the second result simply replaces the first.
+#
+# Other worker processes do not see the invalidation. Two ways out:
+#   - key by data versions: endpoints that read the versions anyway (for
+#     their ETag) put them into the cache key, so a write anywhere makes
+#     the old entry unreachable and the ETag never runs ahead of the body
+#   - depends_on: the data version keys a cache follows. With
+#     NOTENPFAD_CACHE_POLL_SECONDS set, a background thread reads those
+#     rows of data_versions (one query for all caches) and clears every
+#     cache whose keys moved. Without it, entries live at most TTL seconds.
+#
+# Settings (environment):
+#   NOTENPFAD_CACHE_TTL            seconds an entry is trusted (default 60, 0 = no limit)
+#   NOTENPFAD_CACHE_POLL_SECONDS   seconds between version checks across workers (default 0 = off)
+
+DEFAULT_TTL = float(os.getenv("NOTENPFAD_CACHE_TTL", "60")) or None
+POLL_SECONDS = float(os.getenv("NOTENPFAD_CACHE_POLL_SECONDS", "0"))
+
+logger = logging.getLogger("notenpfad.cache")
+
+_registry = []
+_registry_lock = threading.Lock()
+
+lookups = metrics.Counter(
+    "notenpfad_cache_lookups_total", "Cache lookups, by cache and hit/miss", ("cache", "result"))
+evictions = metrics.Counter(
+    "notenpfad_cache_evictions_total", "Cache entries dropped, by cache and reason (size, expired, invalidated)",
+    ("cache", "reason"))
+entries_gauge = metrics.Gauge(
+    "notenpfad_cache_entries", "Entries held per cache", ("cache",),
+    lambda: {(c.name,): len(c) for c in _registry})
+
+
+class Cache:
+    def __init__(self, name, maxsize=256, ttl=DEFAULT_TTL, depends_on=()):
+        # ttl None = entries never expire (for keys that carry data versions)
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.depends_on = tuple(depends_on)
+        self._entries = OrderedDict()  # key -> (value, expires or None)
+        self._lock = threading.Lock()
+        self._generation = 0
+        with _registry_lock:
+            _registry.append(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+                expired = True
+            else:
+                expired = False
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if expired:
+            evictions.inc(self.name, "expired")
+        lookups.inc(self.name, "hit" if entry is not None else "miss")
+        return entry[0] if entry is not None else default
+
+    def put(self, key, value, generation=None):
+        # generation: from generation() before the value was loaded; the
+        # value is dropped if an invalidation happened since
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            dropped = 0
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                dropped += 1
+        if dropped:
+            evictions.inc(self.name, "size", amount=dropped)
+
+    def generation(self):
+        return self._generation
+
+    def get_or_load(self, key, load):
+        # load() -> value; None is returned but not stored (e.g. "not found",
+        # so a row created meanwhile is seen at once)
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self._generation
+        value = load()
+        if value is not None:
+            self.put(key, value, generation)
+        return value
+
+    def invalidate(self, *keys):
+        # Drop the given keys, or everything without arguments
+        with self._lock:
+            self._generation += 1
+            if keys:
+                dropped = sum(self._entries.pop(key, None) is not None for key in keys)
+            else:
+                dropped = len(self._entries)
+                self._entries.clear()
+        if dropped:
+            evictions.inc(self.name, "invalidated", amount=dropped)
+
+# --- Cross-process invalidation ---
+
+_thread = None
+_stop = threading.Event()
+
+
+def _watched_keys():
+    with _registry_lock:
+        return sorted({key for c in _registry for key in c.depends_on})
+
+
+def check_versions(db, seen):
+    # One read of the watched data versions; clears the caches whose keys
+    # changed since the previous call (all of them when there is no previous
+    # call to compare with). seen: {key: version}, updated in place.
+    keys = _watched_keys()
+    if not keys:
+        return
+    current = dict(zip((versioning.EPOCH,) + tuple(keys), versioning.read(db, *keys)))
+    changed = {key for key, version in current.items() if seen.get(key) != version}
+    with _registry_lock:
+        caches = list(_registry)
+    for c in caches:
+        if c.depends_on and (versioning.EPOCH in changed or changed.intersection(c.depends_on)):
+            c.invalidate()
+    seen.clear()
+    seen.update(current)
+
+
+def _poll_loop():
+    seen = {}
+    while True:
+        db = database.SessionLocal()
+        try:
+            check_versions(db, seen)
+        except Exception:
+            # e.g. the database stayed locked past the busy timeout; compare
+            # against a fresh start next round
+            seen.clear()
+            logger.exception("Checking the cache versions failed")
+        finally:
+            db.close()
+        if _stop.wait(POLL_SECONDS):
+            return
+
+
+def start():
+    global _thread
+    if _thread is not None or POLL_SECONDS <= 0:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_poll_loop, name="notenpfad-cache-versions", daemon=True)
+    _thread.start()
+
+
+def shutdown():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
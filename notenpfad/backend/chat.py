@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import string
+import unicodedata
+from collections import deque
+
+import cache
+import models
+import scoring
+import versioning
+
+# Intent matching for the Lern-Coach chat.
+#
+# The intents live in chat_intents.json. Each one has substring
+# "patterns", optional whole-word "words" and answer templates. All
+# patterns of all intents are compiled into one Aho-Corasick automaton
+# when this module is imported, so a message is matched in a single pass
+# over its characters however many intents the catalogue holds. When
+# several intents match, the one listed first in the file wins.
+#
+# Messages and patterns go through the same normalisation: case folding,
+# ä/ö/ü -> ae/oe/ue, ß -> ss, other accents dropped, punctuation turned
+# into spaces. "Prüfung", "PRUEFUNG" and "prüfung?" are all the same.
+#
+# Templates can use the student's data: {name}, {average}, {gap},
+# {margin}, {threshold}, {grade_count}, {weakest_subject},
+# {weakest_average}, {strongest_subject}, {strongest_average} and
+# {subjects[Mathematik]}. The first template whose fields are all known
+# is used, so the last one of an intent should need none. The context is
+# read from the score aggregates and cached per student data version.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_intents.json")
+CONTEXT_CACHE_SIZE = 256
+
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue"})
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text):
+    # -> " word word ... " (padded, so whole words can be matched as " word ")
+    text = unicodedata.normalize("NFC", text).casefold().translate(_UMLAUTS)
+    text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return " " + " ".join(_WORD.findall(text)) + " "
+
+
+class Automaton:
+    # Aho-Corasick over (pattern, value) pairs; match() returns the
+    # smallest value of any pattern occurring in the text, or None
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]
+        for text, value in patterns:
+            state = 0
+            for ch in text:
+                following = self.goto[state].get(ch)
+                if following is None:
+                    following = len(self.goto)
+                    self.goto[state][ch] = following
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                state = following
+            if self.best[state] is None or value < self.best[state]:
+                self.best[state] = value
+
+        # Failure links breadth-first; each state also inherits the best
+        # value of its failure state (patterns ending inside this one)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(ch, 0)
+                inherited = self.best[self.fail[following]]
+                if inherited is not None and (self.best[following] is None or inherited < self.best[following]):
+                    self.best[following] = inherited
+
+    def match(self, text):
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            value = best[state]
+            if value is not None and (found is None or value < found):
+                found = value
+        return found
+
+
+def _fields(template):
+    # Top-level field names a template uses ("subjects" for {subjects[X]})
+    return {re.split(r"[.\[]", field, 1)[0] for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+class Catalogue:
+    def __init__(self, spec):
+        self.intents = []
+        patterns = []
+        for index, intent in enumerate(spec["intents"]):
+            responses = intent["responses"]
+            if not responses:
+                raise ValueError(f"intent {intent['name']!r} has no responses")
+            for template in responses:
+                _fields(template)  # raises ValueError on a malformed template
+            self.intents.append((intent["name"], responses, any(_fields(t) for t in responses)))
+            for pattern in intent.get("patterns", []):
+                patterns.append((normalize(pattern).strip(), index))
+            for word in intent.get("words", []):
+                patterns.append((normalize(word), index))
+        self.fallback = spec["fallback"]
+        self.automaton = Automaton([(text, index) for text, index in patterns if text.strip()])
+
+    def match(self, message):
+        # -> index of the best matching intent, or None
+        return self.automaton.match(normalize(message))
+
+    def needs_context(self, index):
+        return index is not None and self.intents[index][2]
+
+    def respond(self, index, context):
+        name, responses = (None, self.fallback) if index is None else self.intents[index][:2]
+        for template in responses:
+            try:
+                return name, template.format_map(context)
+            except (KeyError, IndexError):
+                continue
+        return name, responses[-1]
+
+
+def load(path=None):
+    with open(path or DEFAULT_PATH, encoding="utf-8") as f:
+        return Catalogue(json.load(f))
+
+
+CATALOGUE = load()
+
+# --- Student context ---
+
+_contexts = cache.Cache("chat_context", maxsize=CONTEXT_CACHE_SIZE, ttl=None)
+
+
+def _format(value):
+    return f"{value:.2f}"
+
+
+def build_context(name, buckets, rules=None):
+    rules = rules or scoring.RULES
+    context = {"name": name, "threshold": _format(rules.pass_threshold)}
+    subjects = {}
+    for (subject, _), (total, count) in buckets.items():
+        subject_total, subject_count = subjects.get(subject, (0.0, 0))
+        subjects[subject] = (subject_total + total, subject_count + count)
+    averages = {subject: total / count for subject, (total, count) in subjects.items() if count}
+    if averages:
+        weakest = min(averages, key=averages.get)
+        strongest = max(averages, key=averages.get)
+        context.update({
+            "subjects": {subject: _format(value) for subject, value in averages.items()},
+            "grade_count": sum(count for _, count in subjects.values()),
+            "weakest_subject": weakest,
+            "weakest_average": _format(averages[weakest]),
+            "strongest_subject": strongest,
+            "strongest_average": _format(averages[strongest]),
+        })
+    score = rules.value(buckets)
+    if score is not None:
+        context["average"] = _format(score)
+        if score < rules.pass_threshold:
+            context["gap"] = _format(rules.pass_threshold - score)
+        else:
+            context["margin"] = _format(score - rules.pass_threshold)
+    return context
+
+
+def student_context(db, student_id):
+    # {} for an unknown student; cached until the student's data changes
+    versions = tuple(versioning.read(db, *versioning.student_keys(student_id)))
+
+    def load():
+        student = db.query(models.Student.name).filter(models.Student.id == student_id).first()
+        return build_context(student.name, scoring.load_buckets(db, student_id)) if student else {}
+    return _contexts.get_or_load((student_id, versions), load)
+
+
+def answer(db, message, student_id=None, catalogue=None):
+    # -> {"response": text, "intent": name or None}
+    catalogue = catalogue or CATALOGUE
+    index = catalogue.match(message)
+    context = {}
+    if student_id is not None and catalogue.needs_context(index):
+        context = student_context(db, student_id)
+    intent, response = catalogue.respond(index, context)
+    return {"response": response, "intent": intent}
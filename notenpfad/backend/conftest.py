@@ -0,0 +1,13 @@
+import pytest
+
+import query_budget
+
+# pytest fixtures for tests in this directory. Kept out of the modules
+# themselves, so the server never needs pytest.
+
+
+@pytest.fixture
+def query_budget_guard():
+    # def test_x(query_budget_guard):
+    #     with query_budget_guard(3): client.get(...)
+    return query_budget.assert_max_queries
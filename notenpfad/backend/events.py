@@ -0,0 +1,243 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# In-process pub/sub behind GET /events (server-sent events).
+#
+# Write endpoints call publish(topic, event, data) once their commit has
+# gone through. Topics are the data version keys of versioning.py
+# ("student:<id>", "subjects", "topics") plus "user:<id>" for account
+# changes. GET /events subscribes a user to what they can see: a parent
+# to their children, a student to their own profile, everyone to the
+# subjects and topics.
+#
+#   - publish() is called from the threadpool (the sync endpoints) or the
+#     job dispatcher. The message is serialised once and handed to each
+#     event loop with a single call_soon_threadsafe, not one per
+#     subscriber.
+#   - every subscriber has a bounded queue. A subscriber whose queue is
+#     full, or whose oldest message has waited longer than STALL_SECONDS,
+#     is a slow consumer (its connection is not draining): it is dropped,
+#     its queue freed, and its stream ends with an "evicted" event once it
+#     can write again. EventSource reconnects by itself.
+#   - one heartbeat timer per event loop, not per connection, wakes idle
+#     streams every HEARTBEAT_SECONDS to send a comment line, so proxies
+#     keep the connection open and dead clients are noticed.
+#   - beyond MAX_SUBSCRIBERS, GET /events answers 503.
+#
+# Each stream starts with a "ready" event; clients refetch on it, since
+# whatever happened while they were disconnected is not replayed.
+# Subscribers only hear about writes handled by their own process: with
+# several uvicorn workers, run one worker for the event stream.
+#
+# Settings (environment):
+#   NOTENPFAD_EVENTS_QUEUE_SIZE        messages buffered per subscriber (default 64)
+#   NOTENPFAD_EVENTS_HEARTBEAT         seconds between keep-alives (default 15)
+#   NOTENPFAD_EVENTS_MAX_SUBSCRIBERS   open streams per process (default 10000)
+
+QUEUE_SIZE = int(os.getenv("NOTENPFAD_EVENTS_QUEUE_SIZE", "64"))
+HEARTBEAT_SECONDS = float(os.getenv("NOTENPFAD_EVENTS_HEARTBEAT", "15"))
+MAX_SUBSCRIBERS = int(os.getenv("NOTENPFAD_EVENTS_MAX_SUBSCRIBERS", "10000"))
+STALL_SECONDS = 2 * HEARTBEAT_SECONDS
+RETRY_MS = 3000
+RETRY_AFTER = 5
+
+
+def user_topic(user_id):
+    return f"user:{user_id}"
+
+
+class Subscriber:
+    __slots__ = ("user_id", "topics", "loop", "queue", "pending_since", "wake", "evicted")
+
+    def __init__(self, user_id, topics, loop):
+        self.user_id = user_id
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = deque()
+        self.pending_since = None
+        self.wake = asyncio.Event()
+        self.evicted = False
+
+
+_lock = threading.Lock()
+_topics = {}   # topic -> set of subscribers
+_loops = {}    # event loop -> set of its subscribers
+_count = 0
+_ids = itertools.count(1)
+
+subscribers_gauge = metrics.Gauge(
+    "notenpfad_events_subscribers", "Open GET /events streams", (), lambda: {(): _count})
+published = metrics.Counter(
+    "notenpfad_events_published_total", "Events published, by event type", ("event",))
+delivered = metrics.Counter(
+    "notenpfad_events_delivered_total", "Event messages queued for a subscriber")
+evicted = metrics.Counter(
+    "notenpfad_events_evicted_total", "Subscribers dropped as slow consumers", ("reason",))
+
+
+def _message(event, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def full():
+    return _count >= MAX_SUBSCRIBERS
+
+
+def subscriber_count():
+    return _count
+
+# --- Publishing (any thread) ---
+
+
+def publish(topic, event, data):
+    with _lock:
+        subscribers = list(_topics.get(topic, ()))
+    published.inc(event)
+    if not subscribers:
+        return
+    message = _message(event, data, next(_ids))
+    by_loop = {}
+    for subscriber in subscribers:
+        by_loop.setdefault(subscriber.loop, []).append(subscriber)
+    for loop, group in by_loop.items():
+        try:
+            loop.call_soon_threadsafe(_deliver, group, message)
+        except RuntimeError:
+            pass  # loop already closed; its streams are gone
+
+
+def follow(topic, new_topic):
+    # Everyone subscribed to topic also gets new_topic (a parent's new child)
+    with _lock:
+        subscribers = _topics.get(topic, ())
+        if subscribers:
+            _topics.setdefault(new_topic, set()).update(subscribers)
+            for subscriber in subscribers:
+                subscriber.topics.add(new_topic)
+
+
+def drop_topic(topic):
+    # Nobody hears about topic any more (a deleted student, whose id SQLite may reuse)
+    with _lock:
+        for subscriber in _topics.pop(topic, ()):
+            subscriber.topics.discard(topic)
+
+# --- Delivery (event loop) ---
+
+
+def _deliver(subscribers, message):
+    count = 0
+    for subscriber in subscribers:
+        if subscriber.evicted:
+            continue
+        if len(subscriber.queue) >= QUEUE_SIZE:
+            _evict(subscriber, "queue_full")
+            continue
+        if not subscriber.queue:
+            subscriber.pending_since = time.monotonic()
+        subscriber.queue.append(message)
+        subscriber.wake.set()
+        count += 1
+    delivered.inc(amount=count)
+
+
+def _evict(subscriber, reason):
+    _remove(subscriber)
+    subscriber.evicted = True
+    subscriber.queue.clear()
+    subscriber.wake.set()
+    evicted.inc(reason)
+
+
+def _heartbeat(loop):
+    with _lock:
+        subscribers = list(_loops.get(loop, ()))
+        if not subscribers:
+            # The next subscriber on this loop starts a new timer
+            _loops.pop(loop, None)
+            return
+    now = time.monotonic()
+    for subscriber in subscribers:
+        if subscriber.queue and now - subscriber.pending_since > STALL_SECONDS:
+            _evict(subscriber, "stalled")
+        else:
+            # Empty queue on wake-up = send a keep-alive
+            subscriber.wake.set()
+    loop.call_later(HEARTBEAT_SECONDS, _heartbeat, loop)
+
+
+def _add(subscriber):
+    global _count
+    with _lock:
+        for topic in subscriber.topics:
+            _topics.setdefault(topic, set()).add(subscriber)
+        first = subscriber.loop not in _loops
+        _loops.setdefault(subscriber.loop, set()).add(subscriber)
+        _count += 1
+    if first:
+        subscriber.loop.call_later(HEARTBEAT_SECONDS, _heartbeat, subscriber.loop)
+
+
+def _remove(subscriber):
+    global _count
+    with _lock:
+        if subscriber.evicted:
+            return
+        for topic in subscriber.topics:
+            subscribers = _topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del _topics[topic]
+        loop_subscribers = _loops.get(subscriber.loop)
+        if loop_subscribers is not None:
+            loop_subscribers.discard(subscriber)
+        _count -= 1
+
+
+async def stream(user_id, topics):
+    # The body of a GET /events response
+    subscriber = Subscriber(user_id, topics, asyncio.get_running_loop())
+    _add(subscriber)
+    try:
+        yield f"retry: {RETRY_MS}\n" + _message("ready", {"user_id": user_id, "topics": sorted(subscriber.topics)})
+        while True:
+            await subscriber.wake.wait()
+            subscriber.wake.clear()
+            if subscriber.evicted:
+                yield _message("evicted", {"reason": "slow consumer"})
+                return
+            if subscriber.queue:
+                messages = "".join(subscriber.queue)
+                subscriber.queue.clear()
+                yield messages
+            else:
+                yield ": keep-alive\n\n"
+    finally:
+        _remove(subscriber)
+        subscriber.evicted = True
+
+# --- Payloads ---
+
+
+def grade_data(grade):
+    return {
+        "id": grade.id,
+        "student_id": grade.student_id,
+        "subject_id": grade.subject_id,
+        "value": grade.value,
+        "type": grade.type,
+        "date": grade.date.isoformat() if grade.date else None,
+    }
+
+
+def topic_data(topic):
+    return {"id": topic.id, "subject_id": topic.subject_id, "name": topic.name, "is_completed": bool(topic.is_completed)}
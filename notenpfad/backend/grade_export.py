@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+import models, database
+
+# Streaming grade export (CSV or NDJSON).
+#
+# Rows are fetched with yield_per, so the driver hands them over in
+# blocks of FETCH_ROWS instead of materialising the whole result. Each
+# block is written out as one chunk of the response. The CSV header goes
+# out before the query runs, so the client gets its first byte right
+# away. The columns match what the bulk import reads, so an export can
+# be imported again.
+
+FETCH_ROWS = 1000
+
+COLUMNS = ["id", "student_id", "subject_id", "type", "value", "date"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _csv_chunk(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(rows):
+    return "".join(
+        json.dumps({
+            "id": row.id,
+            "student_id": row.student_id,
+            "subject_id": row.subject_id,
+            "type": row.type,
+            "value": row.value,
+            "date": row.date.isoformat() if row.date else None,
+        }, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def iter_export(condition, fmt):
+    if fmt == "csv":
+        yield _csv_chunk([], header=True)
+
+    # Own session: the request's get_db session is gone once the body streams
+    db = database.SessionLocal()
+    try:
+        statement = (
+            select(*(getattr(models.Grade, name) for name in COLUMNS))
+            .where(condition)
+            .order_by(models.Grade.student_id, models.Grade.date, models.Grade.id)
+            .execution_options(yield_per=FETCH_ROWS)
+        )
+        for rows in db.execute(statement).partitions():
+            yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
+    finally:
+        db.close()
+
+
+def export_response(condition, fmt, filename):
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(
+        iter_export(condition, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
@@ -0,0 +1,195 @@
+import codecs
+import csv
+import json
+
+from pydantic import ValidationError
+import models, aggregates, query_budget, sync, versioning
+
+# Streaming bulk import of grades (CSV or NDJSON).
+#
+# The request body is decoded and split into lines as it arrives, and
+# handed on in batches of BATCH_ROWS records. Each batch is validated,
+# written with one executemany INSERT and committed together with its
+# score aggregate deltas and data version bumps. The SQLite write lock is
+# only held while a batch is written, not while a slow client uploads,
+# so other writers get their turn between batches. An import is not
+# all-or-nothing: if the upload breaks off, the batches committed so far
+# stay (and the next page of the history shows them).
+# Memory stays flat: only the current batch and a capped list of row
+# errors are held.
+#
+# CSV needs a header row: value,subject_id,type,date (plus student_id for
+# the family-wide import). Quoted fields must not contain line breaks.
+
+BATCH_ROWS = 2000
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(content_type, requested=None):
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+async def iter_lines(stream):
+    # Bytes chunks in, text lines out (handles UTF-8 split across chunks and a BOM)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_batches(stream, fmt, batch_rows=BATCH_ROWS):
+    # Yields lists of (line_number, record). record is a dict, or an error
+    # message when the line itself could not be parsed.
+    header = None
+    batch = []
+    line_no = 0
+    async for line in iter_lines(stream):
+        line_no += 1
+        if not line.strip():
+            continue
+
+        if fmt == "csv":
+            if header is None:
+                header = [name.strip() for name in next(csv.reader([line]))]
+                continue
+            batch.append((line_no, line))
+        else:
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    record = "Expected a JSON object"
+            except ValueError as e:
+                record = f"Invalid JSON: {e}"
+            batch.append((line_no, record))
+
+        if len(batch) >= batch_rows:
+            yield _parse_csv(header, batch) if fmt == "csv" else batch
+            batch = []
+
+    if batch:
+        yield _parse_csv(header, batch) if fmt == "csv" else batch
+
+
+def _parse_csv(header, lines):
+    # One csv.reader pass over the whole batch instead of one per line
+    rows = csv.reader(line for _, line in lines)
+    parsed = []
+    for (line_no, _), values in zip(lines, rows):
+        if len(values) != len(header):
+            parsed.append((line_no, f"Expected {len(header)} columns, got {len(values)}"))
+            continue
+        # Empty cells fall back to the schema defaults
+        parsed.append((line_no, {name: value for name, value in zip(header, values) if value != ""}))
+    return parsed
+
+
+class GradeImporter:
+    # Validates, inserts and commits one batch at a time
+
+    def __init__(self, db, schema, student_ids, default_student_id=None):
+        self.db = db
+        self.schema = schema
+        self.student_ids = set(student_ids)
+        self.default_student_id = default_student_id
+        self.weightings = {
+            subject_id: weighting if weighting is not None else 0.0
+            for subject_id, weighting in db.query(models.Subject.id, models.Subject.weighting)
+        }
+        # (student_id, subject_id, type) -> [sum, count], committed batches only
+        self.buckets = {}
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def _error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add_batch(self, batch):
+        rows = []
+        buckets = {}
+        for line_no, record in batch:
+            if isinstance(record, str):
+                self._error(line_no, record)
+                continue
+            try:
+                grade = self.schema(**record)
+            except ValidationError as e:
+                first = e.errors()[0]
+                field = ".".join(str(part) for part in first["loc"])
+                self._error(line_no, f"{field}: {first['msg']}")
+                continue
+            except TypeError:
+                self._error(line_no, "Invalid record")
+                continue
+
+            student_id = getattr(grade, "student_id", None) or self.default_student_id
+            if student_id not in self.student_ids:
+                self._error(line_no, f"Student {student_id} not found")
+                continue
+            if grade.subject_id not in self.weightings:
+                self._error(line_no, f"Subject {grade.subject_id} not found")
+                continue
+
+            rows.append({
+                "value": grade.value,
+                "date": grade.date,
+                "type": grade.type,
+                "student_id": student_id,
+                "subject_id": grade.subject_id,
+            })
+            bucket = buckets.setdefault((student_id, grade.subject_id, grade.type), [0.0, 0])
+            bucket[0] += grade.value
+            bucket[1] += 1
+
+        if not rows:
+            return
+        with query_budget.per_batch():
+            # Core table insert, no ORM bulk-persistence layer; RETURNING
+            # hands back the new ids for the sync change log
+            table = models.Grade.__table__
+            inserted = self.db.execute(table.insert().returning(table.c.id, table.c.student_id), rows).all()
+            sync.record_grades(self.db, inserted)
+            # The batch's buckets in one batched aggregate update, same transaction
+            aggregates.add_deltas(self.db, [
+                (student_id, subject_id, g_type, total, count, self.weightings[subject_id])
+                for (student_id, subject_id, g_type), (total, count) in buckets.items()
+            ])
+            versioning.bump(self.db, *(versioning.student_key(student_id) for student_id, _, _ in buckets))
+            self.db.commit()
+
+        self.inserted += len(rows)
+        for key, (total, count) in buckets.items():
+            bucket = self.buckets.setdefault(key, [0.0, 0])
+            bucket[0] += total
+            bucket[1] += count
+
+    def imported_per_student(self):
+        # student_id -> grades inserted
+        counts = {}
+        for (student_id, _, _), (_, count) in self.buckets.items():
+            counts[student_id] = counts.get(student_id, 0) + count
+        return counts
+
+    def report(self):
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+import models, database, aggregates, analyzers, events, sync, versioning
+
+# Background queue for exam scan analysis.
+#
+# POST /analyze-exam streams the scan to UPLOAD_DIR and inserts an
+# AnalysisJob row (status "queued"). The database is the queue, so jobs
+# survive a restart and several uvicorn workers can share it:
+#
+#   - a dispatcher thread per process claims the oldest queued job with
+#     a conditional UPDATE (only one process wins it) whenever one of
+#     its JOB_WORKERS slots is free, and hands it to a process pool
+#   - the analyzer (analyzers.py) runs in that pool, off the request
+#     threads and the event loop; the result is written back by the
+#     pool's callback, optionally together with the recognised Grade
+#   - on startup, "running" jobs whose process is gone (crash, restart)
+#     go back to "queued"; after MAX_ATTEMPTS they are failed instead
+#   - a scan is deleted once its job is done or failed (a requeued job
+#     still needs it); on startup, files in UPLOAD_DIR older than
+#     SWEEP_AFTER_SECONDS that no queued or running job refers to are
+#     deleted too (jobs deleted with their student, crashed uploads)
+#   - at most MAX_QUEUED jobs may wait, beyond that uploads get a 503
+#
+# GET /jobs/{id} returns the state; GET /jobs/{id}/events streams it as
+# server-sent events. Waiters in the process that ran the job are woken
+# right away, others notice on their next poll (POLL_SECONDS).
+#
+# Settings (environment):
+#   NOTENPFAD_UPLOAD_DIR         where scans are stored (default ./uploads)
+#   NOTENPFAD_UPLOAD_MAX_BYTES   largest accepted scan (default 20 MiB)
+#   NOTENPFAD_JOB_WORKERS        analyzer processes (default 1); 0 runs
+#                                jobs in a background thread instead
+#   NOTENPFAD_JOB_MAX_QUEUED     queued jobs accepted (default 100)
+#   NOTENPFAD_ANALYZER           see analyzers.py
+
+UPLOAD_DIR = os.path.abspath(os.getenv("NOTENPFAD_UPLOAD_DIR", "uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("NOTENPFAD_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+JOB_WORKERS = int(os.getenv("NOTENPFAD_JOB_WORKERS", "1"))
+MAX_QUEUED = int(os.getenv("NOTENPFAD_JOB_MAX_QUEUED", "100"))
+MAX_ATTEMPTS = 3
+# Younger files may belong to an upload another worker has not queued yet
+SWEEP_AFTER_SECONDS = 3600
+POLL_SECONDS = 2.0
+HEARTBEAT_SECONDS = 15.0
+RETRY_AFTER = 5
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/heic": ".heic",
+    "image/webp": ".webp",
+    "application/pdf": ".pdf",
+}
+
+FINISHED = ("done", "failed")
+
+# Stored with the PID of the process running a job: a restarted container
+# often gets its old PID back (PID 1), so the PID alone can't tell this
+# process's jobs from the previous run's
+BOOT_ID = uuid.uuid4().hex
+
+Job = models.AnalysisJob
+
+logger = logging.getLogger("notenpfad.jobs")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def accepts(content_type):
+    return content_type in EXTENSIONS
+
+
+def describe(job):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "student_id": job.student_id,
+        "create_grade": bool(job.create_grade),
+        "filename": job.filename,
+        "size": job.size,
+        "analyzer": job.analyzer,
+        "attempts": job.attempts,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "grade_id": job.grade_id,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+# --- Upload ---
+
+
+async def save_upload(stream, content_type):
+    # Writes the body to UPLOAD_DIR as it arrives -> (path, size).
+    # Raises UploadTooLarge (and removes the partial file) past MAX_UPLOAD_BYTES.
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, uuid.uuid4().hex + EXTENSIONS.get(content_type, ".bin"))
+    size = 0
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in stream:
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge()
+            if chunk:
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        f.close()
+        os.remove(path)
+        raise
+    f.close()
+    return path, size
+
+
+def remove_scan(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.exception("Removing scan %s failed", path)
+
+
+def queue_full(db):
+    return db.query(Job.id).filter(Job.status == "queued").count() >= MAX_QUEUED
+
+
+def create_job(db, path, size, content_type, filename, student_id, create_grade):
+    job = Job(
+        status="queued",
+        student_id=student_id,
+        create_grade=1 if create_grade else 0,
+        filename=filename,
+        content_type=content_type,
+        path=path,
+        size=size,
+        analyzer=analyzers.DEFAULT_ANALYZER,
+        attempts=0,
+        created_at=_now(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    kick()
+    return describe(job)
+
+# --- Dispatcher ---
+
+_wake = threading.Event()
+_stop = threading.Event()
+_slots = threading.Semaphore(max(JOB_WORKERS, 1))
+_thread = None
+_executor = None
+
+
+def kick():
+    # A job was queued (or a slot freed up): look for work now
+    _wake.set()
+
+
+def _claim_next():
+    # -> (job_id, analyzer, path) of the job this process now owns, or None
+    db = database.SessionLocal()
+    try:
+        while True:
+            job_id = db.query(Job.id).filter(Job.status == "queued").order_by(Job.id).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = (
+                db.query(Job)
+                .filter(Job.id == job_id, Job.status == "queued")
+                .update({
+                    Job.status: "running",
+                    Job.started_at: _now(),
+                    Job.worker_pid: os.getpid(),
+                    Job.worker_boot: BOOT_ID,
+                    Job.attempts: Job.attempts + 1,
+                }, synchronize_session=False)
+            )
+            db.commit()
+            if claimed:
+                job = db.query(Job.analyzer, Job.path).filter(Job.id == job_id).one()
+                return job_id, job.analyzer, job.path
+            # Another process took it first; try the next one
+    finally:
+        db.close()
+
+
+def _create_grade(db, job, result):
+    # -> error message, or None once the grade is added to the session
+    subject = db.query(models.Subject).filter(models.Subject.name == result.get("subject")).first()
+    if subject is None:
+        return f"No grade stored: unknown subject {result.get('subject')!r}"
+    try:
+        value = float(result["grade"])
+        grade_date = date.fromisoformat(result["date"]) if result.get("date") else date.today()
+    except (KeyError, TypeError, ValueError):
+        return "No grade stored: the analyzer returned no valid grade/date"
+    if not 1 <= value <= 6:
+        return f"No grade stored: {value} is not a grade between 1 and 6"
+    grade = models.Grade(
+        value=value,
+        date=grade_date,
+        type=result.get("type") or "Prüfung",
+        student_id=job.student_id,
+        subject_id=subject.id,
+    )
+    db.add(grade)
+    db.flush()
+    aggregates.add_grade(db, grade)
+    sync.record(db, "grade", [grade.id], "upsert", job.student_id)
+    versioning.bump(db, versioning.student_key(job.student_id))
+    job.grade_id = grade.id
+    return None
+
+
+def _finish(job_id, path, result=None, error=None):
+    db = database.SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job is None:
+            remove_scan(path)  # deleted with its student meanwhile
+            return
+        if job.status != "running":
+            return
+        if error is not None:
+            job.status = "failed"
+            job.error = str(error)[:500] or type(error).__name__
+        else:
+            job.status = "done"
+            job.result = json.dumps(result, default=str)
+            if job.create_grade and job.student_id is not None:
+                job.error = _create_grade(db, job, result)
+        job.finished_at = _now()
+        db.commit()
+        remove_scan(path)
+        if job.grade_id is not None:
+            grade = db.query(models.Grade).filter(models.Grade.id == job.grade_id).first()
+            if grade is not None:
+                events.publish(versioning.student_key(grade.student_id), "grade.created", events.grade_data(grade))
+    finally:
+        db.close()
+        _slots.release()
+        notify(job_id)
+        kick()
+
+
+def _run_inline(job_id, analyzer, path):
+    try:
+        result = analyzers.run(analyzer, path)
+    except Exception as e:
+        _finish(job_id, path, error=e)
+    else:
+        _finish(job_id, path, result=result)
+
+
+def _on_done(job_id, path, future):
+    if future.cancelled():
+        # Shutting down: the job stays "running" and is requeued on the next start
+        _slots.release()
+        return
+    error = future.exception()
+    if error is not None:
+        _finish(job_id, path, error=error)
+    else:
+        _finish(job_id, path, result=future.result())
+
+
+def _dispatch_loop():
+    while not _stop.is_set():
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+        while not _stop.is_set() and _slots.acquire(blocking=False):
+            try:
+                claimed = _claim_next()
+            except Exception:
+                # e.g. the database is locked for longer than the busy timeout; retry on the next round
+                logger.exception("Claiming an analysis job failed")
+                claimed = None
+            if claimed is None:
+                _slots.release()
+                break
+            job_id, analyzer, path = claimed
+            notify(job_id)
+            if _executor is None:
+                threading.Thread(target=_run_inline, args=claimed, daemon=True).start()
+            else:
+                _executor.submit(analyzers.run, analyzer, path).add_done_callback(
+                    lambda future, job_id=job_id, path=path: _on_done(job_id, path, future))
+
+
+def _owner_alive(job):
+    pid = job.worker_pid
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return job.worker_boot == BOOT_ID
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def requeue_orphans(db):
+    # "running" jobs of processes that no longer exist go back to the queue
+    orphans = [job for job in db.query(Job).filter(Job.status == "running") if not _owner_alive(job)]
+    given_up = []
+    for job in orphans:
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = f"Interrupted {job.attempts} times"
+            job.finished_at = _now()
+            given_up.append(job.path)
+        else:
+            job.status = "queued"
+            job.worker_pid = None
+            job.worker_boot = None
+    db.commit()
+    for path in given_up:
+        remove_scan(path)
+    return len(orphans)
+
+
+def sweep_uploads(db):
+    # Deletes scans no queued or running job refers to -> number removed
+    in_use = {path for (path,) in db.query(Job.path).filter(Job.status.in_(("queued", "running")))}
+    cutoff = time.time() - SWEEP_AFTER_SECONDS
+    removed = 0
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.is_file() and entry.path not in in_use and entry.stat().st_mtime < cutoff:
+            remove_scan(entry.path)
+            removed += 1
+    return removed
+
+
+def start():
+    global _thread, _executor
+    if _thread is not None:
+        return
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    db = database.SessionLocal()
+    try:
+        requeue_orphans(db)
+        sweep_uploads(db)
+    finally:
+        db.close()
+    if JOB_WORKERS > 0:
+        # spawn, not fork: the server process already runs threads
+        _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    _stop.clear()
+    _thread = threading.Thread(target=_dispatch_loop, name="notenpfad-jobs", daemon=True)
+    _thread.start()
+    kick()
+
+
+def shutdown():
+    # Running jobs are requeued by the next start
+    global _thread, _executor
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+# --- Waiting for a job (SSE) ---
+
+_waiters = {}
+_waiters_lock = threading.Lock()
+
+
+def notify(job_id):
+    with _waiters_lock:
+        waiters = list(_waiters.get(job_id, ()))
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+def _read(job_id):
+    db = database.SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return describe(job) if job is not None else None
+    finally:
+        db.close()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def job_events(job_id):
+    # Server-sent events: "status" on every change, then "done" or
+    # "failed" (or "gone" if the job was deleted) and the stream ends
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with _waiters_lock:
+        _waiters.setdefault(job_id, set()).add(waiter)
+    try:
+        last_status = None
+        idle = 0.0
+        while True:
+            # Cleared before reading, so a change during the read still wakes us
+            waiter[1].clear()
+            job = await run_in_threadpool(_read, job_id)
+            if job is None:
+                yield _sse("gone", {"id": job_id})
+                return
+            if job["status"] in FINISHED:
+                yield _sse(job["status"], job)
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                idle = 0.0
+                yield _sse("status", job)
+            elif idle >= HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            try:
+                await asyncio.wait_for(waiter[1].wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                idle += POLL_SECONDS
+    finally:
+        with _waiters_lock:
+            waiters = _waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del _waiters[job_id]
@@ -1,26 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from pydantic import BaseModel, Field
 from typing import List, Optional
+import datetime
 from datetime import date
-from passlib.context import CryptContext
-import models, database
+import os
+import models, database, cache, chat, events, jobs, metrics, migrations, query_budget, scoring, aggregates, passwords, grade_import, grade_export, pagination, probability, sync, trend, versioning
 
-models.Base.metadata.create_all(bind=database.engine)
+database.init_db()
+migrations.migrate()
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 app = FastAPI(title="Notenpfad API")
 
+# Opt-in (NOTENPFAD_QUERY_BUDGET=warn|error); see query_budget.py
+query_budget.install(app, database.engine)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # Allow all for dev
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Query-Count"],
 )
+# Compress responses from NOTENPFAD_GZIP_MIN_SIZE bytes on (0 = off) for
+# clients sending Accept-Encoding: gzip. Event streams are never compressed.
+GZIP_MIN_SIZE = int(os.getenv("NOTENPFAD_GZIP_MIN_SIZE", "1024"))
+if GZIP_MIN_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=6)
+# Outermost, so the latency covers the whole stack
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(database.engine)
 
 # Dependency
 def get_db():
@@ -31,10 +47,79 @@ def get_db():
         db.close()
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    # -> (valid, new_hash); hashing runs in the passwords process pool
+    return passwords.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
+
+def release_connection(db: Session):
+    # Hand the pooled connection back before a slow bcrypt call. Otherwise
+    # a burst of logins holds every pool connection while waiting on the
+    # hash pool and unrelated reads block on checkout. The session checks
+    # out a fresh connection for its next statement.
+    db.rollback()
+
+def not_modified(request: Request, response: Response, db: Session, *keys):
+    # Conditional GET: the ETag comes from the data versions alone, so a
+    # client that already has the current representation gets a 304
+    # without the endpoint running its query. Returns the 304 response,
+    # or None after setting the ETag on the normal response. The versions
+    # are read before the data, so a racing write can only leave the ETag
+    # older than the body (next request: 200), never newer.
+    versions = versioning.read(db, *keys)
+    # For cache keys, so a cached body always matches its ETag
+    request.state.data_versions = tuple(versions)
+    etag = versioning.make_etag(versions, f"{request.url.path}?{request.url.query}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if versioning.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Reference data cached per process (see cache.py). The subject and topic
+# lists are keyed by the data versions of their ETag. The student lookups
+# follow the "accounts" version: the endpoints that create or delete
+# children invalidate them.
+subject_cache = cache.Cache("subjects", maxsize=64, depends_on=(versioning.SUBJECTS,))
+topic_cache = cache.Cache("topics", maxsize=1024, ttl=None)
+student_cache = cache.Cache("students", maxsize=4096, depends_on=(versioning.ACCOUNTS,))
+account_cache = cache.Cache("accounts", maxsize=4096, depends_on=(versioning.ACCOUNTS,))
+
+def student_exists(db: Session, student_id: int):
+    # Only found students are cached, so a new profile is seen at once
+    def load():
+        return True if db.query(models.Student.id).filter(models.Student.id == student_id).first() else None
+    return bool(student_cache.get_or_load(student_id, load))
+
+def load_account(db: Session, user_id: int):
+    # -> (the user's own student ids, their children's student ids), or
+    # None for an unknown user; one query, then cached
+    def load():
+        rows = (
+            db.query(models.User.id, models.Student.id.label("student_id"))
+            .outerjoin(models.Student, models.Student.user_id == models.User.id)
+            .filter(or_(models.User.id == user_id, models.User.parent_id == user_id))
+            .all()
+        )
+        if not any(row.id == user_id for row in rows):
+            return None
+        own = tuple(row.student_id for row in rows if row.id == user_id and row.student_id is not None)
+        children = tuple(row.student_id for row in rows if row.id != user_id and row.student_id is not None)
+        return own, children
+    return account_cache.get_or_load(user_id, load)
+
+def subject_weightings(db: Session):
+    # {subject_id: weighting}
+    return subject_cache.get_or_load("weightings", lambda: dict(db.query(models.Subject.id, models.Subject.weighting).all()))
+
+@app.exception_handler(passwords.HashPoolBusy)
+def hash_pool_busy_handler(request: Request, exc: passwords.HashPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # --- Pydantic Schemas ---
 class GradeBase(BaseModel):
@@ -46,9 +131,13 @@ class GradeBase(BaseModel):
 class GradeCreate(GradeBase):
     pass
 
+class GradeImportRow(GradeCreate):
+    student_id: Optional[int] = None
+
 class Grade(GradeBase):
     id: int
     student_id: int
+    date: Optional[datetime.date] = None # legacy rows may have none
     class Config:
         orm_mode = True
 
@@ -92,6 +181,20 @@ class StudentOut(BaseModel):
     class Config:
         orm_mode = True
 
+class ChildOverview(BaseModel):
+    id: int
+    username: str
+    student_id: Optional[int] = None
+    name: Optional[str] = None
+    average: Optional[float] = None
+    passed: bool = False
+    grade_count: int = 0
+    last_activity: Optional[date] = None
+
+class FamilyOverview(BaseModel):
+    parent_id: int
+    children: List[ChildOverview]
+
 class SubjectBase(BaseModel):
     name: str
     weighting: float = 1.0
@@ -101,10 +204,34 @@ class SubjectCreate(SubjectBase):
 
 class Subject(SubjectBase):
     id: int
-    grades: List[Grade] = []
     class Config:
         orm_mode = True
 
+class SubjectSummary(SubjectBase):
+    id: int
+    grade_count: int = 0
+    average: Optional[float] = None
+    min_grade: Optional[float] = None
+    max_grade: Optional[float] = None
+    latest_date: Optional[date] = None
+    topic_count: int = 0
+    topics_completed: int = 0
+    topic_completion: Optional[float] = None
+
+class StudentSubjects(BaseModel):
+    student_id: int
+    zeugnisschnitt: Optional[float] = None
+    subjects: List[SubjectSummary]
+
+class Dashboard(BaseModel):
+    # Parts left out via ?include= are omitted from the response
+    student_id: int
+    score: Optional[dict] = None
+    zeugnisschnitt: Optional[float] = None
+    grade_count: Optional[int] = None
+    subjects: Optional[List[SubjectSummary]] = None
+    recent_grades: Optional[List[Grade]] = None
+
 # --- Endpoints ---
 
 @app.get("/")
@@ -115,8 +242,18 @@ def read_root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # Prometheus scrape target; async so it samples the event loop's threadpool limiter
+    metrics.sample_threadpool()
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.on_event("startup")
 def startup_event():
+    passwords.start()
+    jobs.start()
+    sync.start()
+    cache.start()
     db = database.SessionLocal()
     try:
         # 1. Create Admin (Parent)
@@ -148,14 +285,31 @@ def startup_event():
              db.add(student_profile)
              db.commit()
 
+        # 4. Backfill score aggregates for databases that predate the table
+        aggregates.ensure_built(db)
+
+        # 5. Random ETag epoch for this database
+        versioning.ensure_epoch(db)
+
+    except IntegrityError:
+        # Several uvicorn workers seeding a fresh database at once: another one won
+        db.rollback()
     finally:
         db.close()
 
+@app.on_event("shutdown")
+def shutdown_event():
+    jobs.shutdown()
+    sync.shutdown()
+    cache.shutdown()
+    passwords.shutdown()
+
 @app.post("/register", response_model=UserOut)
 def register(user: UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.username == user.username).first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
+    release_connection(db)
     hashed_password = get_password_hash(user.password)
     new_user = models.User(username=user.username, password_hash=hashed_password)
     db.add(new_user)
@@ -172,6 +326,7 @@ def create_student(user: UserStudentCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
+    release_connection(db)
     hashed_password = get_password_hash(user.password)
     new_user = models.User(username=user.username, password_hash=hashed_password, role="student")
     db.add(new_user)
@@ -180,23 +335,41 @@ def create_student(user: UserStudentCreate, db: Session = Depends(get_db)):
     return new_user
 
 @app.post("/login")
+@query_budget.max_queries(2)
 def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+    # Fetch the account and its linked student_id (if applicable) in one go
+    db_user = (
+        db.query(
+            models.User.id,
+            models.User.username,
+            models.User.role,
+            models.User.password_hash,
+            models.Student.id.label("student_id"),
+        )
+        .outerjoin(models.Student, models.Student.user_id == models.User.id)
+        .filter(models.User.username == user.username)
+        .first()
+    )
+    if not db_user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    
-    # Return role in login response
-    # Find linked student_id if applicable
-    student_id = None
-    if db_user.student_profile:
-        student_id = db_user.student_profile.id
 
+    release_connection(db)
+    valid, new_hash = verify_password(user.password, db_user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+
+    # Transparently upgrade hashes made with a different bcrypt cost
+    if new_hash:
+        db.query(models.User).filter(models.User.id == db_user.id).update({models.User.password_hash: new_hash})
+        db.commit()
+
+    # Return role in login response
     return {
         "message": "Login successful", 
         "user_id": db_user.id, 
         "username": db_user.username,
         "role": db_user.role,
-        "student_id": student_id
+        "student_id": db_user.student_id
     }
 
 @app.post("/users/children", response_model=UserOut)
@@ -210,6 +383,7 @@ def create_child(child: ChildCreate, db: Session = Depends(get_db)):
     if db.query(models.User).filter(models.User.username == child.username).first():
         raise HTTPException(status_code=400, detail="Username taken")
         
+    release_connection(db)
     hashed = get_password_hash(child.password)
     new_user = models.User(username=child.username, password_hash=hashed, role="student", parent_id=child.parent_id)
     db.add(new_user)
@@ -219,19 +393,70 @@ def create_child(child: ChildCreate, db: Session = Depends(get_db)):
     # Create Student Profile
     student = models.Student(name=child.name, target_school="Gymnasium", user_id=new_user.id)
     db.add(student)
+    db.flush()
+    # SQLite may hand out a deleted student's id again
+    versioning.bump(db, versioning.student_key(student.id), versioning.ACCOUNTS)
     db.commit()
+    account_cache.invalidate(child.parent_id)
+
+    # The parent's open event streams start following the new child
+    events.follow(events.user_topic(child.parent_id), versioning.student_key(student.id))
+    events.publish(events.user_topic(child.parent_id), "child.created",
+                   {"user_id": new_user.id, "student_id": student.id, "name": student.name})
     
     return new_user
 
 @app.get("/users/{user_id}/children", response_model=List[ChildOut])
+@query_budget.max_queries(2)
 def get_children(user_id: int, db: Session = Depends(get_db)):
-    children = db.query(models.User).filter(models.User.parent_id == user_id).all()
+    # Profiles in one extra SELECT ... IN instead of one lazy load per child
+    children = (
+        db.query(models.User)
+        .options(selectinload(models.User.student_profile))
+        .filter(models.User.parent_id == user_id)
+        .all()
+    )
     return children
 
+@app.get("/users/{parent_id}/overview", response_model=FamilyOverview)
+@query_budget.max_queries(4)
+def family_overview(parent_id: int, db: Session = Depends(get_db)):
+    # Score status of every child: the children with their profiles
+    # (2 queries) and one grouped query over all their grades, whatever
+    # the number of children or grades.
+    if not db.query(models.User.id).filter(models.User.id == parent_id).first():
+        raise HTTPException(status_code=404, detail="Parent not found")
+    children = (
+        db.query(models.User)
+        .options(selectinload(models.User.student_profile))
+        .filter(models.User.parent_id == parent_id)
+        .order_by(models.User.id)
+        .all()
+    )
+    student_ids = [child.student_profile.id for child in children if child.student_profile]
+    family = scoring.load_family_buckets(db, student_ids) if student_ids else {}
+
+    overview = []
+    for child in children:
+        entry = ChildOverview(id=child.id, username=child.username)
+        profile = child.student_profile
+        if profile:
+            buckets, grade_count, last_activity = family[profile.id]
+            score = scoring.gymi_score(buckets)
+            entry.student_id = profile.id
+            entry.name = profile.name
+            entry.average = score["average"] if grade_count else None
+            entry.passed = score["passed"]
+            entry.grade_count = grade_count
+            entry.last_activity = last_activity
+        overview.append(entry)
+    return FamilyOverview(parent_id=parent_id, children=overview)
+
 @app.delete("/users/children/{child_id}")
+@query_budget.max_queries(7)
 def delete_child(child_id: int, db: Session = Depends(get_db)):
     # 1. Find User
-    user = db.query(models.User).filter(models.User.id == child_id).first()
+    user = db.query(models.User.id, models.User.role, models.User.parent_id).filter(models.User.id == child_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -239,17 +464,24 @@ def delete_child(child_id: int, db: Session = Depends(get_db)):
     if user.role != "student":
         raise HTTPException(status_code=400, detail="Cannot delete non-student user via this endpoint")
 
-    # 3. Find Student Profile
-    student = db.query(models.Student).filter(models.Student.user_id == user.id).first()
-    
-    # 4. Delete Grades and Student Profile if they exist
-    if student:
-        db.query(models.Grade).filter(models.Grade.student_id == student.id).delete()
-        db.delete(student)
+    # 3. Invalidate the student's cached reads
+    student_id = db.query(models.Student.id).filter(models.Student.user_id == user.id).scalar()
+    keys = [versioning.ACCOUNTS]
+    if student_id is not None:
+        keys.append(versioning.student_key(student_id))
+        sync.record_student_deleted(db, student_id)
+    versioning.bump(db, *keys)
     
-    # 5. Delete User
-    db.delete(user)
+    # 4. Delete User; the database cascades to the profile, grades and score aggregates
+    db.execute(delete(models.User).where(models.User.id == user.id))
     db.commit()
+    account_cache.invalidate(user.id, user.parent_id)
+    if student_id is not None:
+        student_cache.invalidate(student_id)
+
+    if student_id is not None:
+        events.publish(versioning.student_key(student_id), "child.deleted", {"user_id": user.id, "student_id": student_id})
+        events.drop_topic(versioning.student_key(student_id))
     
     return {"message": "Child deleted successfully"}
 
@@ -259,164 +491,502 @@ def update_password(user_id: int, user_update: UserPasswordUpdate, db: Session =
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    release_connection(db)
     hashed_password = get_password_hash(user_update.password)
     db_user.password_hash = hashed_password
     db.commit()
     return {"message": "Password updated successfully"}
 
 @app.post("/subjects/", response_model=Subject)
+@query_budget.max_queries(6)
 def create_subject(subject: SubjectCreate, db: Session = Depends(get_db)):
     db_subject = models.Subject(name=subject.name, weighting=subject.weighting)
     db.add(db_subject)
+    db.flush()
+    sync.record(db, "subject", [db_subject.id], "upsert")
+    versioning.bump(db, versioning.SUBJECTS)
     db.commit()
+    subject_cache.invalidate()
     db.refresh(db_subject)
+    events.publish(versioning.SUBJECTS, "subject.created",
+                   {"id": db_subject.id, "name": db_subject.name, "weighting": db_subject.weighting})
     return db_subject
 
 @app.get("/subjects/", response_model=List[Subject])
-def read_subjects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    subjects = db.query(models.Subject).offset(skip).limit(limit).all()
+@query_budget.max_queries(2)
+def read_subjects(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    cached = not_modified(request, response, db, versioning.SUBJECTS)
+    if cached:
+        return cached
+    subjects = subject_cache.get_or_load(
+        request.state.data_versions,
+        lambda: [dict(row._mapping) for row in db.execute(
+            select(models.Subject.id, models.Subject.name, models.Subject.weighting).order_by(models.Subject.id))],
+    )[skip:skip + limit]
     return subjects
 
+@app.get("/students/{student_id}/subjects", response_model=StudentSubjects)
+@query_budget.max_queries(2)
+def read_student_subjects(request: Request, response: Response, student_id: int, db: Session = Depends(get_db)):
+    cached = not_modified(request, response, db, *versioning.student_keys(student_id), versioning.TOPICS)
+    if cached:
+        return cached
+    return student_subject_summaries(db, student_id)
+
+def student_subject_summaries(db: Session, student_id: int):
+    # Per-subject stats for one student, aggregated in SQL (one statement, no grade rows loaded)
+    grade_stats = (
+        db.query(
+            models.Grade.subject_id.label("subject_id"),
+            func.count(models.Grade.id).label("grade_count"),
+            func.avg(models.Grade.value).label("average"),
+            func.min(models.Grade.value).label("min_grade"),
+            func.max(models.Grade.value).label("max_grade"),
+            func.max(models.Grade.date).label("latest_date"),
+        )
+        .filter(models.Grade.student_id == student_id)
+        .group_by(models.Grade.subject_id)
+        .subquery()
+    )
+    topic_stats = (
+        db.query(
+            models.Topic.subject_id.label("subject_id"),
+            func.count(models.Topic.id).label("topic_count"),
+            func.sum(models.Topic.is_completed).label("topics_completed"),
+        )
+        .group_by(models.Topic.subject_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            models.Subject.id,
+            models.Subject.name,
+            models.Subject.weighting,
+            grade_stats.c.grade_count,
+            grade_stats.c.average,
+            grade_stats.c.min_grade,
+            grade_stats.c.max_grade,
+            grade_stats.c.latest_date,
+            topic_stats.c.topic_count,
+            topic_stats.c.topics_completed,
+        )
+        .outerjoin(grade_stats, grade_stats.c.subject_id == models.Subject.id)
+        .outerjoin(topic_stats, topic_stats.c.subject_id == models.Subject.id)
+        .order_by(models.Subject.id)
+        .all()
+    )
+
+    subjects = []
+    for row in rows:
+        topic_count = row.topic_count or 0
+        topics_completed = int(row.topics_completed or 0)
+        subjects.append(SubjectSummary(
+            id=row.id,
+            name=row.name,
+            weighting=row.weighting,
+            grade_count=row.grade_count or 0,
+            average=round(row.average, 2) if row.average is not None else None,
+            min_grade=row.min_grade,
+            max_grade=row.max_grade,
+            latest_date=row.latest_date,
+            topic_count=topic_count,
+            topics_completed=topics_completed,
+            topic_completion=round(topics_completed / topic_count, 2) if topic_count else None,
+        ))
+
+    # Zeugnisschnitt: average of the subject averages (subjects without grades don't count)
+    averages = [row.average for row in rows if row.average is not None]
+    zeugnisschnitt = round(sum(averages) / len(averages), 2) if averages else None
+
+    return StudentSubjects(student_id=student_id, zeugnisschnitt=zeugnisschnitt, subjects=subjects)
+
 @app.delete("/subjects/{subject_id}")
+@query_budget.max_queries(8)
 def delete_subject(subject_id: int, db: Session = Depends(get_db)):
-    subject = db.query(models.Subject).filter(models.Subject.id == subject_id).first()
-    if not subject:
+    if db.query(models.Subject.id).filter(models.Subject.id == subject_id).first() is None:
         raise HTTPException(status_code=404, detail="Subject not found")
-    
-    # Manually delete grades associated with this subject (safeguard for SQLite/no-cascade)
-    db.query(models.Grade).filter(models.Grade.subject_id == subject_id).delete()
-    
-    db.delete(subject)
+
+    # Tombstones for the subject and everything that goes with it, then
+    # one statement; the database cascades to grades, topics and score aggregates
+    sync.record_subject_deleted(db, subject_id)
+    deleted = db.execute(delete(models.Subject).where(models.Subject.id == subject_id)).rowcount
+    if not deleted:
+        # Deleted by a concurrent request since the check: drop our tombstones
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Subject not found")
+
+    versioning.bump(db, versioning.SUBJECTS, versioning.TOPICS)
     db.commit()
+    subject_cache.invalidate()
+    topic_cache.invalidate()
+    events.publish(versioning.SUBJECTS, "subject.deleted", {"id": subject_id})
     return {"message": "Subject and associated grades deleted"}
 
 @app.post("/grades/", response_model=Grade)
+@query_budget.max_queries(10)
 def create_grade(grade: GradeCreate, student_id: int = 1, db: Session = Depends(get_db)):
     # Check if student exists
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
-    if not student:
+    if not student_exists(db, student_id):
         raise HTTPException(status_code=404, detail="Student not found")
     
     db_grade = models.Grade(**grade.dict(), student_id=student_id)
     db.add(db_grade)
-    db.commit()
+    try:
+        db.flush()
+        aggregates.add_grade(db, db_grade)
+        sync.record(db, "grade", [db_grade.id], "upsert", student_id)
+        versioning.bump(db, versioning.student_key(student_id))
+        db.commit()
+    except IntegrityError:
+        # Foreign key on subject_id, or on a student another worker deleted
+        db.rollback()
+        student_cache.invalidate(student_id)
+        if not student_exists(db, student_id):
+            raise HTTPException(status_code=404, detail="Student not found")
+        raise HTTPException(status_code=404, detail="Subject not found")
     db.refresh(db_grade)
+    events.publish(versioning.student_key(student_id), "grade.created", events.grade_data(db_grade))
     return db_grade
 
+def filter_grades(query, student_id: int, subject_id: Optional[int] = None, grade_type: Optional[str] = None,
+                  date_from: Optional[date] = None, date_to: Optional[date] = None):
+    query = query.filter(models.Grade.student_id == student_id)
+    if subject_id is not None:
+        query = query.filter(models.Grade.subject_id == subject_id)
+    if grade_type is not None:
+        query = query.filter(models.Grade.type == grade_type)
+    if date_from is not None:
+        query = query.filter(models.Grade.date >= date_from)
+    if date_to is not None:
+        query = query.filter(models.Grade.date <= date_to)
+    return query
+
 @app.get("/grades/", response_model=List[Grade])
-def read_grades(student_id: int = 1, db: Session = Depends(get_db)):
-    grades = db.query(models.Grade).filter(models.Grade.student_id == student_id).all()
+@query_budget.max_queries(3)
+def read_grades(
+    request: Request,
+    response: Response,
+    student_id: int = 1,
+    subject_id: Optional[int] = None,
+    grade_type: Optional[str] = Query(None, alias="type"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: str = Query("rows", pattern="^(rows|columnar)$"),
+    db: Session = Depends(get_db),
+):
+    # Sorted by (date, id), newest first by default. With ?limit= the list is
+    # paginated; the X-Next-Cursor header holds the cursor for the next page.
+    # ?format=columnar answers one array per field instead of one object per grade.
+    # The page on which the dated grades end takes a second query for the
+    # undated ones (see pagination.py).
+    cached = not_modified(request, response, db, *versioning.student_keys(student_id))
+    if cached:
+        return cached
+
+    descending = order == "desc"
+    if format == "columnar":
+        return read_grades_columnar(db, response, student_id, subject_id, grade_type, date_from, date_to, descending, limit, cursor)
+
+    query = filter_grades(db.query(models.Grade), student_id, subject_id, grade_type, date_from, date_to)
+    try:
+        grades, next_cursor = pagination.fetch_page(query, cursor, descending, limit, lambda page: page.all())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return grades
 
+def read_grades_columnar(db, response, student_id, subject_id, grade_type, date_from, date_to, descending, limit, cursor):
+    # Plain tuples from a Core select, no ORM objects and no per-row model
+    # validation; the JSON names each field once instead of once per grade
+    statement = filter_grades(
+        select(models.Grade.id, models.Grade.value, models.Grade.date, models.Grade.type, models.Grade.subject_id),
+        student_id, subject_id, grade_type, date_from, date_to,
+    )
+    connection = db.connection()
+    try:
+        rows, next_cursor = pagination.fetch_page(
+            statement, cursor, descending, limit, lambda page: connection.execute(page).all())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    ids, values, dates, types, subject_ids = zip(*rows) if rows else ((),) * 5
+    content = {
+        "student_id": student_id,
+        "count": len(rows),
+        "id": ids,
+        "value": values,
+        "date": [grade_date.isoformat() if grade_date else None for grade_date in dates],
+        "type": types,
+        "subject_id": subject_ids,
+    }
+    # Returned as-is: the endpoint's response_model describes the row format
+    return JSONResponse(content=content, headers=dict(response.headers))
+
 @app.delete("/grades/{grade_id}")
+@query_budget.max_queries(9)
 def delete_grade(grade_id: int, db: Session = Depends(get_db)):
     grade = db.query(models.Grade).filter(models.Grade.id == grade_id).first()
     if not grade:
         raise HTTPException(status_code=404, detail="Grade not found")
     
+    student_id = grade.student_id
     db.delete(grade)
+    aggregates.remove_grade(db, grade)
+    sync.record(db, "grade", [grade_id], "delete", student_id)
+    versioning.bump(db, versioning.student_key(student_id))
     db.commit()
+    events.publish(versioning.student_key(student_id), "grade.deleted", {"id": grade_id, "student_id": student_id})
     return {"message": "Grade deleted"}
 
+# --- Bulk Import ---
+
+async def run_grade_import(importer, request: Request, fmt: str):
+    # Parse the upload as it streams in; DB work stays off the event loop.
+    # Every batch is committed on its own (see grade_import.py), so the
+    # events also go out when the upload breaks off after some batches.
+    try:
+        async for batch in grade_import.iter_batches(request.stream(), fmt):
+            await run_in_threadpool(importer.add_batch, batch)
+    finally:
+        for student_id, count in importer.imported_per_student().items():
+            events.publish(versioning.student_key(student_id), "grades.imported", {"student_id": student_id, "count": count})
+    return importer.report()
+
+@app.post("/students/{student_id}/grades/bulk")
+async def bulk_import_grades(student_id: int, request: Request, format: Optional[str] = None, db: Session = Depends(get_db)):
+    fmt = grade_import.detect_format(request.headers.get("content-type"), format)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    if not await run_in_threadpool(student_exists, db, student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    importer = await run_in_threadpool(grade_import.GradeImporter, db, GradeCreate, [student_id], student_id)
+    return await run_grade_import(importer, request, fmt)
+
+@app.post("/users/{parent_id}/grades/bulk")
+async def bulk_import_family_grades(parent_id: int, request: Request, format: Optional[str] = None, db: Session = Depends(get_db)):
+    # Like the student import, but every row names its student_id (must be one of the parent's children)
+    fmt = grade_import.detect_format(request.headers.get("content-type"), format)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    account = await run_in_threadpool(load_account, db, parent_id)
+    if account is None:
+        raise HTTPException(status_code=404, detail="Parent not found")
+
+    importer = await run_in_threadpool(grade_import.GradeImporter, db, GradeImportRow, list(account[1]))
+    return await run_grade_import(importer, request, fmt)
+
+# --- Export ---
+
+@app.get("/students/{student_id}/grades/export")
+def export_grades(student_id: int, format: str = "csv", db: Session = Depends(get_db)):
+    if format not in grade_export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    if not student_exists(db, student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    return grade_export.export_response(models.Grade.student_id == student_id, format, f"noten-{student_id}")
+
+@app.get("/users/{parent_id}/grades/export")
+def export_family_grades(parent_id: int, format: str = "csv", db: Session = Depends(get_db)):
+    # All grades of all children of a parent account, in one stream
+    if format not in grade_export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    if load_account(db, parent_id) is None:
+        raise HTTPException(status_code=404, detail="Parent not found")
+    children = (
+        select(models.Student.id)
+        .join(models.User, models.Student.user_id == models.User.id)
+        .where(models.User.parent_id == parent_id)
+    )
+    return grade_export.export_response(models.Grade.student_id.in_(children), format, f"noten-familie-{parent_id}")
+
+# --- Dashboard ---
+
+DASHBOARD_PARTS = ("score", "subjects", "recent_grades")
+
+@app.get("/students/{student_id}/dashboard", response_model=Dashboard, response_model_exclude_unset=True)
+@query_budget.max_queries(4)
+def read_dashboard(
+    request: Request,
+    response: Response,
+    student_id: int,
+    recent: int = Query(5, ge=0, le=100),
+    include: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # Everything the dashboard shows in one round trip and one session:
+    # score breakdown (aggregates), subject summaries (one grouped query)
+    # and the newest grades (index range scan). ?include=score,subjects
+    # limits the bundle to the listed parts.
+    parts = DASHBOARD_PARTS if include is None else [part.strip() for part in include.split(",") if part.strip()]
+    unknown = [part for part in parts if part not in DASHBOARD_PARTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(unknown)}")
+
+    cached = not_modified(request, response, db, *versioning.student_keys(student_id), versioning.TOPICS)
+    if cached:
+        return cached
+
+    bundle = {}
+    if "score" in parts:
+        bundle["score"] = scoring.gymi_score(scoring.load_buckets(db, student_id))
+    if "subjects" in parts:
+        summaries = student_subject_summaries(db, student_id)
+        bundle["subjects"] = summaries.subjects
+        bundle["zeugnisschnitt"] = summaries.zeugnisschnitt
+        bundle["grade_count"] = sum(subject.grade_count for subject in summaries.subjects)
+    if "recent_grades" in parts:
+        query = pagination.order_grades(filter_grades(db.query(models.Grade), student_id))
+        bundle["recent_grades"] = query.limit(recent).all() if recent else []
+    return {"student_id": student_id, **bundle}
+
+@app.get("/students/{student_id}/trend")
+@query_budget.max_queries(3)
+def read_trend(
+    request: Request,
+    response: Response,
+    student_id: int,
+    subject_id: Optional[int] = None,
+    window: int = Query(trend.DEFAULT_WINDOW, ge=1, le=100),
+    max_points: int = Query(trend.DEFAULT_MAX_POINTS, ge=3, le=5000),
+    db: Session = Depends(get_db),
+):
+    # Running and rolling averages per subject (plus "overall" without a
+    # subject filter), downsampled to at most max_points per series
+    cached = not_modified(request, response, db, *versioning.student_keys(student_id))
+    if cached:
+        return cached
+    return trend.build_trend(db, student_id, subject_id, window, max_points)
+
 @app.get("/average/")
-def calculate_average(student_id: int = 1, db: Session = Depends(get_db)):
-    # Calculate Gymi Score based on specific rules
-    grades = db.query(models.Grade).filter(models.Grade.student_id == student_id).all()
-    
-    # Helpers
-    def get_grades(subj_name, g_types=None):
-        # Support single string or list of strings
-        if isinstance(g_types, str):
-            g_types = [g_types]
-        return [g.value for g in grades if g.subject and g.subject.name == subj_name and (not g_types or g.type in g_types)]
-    
-    def avg(values):
-        return sum(values) / len(values) if values else None
+@query_budget.max_queries(2)
+def calculate_average(request: Request, response: Response, student_id: int = 1, db: Session = Depends(get_db)):
+    cached = not_modified(request, response, db, *versioning.student_keys(student_id))
+    if cached:
+        return cached
+    # Calculate Gymi Score based on specific rules (see scoring_rules.json)
+    buckets = scoring.load_buckets(db, student_id)
+    return scoring.gymi_score(buckets)
+
+class ScoreGrade(BaseModel):
+    subject: str # subject name, as used by the rules
+    type: str
+    value: float
 
-    # Vornote / Schulprüfung: 50% Deutsch, 50% Math
-    # Support both old "Vornote" and new "Schulprüfung" tags
-    math_vornote_grades = get_grades("Mathematik", ["Vornote", "Schulprüfung"])
-    deutsch_vornote_grades = get_grades("Deutsch", ["Vornote", "Schulprüfung"])
-    
-    math_vornote = avg(math_vornote_grades)
-    deutsch_vornote = avg(deutsch_vornote_grades)
-    
-    overall_vornote = None
-    if math_vornote is not None and deutsch_vornote is not None:
-        overall_vornote = (math_vornote + deutsch_vornote) / 2
-    elif math_vornote is not None:
-        overall_vornote = math_vornote
-    elif deutsch_vornote is not None:
-        overall_vornote = deutsch_vornote
-        
-    # Prüfungsnote / Gymiprüfung: 50% Math Exam, 50% Deutsch Exam
-    # Math Exam: Type "Prüfung" or "Gymiprüfung"
-    # Deutsch Exam: "Aufsatz", "Aufsatz (Gymiprüfung)", etc.
-    
-    math_exam_grades = get_grades("Mathematik", ["Prüfung", "Gymiprüfung"])
-    math_exam = avg(math_exam_grades)
-    
-    deutsch_aufsatz = avg(get_grades("Deutsch", ["Aufsatz", "Aufsatz (Prüfung)", "Aufsatz (Gymiprüfung)"]))
-    deutsch_sprach = avg(get_grades("Deutsch", ["Sprachbetrachtung", "Sprachbetrachtung (Prüfung)", "Sprachbetrachtung (Gymiprüfung)"]))
-    
-    deutsch_exam = None
-    if deutsch_aufsatz is not None and deutsch_sprach is not None:
-        deutsch_exam = (deutsch_aufsatz + deutsch_sprach) / 2
-    elif deutsch_aufsatz is not None: 
-         deutsch_exam = deutsch_aufsatz # Fallback if incomplete
-    elif deutsch_sprach is not None:
-         deutsch_exam = deutsch_sprach # Fallback
-         
-    # Overall Exam
-    overall_exam = None
-    if math_exam is not None and deutsch_exam is not None:
-        overall_exam = (math_exam + deutsch_exam) / 2
-    elif math_exam is not None:
-        overall_exam = math_exam
-    elif deutsch_exam is not None:
-        overall_exam = deutsch_exam
-
-    # Gesamtnote
-    gesamtnote = 0.0
-    if overall_vornote is not None and overall_exam is not None:
-        gesamtnote = (overall_vornote + overall_exam) / 2
-    elif overall_vornote is not None:
-        gesamtnote = overall_vornote
-    elif overall_exam is not None:
-        gesamtnote = overall_exam
-        
-    passed = gesamtnote >= 4.75
-    
-    return {
-        "average": round(gesamtnote, 2),
-        "details": {
-            "vornote": {
-                "value": round(overall_vornote, 2) if overall_vornote else None,
-                "math": round(math_vornote, 2) if math_vornote else None,
-                "deutsch": round(deutsch_vornote, 2) if deutsch_vornote else None
-            },
-            "exam": {
-                "value": round(overall_exam, 2) if overall_exam else None,
-                "math": round(math_exam, 2) if math_exam else None,
-                "deutsch": {
-                    "value": round(deutsch_exam, 2) if deutsch_exam else None,
-                    "aufsatz": round(deutsch_aufsatz, 2) if deutsch_aufsatz else None,
-                    "sprachbetrachtung": round(deutsch_sprach, 2) if deutsch_sprach else None
-                }
-            }
-        },
-        "passed": passed
-    }
+class ScoreScenario(BaseModel):
+    grades: List[ScoreGrade] = []
 
-@app.post("/analyze-exam")
-def analyze_exam():
-    # Mock Response
+class ScoreEvaluateRequest(BaseModel):
+    # With student_id, each scenario's grades come on top of the student's real ones
+    student_id: Optional[int] = None
+    scenarios: List[ScoreScenario] = Field(..., max_length=1000)
+
+@app.post("/score/evaluate")
+@query_budget.max_queries(1)
+def evaluate_scores(request: ScoreEvaluateRequest, db: Session = Depends(get_db)):
+    # Scores many what-if grade sets with the same rules as /average/,
+    # from at most one read of the aggregates
+    base = scoring.load_buckets(db, request.student_id) if request.student_id is not None else {}
     return {
-        "grade": 5.0,
-        "subject": "Deutsch",
-        "feedback": "Gute Arbeit bei der Textanalyse, aber achte mehr auf die Kommasetzung!"
+        "rules": scoring.RULES.name,
+        "results": [
+            scoring.gymi_score(scoring.add_grades(base, ((g.subject, g.type, g.value) for g in scenario.grades)))
+            for scenario in request.scenarios
+        ],
     }
 
+@app.post("/analyze-exam", status_code=202)
+async def analyze_exam(
+    request: Request,
+    response: Response,
+    student_id: Optional[int] = None,
+    create_grade: bool = False,
+    filename: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # The scan is the raw request body (an image or PDF, may be sent
+    # chunked). It is streamed to disk and queued; the analysis runs in the
+    # background (see jobs.py). Poll GET /jobs/{id} or follow
+    # GET /jobs/{id}/events. With create_grade=true the recognised grade
+    # is stored for the student when the job completes.
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if not jobs.accepts(content_type):
+        raise HTTPException(status_code=415, detail=f"Scans must be one of: {', '.join(jobs.EXTENSIONS)}")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > jobs.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Scan too large")
+    if create_grade and student_id is None:
+        raise HTTPException(status_code=400, detail="create_grade needs a student_id")
+
+    if student_id is not None:
+        if not await run_in_threadpool(student_exists, db, student_id):
+            raise HTTPException(status_code=404, detail="Student not found")
+    if await run_in_threadpool(jobs.queue_full, db):
+        raise HTTPException(status_code=503, detail="Too many scans waiting, please retry", headers={"Retry-After": str(jobs.RETRY_AFTER)})
+
+    try:
+        path, size = await jobs.save_upload(request.stream(), content_type)
+    except jobs.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Scan too large")
+    if size == 0:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+    job = await run_in_threadpool(jobs.create_job, db, path, size, content_type, filename, student_id, create_grade)
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+@app.get("/jobs/{job_id}")
+@query_budget.max_queries(1)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
+
+@app.get("/jobs/{job_id}/events")
+@query_budget.max_queries(1)
+def job_events(job_id: int, db: Session = Depends(get_db)):
+    # Server-sent events until the job is done or failed
+    if not db.query(models.AnalysisJob.id).filter(models.AnalysisJob.id == job_id).first():
+        raise HTTPException(status_code=404, detail="Job not found")
+    # The session lives as long as the stream; don't keep a pool connection for it
+    release_connection(db)
+    return StreamingResponse(
+        jobs.job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Live Events ---
+
+@app.get("/events")
+@query_budget.max_queries(2)
+def subscribe_events(user_id: int, db: Session = Depends(get_db)):
+    # Server-sent events for every change the user can see (see events.py):
+    # their own student profile or their children's, subjects and topics
+    account = load_account(db, user_id)
+    if account is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    release_connection(db)
+    if events.full():
+        raise HTTPException(status_code=503, detail="Too many open event streams, try again later",
+                            headers={"Retry-After": str(events.RETRY_AFTER)})
+    topics = [events.user_topic(user_id), versioning.SUBJECTS, versioning.TOPICS]
+    topics += [versioning.student_key(student_id) for student_id in account[0] + account[1]]
+    return StreamingResponse(
+        events.stream(user_id, topics),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- Topic Endpoints ---
 
 class TopicBase(BaseModel):
@@ -433,100 +1003,233 @@ class Topic(TopicBase):
         from_attributes = True
 
 @app.post("/topics/", response_model=Topic)
+@query_budget.max_queries(6)
 def create_topic(topic: TopicCreate, db: Session = Depends(get_db)):
     db_topic = models.Topic(name=topic.name, is_completed=topic.is_completed, subject_id=topic.subject_id)
     db.add(db_topic)
-    db.commit()
+    try:
+        db.flush()
+        sync.record(db, "topic", [db_topic.id], "upsert")
+        versioning.bump(db, versioning.TOPICS)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Subject not found")
+    topic_cache.invalidate()
     db.refresh(db_topic)
+    events.publish(versioning.TOPICS, "topic.created", events.topic_data(db_topic))
     return db_topic
 
 @app.put("/topics/{topic_id}/toggle", response_model=Topic)
+@query_budget.max_queries(7)
 def toggle_topic(topic_id: int, db: Session = Depends(get_db)):
     topic = db.query(models.Topic).filter(models.Topic.id == topic_id).first()
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
     
     topic.is_completed = not topic.is_completed
+    sync.record(db, "topic", [topic_id], "upsert")
+    versioning.bump(db, versioning.TOPICS)
     db.commit()
+    topic_cache.invalidate()
     db.refresh(topic)
+    events.publish(versioning.TOPICS, "topic.updated", events.topic_data(topic))
     return topic
 
 @app.get("/subjects/{subject_id}/topics", response_model=List[Topic])
-def read_topics(subject_id: int, db: Session = Depends(get_db)):
-    topics = db.query(models.Topic).filter(models.Topic.subject_id == subject_id).all()
-    return topics
+@query_budget.max_queries(2)
+def read_topics(request: Request, response: Response, subject_id: int, db: Session = Depends(get_db)):
+    cached = not_modified(request, response, db, versioning.TOPICS)
+    if cached:
+        return cached
+    return topic_cache.get_or_load(
+        (subject_id, request.state.data_versions),
+        lambda: [dict(row._mapping) for row in db.execute(
+            select(models.Topic.id, models.Topic.name, models.Topic.is_completed, models.Topic.subject_id)
+            .where(models.Topic.subject_id == subject_id))],
+    )
+
+# --- Sync (offline clients) ---
+
+class SyncGrades(BaseModel):
+    upserts: List[Grade]
+    deletes: List[int]
+
+class SyncSubjects(BaseModel):
+    upserts: List[Subject]
+    deletes: List[int]
+
+class SyncTopics(BaseModel):
+    upserts: List[Topic]
+    deletes: List[int]
+
+class SyncChanges(BaseModel):
+    cursor: str
+    reset: bool  # true: a full snapshot, replace everything held locally
+    has_more: bool
+    grades: SyncGrades
+    subjects: SyncSubjects
+    topics: SyncTopics
+
+class SyncTarget(BaseModel):
+    # An existing row by id, or one created by an earlier edit by that edit's id
+    id: Optional[int] = None
+    client_id: Optional[str] = None
+
+class SyncMutationIn(BaseModel):
+    id: str = Field(..., min_length=1, max_length=64)  # generated by the client, e.g. a UUID
+    op: str = Field(..., pattern=r"^(grade\.create|grade\.delete|topic\.create|topic\.set)$")
+    grade: Optional[GradeCreate] = None  # grade.create
+    topic: Optional[TopicCreate] = None  # topic.create
+    target: Optional[SyncTarget] = None  # grade.delete, topic.set
+    is_completed: Optional[bool] = None  # topic.set
+
+class SyncPushRequest(BaseModel):
+    student_id: int
+    mutations: List[SyncMutationIn] = Field(..., max_length=500)
+
+@app.get("/sync", response_model=SyncChanges)
+@query_budget.max_queries(7)
+def read_sync(student_id: int, since: Optional[str] = None, limit: int = Query(500, ge=1, le=5000), db: Session = Depends(get_db)):
+    # Changes after the cursor, or a full snapshot without one (see sync.py)
+    if not student_exists(db, student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    return sync.changes(db, student_id, since, limit)
+
+@app.post("/sync")
+def push_sync(request: SyncPushRequest, db: Session = Depends(get_db)):
+    # Edits queued offline, applied in order; resent edits are not applied twice
+    if not student_exists(db, request.student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    batch = sync.MutationBatch(db, request.student_id)
+    results = batch.apply(request.mutations)
+    try:
+        db.commit()
+    except IntegrityError:
+        # The same client ids, applied by a concurrent request
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Some of these edits were applied meanwhile, send the batch again")
+    if any(topic == versioning.TOPICS for topic, _, _ in batch.published):
+        topic_cache.invalidate()
+    for topic, event, data in batch.published:
+        events.publish(topic, event, data)
+    return {"results": results}
 
 # --- Prediction Endpoint ---
 
 class PredictionRequest(BaseModel):
     target_average: float
-    next_exam_weight: float = 1.0
+    next_exam_weight: float = Field(1.0, gt=0)
+
+class HypotheticalGrade(BaseModel):
+    value: float
+    subject_id: int
+
+class PredictionGridRequest(BaseModel):
+    scenarios: List[PredictionRequest]
+    extra_grades: List[HypotheticalGrade] = []
 
 @app.post("/prediction")
+@query_budget.max_queries(1)
 def predict_grade(request: PredictionRequest, student_id: int = 1, db: Session = Depends(get_db)):
-    # 1. Calculate current state
-    grades = db.query(models.Grade).filter(models.Grade.student_id == student_id).all()
-    
-    total_score = 0
-    total_weight = 0
-    
-    for grade in grades:
-        subject = db.query(models.Subject).filter(models.Subject.id == grade.subject_id).first()
-        if subject:
-            total_score += grade.value * subject.weighting
-            total_weight += subject.weighting
+    # 1. Calculate current state (weighted totals from the score aggregates)
+    total_score, total_weight = scoring.load_weighted_totals(db, student_id)
     
     if total_weight == 0:
         return {"required_grade": request.target_average, "message": "Noch keine Noten vorhanden."}
 
     # 2. Formula: x = ( T * (W + w) - Av*W ) / w
-    # Simplified: x = ( T * (W + w) - TotalScore ) / w
-    
-    target = request.target_average
-    w = request.next_exam_weight
-    W = total_weight
-    CurrentScore = total_score
-    
-    required_value = (target * (W + w) - CurrentScore) / w
-    required_value = round(required_value, 2)
+    required_value = scoring.required_grade(request.target_average, request.next_exam_weight, total_score, total_weight)
     
     return {
         "required_grade": required_value,
         "current_weight": total_weight,
-        "next_weight": w
+        "next_weight": request.next_exam_weight
     }
 
+@app.post("/prediction/grid")
+@query_budget.max_queries(2)
+def predict_grade_grid(request: PredictionGridRequest, student_id: int = 1, db: Session = Depends(get_db)):
+    # Required grade for many (target, weight) pairs from one read of the aggregates
+    total_score, total_weight = scoring.load_weighted_totals(db, student_id)
+
+    # Optional what-if grades on top of the real ones (unknown subjects are ignored, like real grades)
+    if request.extra_grades:
+        weightings = subject_weightings(db)
+        for extra in request.extra_grades:
+            if extra.subject_id in weightings:
+                total_score += extra.value * weightings[extra.subject_id]
+                total_weight += weightings[extra.subject_id]
+
+    results = []
+    for scenario in request.scenarios:
+        if total_weight == 0:
+            required_value = scenario.target_average
+        else:
+            required_value = scoring.required_grade(scenario.target_average, scenario.next_exam_weight, total_score, total_weight)
+        results.append({
+            "target_average": scenario.target_average,
+            "next_exam_weight": scenario.next_exam_weight,
+            "required_grade": required_value
+        })
+
+    return {
+        "current_weight": total_weight,
+        "results": results
+    }
+
+class PassProbabilityRequest(BaseModel):
+    samples: int = Field(probability.DEFAULT_SAMPLES, ge=1000, le=200000)
+    seed: Optional[int] = None # default: derived from the data, so equal data gives equal answers
+
+@app.post("/students/{student_id}/pass-probability")
+@query_budget.max_queries(3)
+def estimate_pass_probability(student_id: int, request: Optional[PassProbabilityRequest] = None, db: Session = Depends(get_db)):
+    # Monte Carlo over the parts without grades yet (see probability.py);
+    # cached until the student's data version changes
+    request = request or PassProbabilityRequest()
+    versions = tuple(versioning.read(db, *versioning.student_keys(student_id)))
+    key = (student_id, versions, request.samples, request.seed)
+    cached = probability.results.get(key)
+    if cached is not None:
+        return cached
+
+    if not student_exists(db, student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    seed = request.seed if request.seed is not None else f"{student_id}:{versions}"
+    result = {"student_id": student_id, **probability.estimate(probability.load_history(db, student_id), request.samples, seed)}
+    probability.results.put(key, result)
+    return result
+
 # --- AI Chat Endpoint ---
 
 class ChatRequest(BaseModel):
     message: str
+    student_id: Optional[int] = None # lets answers use the student's grades
 
 @app.post("/chat")
-def chat_bot(request: ChatRequest):
-    msg = request.message.lower()
-    
-    # Simple keyword-based mocked AI for now
-    if "hallo" in msg:
-        return {"response": "Hi! Bereit zum Lernen? 📚"}
-    elif "mathe" in msg:
-        return {"response": "Mathe kann knifflig sein. Probiere es mit Übungsaufgaben zu Brüchen!"}
-    elif "deutsch" in msg:
-        return {"response": "Für Deutsch empfehle ich: Lesen, Lesen, Lesen! 📖"}
-    elif "prüfung" in msg:
-        return {"response": "Keine Panik vor der Prüfung. Atme tief durch und geh Schritt für Schritt vor."}
-    else:
-        return {"response": "Das ist interessant. Erzähl mir mehr oder frag mich nach einem bestimmten Fach."}
+@query_budget.max_queries(3)
+def chat_bot(request: ChatRequest, db: Session = Depends(get_db)):
+    # Intent catalogue in chat_intents.json, matched in one pass (see chat.py)
+    return chat.answer(db, request.message, request.student_id)
 
 @app.post("/reset")
+@query_budget.max_queries(8)
 def reset_demo(student_id: int = 1, db: Session = Depends(get_db)):
     # Delete all grades for student
-    db.query(models.Grade).filter(models.Grade.student_id == student_id).delete()
+    sync.record_student_deleted(db, student_id)
+    db.execute(delete(models.Grade).where(models.Grade.student_id == student_id))
+    aggregates.remove_student(db, student_id)
     
-    # Reset all topics to not completed
-    topics = db.query(models.Topic).all()
-    for t in topics:
-        t.is_completed = 0
+    # Reset topics to not completed. Topics are shared (there is no
+    # per-student progress), so this covers every completed topic.
+    sync.record_topics_reset(db)
+    db.execute(update(models.Topic).where(models.Topic.is_completed != 0).values(is_completed=0))
     
+    versioning.bump(db, versioning.student_key(student_id), versioning.TOPICS)
     db.commit()
+    topic_cache.invalidate()
+    events.publish(versioning.student_key(student_id), "grades.reset", {"student_id": student_id})
+    events.publish(versioning.TOPICS, "topics.reset", {})
     return {"message": "Demo reset successful"}
 
@@ -0,0 +1,283 @@
+import bisect
+import contextvars
+import threading
+import time
+
+# Prometheus metrics, stdlib only.
+#
+# A handful of counter/gauge/histogram types that render the text
+# exposition format (version 0.0.4) for GET /metrics. What is measured:
+#   - every request: count and latency per route template (not per URL,
+#     so /grades/1 and /grades/2 are one series)
+#   - SQL: statements and time per request (cursor events, summed in a
+#     per-request ContextVar) and a histogram over single statements
+#   - connection pool: checkout wait, connections in use / overflow
+#   - password hashing: time per bcrypt call, calls refused as busy
+#   - Starlette's threadpool: threads in use and tasks queued for one
+#
+# Values are per process. With several uvicorn workers each one keeps
+# its own numbers, so scrape every worker (or run one per port).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+HASH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        with _lock:
+            _registry.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+                for key, value in sorted(self.values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        # function: called at scrape time, returns {label tuple: value}
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, *labels, value):
+        with _lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        values = self.function() if self.function else self.values
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            state = self.values.get(labels)
+            if state is None:
+                # per-bucket counts (last one is +Inf), sum, count
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        with _lock:
+            body = metric.render()
+        lines += metric.header() + body
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Metrics ---
+
+http_requests = Counter(
+    "notenpfad_http_requests_total", "HTTP requests by route template and status",
+    ("method", "route", "status"))
+http_latency = Histogram(
+    "notenpfad_http_request_duration_seconds", "HTTP request latency until the response is complete",
+    ("method", "route"))
+http_in_progress = Gauge(
+    "notenpfad_http_requests_in_progress", "HTTP requests currently being handled")
+
+db_statements = Histogram(
+    "notenpfad_db_statements_per_request", "SQL statements executed per request",
+    ("route",), COUNT_BUCKETS)
+db_request_time = Histogram(
+    "notenpfad_db_time_per_request_seconds", "Time spent in SQL statements per request",
+    ("route",), QUERY_BUCKETS + (2.5, 5.0))
+db_statement_time = Histogram(
+    "notenpfad_db_statement_duration_seconds", "Duration of single SQL statements",
+    (), QUERY_BUCKETS)
+db_pool_wait = Histogram(
+    "notenpfad_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+    (), QUERY_BUCKETS + (2.5, 5.0, 10.0, 30.0))
+
+password_hash_time = Histogram(
+    "notenpfad_password_hash_duration_seconds", "bcrypt hash/verify time, including queueing for a worker",
+    ("operation",), HASH_BUCKETS)
+password_hash_rejected = Counter(
+    "notenpfad_password_hash_rejected_total", "bcrypt calls refused because the hash pool was saturated",
+    ("operation",))
+
+# --- SQLAlchemy instrumentation ---
+
+# [statements, seconds] of the current request. The object is created by
+# the middleware; Starlette copies the context into its worker threads,
+# so the sync endpoints add to the same list.
+_request_db = contextvars.ContextVar("notenpfad_request_db", default=None)
+
+
+def instrument_engine(engine):
+    # Imported here: passwords imports this module in its worker processes
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        db_statement_time.observe(elapsed)
+        current = _request_db.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute
+        started = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    # Pool checkout wait: time spent inside pool.connect()
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+    def pool_state():
+        state = {}
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            method = getattr(pool, name, None)
+            if callable(method):
+                state[(name,)] = method()
+        return state
+
+    Gauge("notenpfad_db_pool_connections", "Connection pool state (size, checkedout, overflow, checkedin); overflow is negative while the pool has spare room",
+          ("state",), pool_state)
+
+# --- Threadpool ---
+
+_threadpool = {}
+
+
+def sample_threadpool():
+    # Call from the event loop (the anyio limiter is per loop)
+    from anyio import to_thread
+    limiter = to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    _threadpool.update({
+        ("capacity",): limiter.total_tokens,
+        ("busy",): statistics.borrowed_tokens,
+        ("waiting",): statistics.tasks_waiting,
+    })
+
+
+Gauge("notenpfad_threadpool_threads", "Starlette threadpool: capacity, threads busy, tasks waiting for a thread",
+      ("state",), lambda: dict(_threadpool))
+
+# --- ASGI middleware ---
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        db_usage = [0, 0.0]
+        token = _request_db.set(db_usage)
+        http_in_progress.inc(amount=1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_progress.inc(amount=-1)
+            _request_db.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            http_requests.inc(method, template, str(status[0]))
+            http_latency.observe(elapsed, method, template)
+            db_statements.observe(db_usage[0], template)
+            db_request_time.observe(db_usage[1], template)
@@ -0,0 +1,152 @@
+import sys
+
+from sqlalchemy.schema import CreateIndex, CreateTable
+import database
+
+# Schema migrations for existing SQLite databases.
+#
+# SQLite can't ALTER a foreign key, so a table whose constraints differ
+# from models.py (e.g. a database.db created before the ON DELETE
+# CASCADE clauses), or that lacks one of its columns, is rebuilt the
+# way the SQLite docs describe: with foreign keys off, create the new
+# table, copy the rows, drop the old one, rename, recreate the indexes
+# and run foreign_key_check, all in one transaction.
+#
+# Rows that reference a parent which no longer exists are not copied,
+# since the cascade would have deleted them.
+#
+# Runs at startup (a no-op once the schema matches) and as a CLI:
+#   python migrations.py          -> migrate
+#   python migrations.py check    -> list tables that need a rebuild, exit 1 if any
+
+
+def _expected_foreign_keys(table):
+    return sorted(
+        (fk.parent.name, fk.column.table.name, (fk.ondelete or "NO ACTION").upper())
+        for fk in table.foreign_keys
+    )
+
+
+def _actual_foreign_keys(cursor, table_name):
+    # foreign_key_list rows: (id, seq, table, from, to, on_update, on_delete, match)
+    rows = cursor.execute(f"PRAGMA foreign_key_list({table_name})").fetchall()
+    return sorted((row[3], row[2], row[6].upper()) for row in rows)
+
+
+def _table_exists(cursor, table_name):
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+
+def _missing_columns(cursor, table):
+    actual = {row[1] for row in cursor.execute(f"PRAGMA table_info({table.name})")}
+    return [column.name for column in table.columns if column.name not in actual]
+
+
+def outdated_tables(cursor):
+    # New columns come out of the rebuild as NULL (or their server default)
+    return [
+        table for table in database.Base.metadata.sorted_tables
+        if _table_exists(cursor, table.name)
+        and (_actual_foreign_keys(cursor, table.name) != _expected_foreign_keys(table)
+             or _missing_columns(cursor, table))
+    ]
+
+
+def _rebuild(cursor, table):
+    dialect = database.engine.dialect
+    new_name = f"_new_{table.name}"
+    create = str(CreateTable(table).compile(dialect=dialect)).strip()
+    cursor.execute(create.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {new_name} ", 1))
+
+    old_columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table.name})")}
+    columns = ", ".join(column.name for column in table.columns if column.name in old_columns)
+    orphan_filters = [
+        f"({fk.parent.name} IS NULL OR {fk.parent.name} IN "
+        f"(SELECT {fk.column.name} FROM {fk.column.table.name}))"
+        for fk in table.foreign_keys
+        if fk.ondelete and fk.ondelete.upper() == "CASCADE"
+    ]
+    where = f" WHERE {' AND '.join(orphan_filters)}" if orphan_filters else ""
+    total = cursor.execute(f"SELECT COUNT(*) FROM {table.name}").fetchone()[0]
+    cursor.execute(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}{where}")
+    copied = cursor.execute(f"SELECT COUNT(*) FROM {new_name}").fetchone()[0]
+
+    cursor.execute(f"DROP TABLE {table.name}")
+    cursor.execute(f"ALTER TABLE {new_name} RENAME TO {table.name}")
+    for index in table.indexes:
+        cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+    return total - copied
+
+
+def migrate():
+    # -> {table name: orphaned rows dropped} for every rebuilt table
+    if not database.IS_SQLITE:
+        return {}
+
+    connection = database.engine.raw_connection()
+    dbapi_connection = connection.driver_connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None  # explicit BEGIN/COMMIT below
+    cursor = dbapi_connection.cursor()
+    rebuilt = {}
+    try:
+        if not outdated_tables(cursor):
+            return rebuilt
+
+        # Must be set outside a transaction; restored in finally
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        # IMMEDIATE: with several workers starting at once, one migrates
+        # and the others wait, then find nothing left to do
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for table in outdated_tables(cursor):
+                rebuilt[table.name] = _rebuild(cursor, table)
+            violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+            if violations:
+                raise RuntimeError(f"Foreign key violations after migration: {violations[:10]}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        dbapi_connection.isolation_level = isolation_level
+        connection.close()
+    return rebuilt
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "migrate"
+    if command not in ("migrate", "check"):
+        print("Usage: python migrations.py [migrate|check]")
+        return 2
+    if not database.IS_SQLITE:
+        print("Nothing to do: migrations only apply to SQLite databases")
+        return 0
+
+    database.init_db()
+    if command == "check":
+        connection = database.engine.raw_connection()
+        try:
+            outdated = [table.name for table in outdated_tables(connection.driver_connection.cursor())]
+        finally:
+            connection.close()
+        for name in outdated:
+            print(f"Needs rebuild: {name}")
+        if not outdated:
+            print("Schema is up to date")
+        return 1 if outdated else 0
+
+    rebuilt = migrate()
+    for name, dropped in rebuilt.items():
+        print(f"Rebuilt {name}" + (f" ({dropped} orphaned rows dropped)" if dropped else ""))
+    if not rebuilt:
+        print("Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
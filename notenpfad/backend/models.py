@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -8,9 +8,10 @@ class Student(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     target_school = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id")) # Link to login account
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE")) # Link to login account
 
-    grades = relationship("Grade", back_populates="student")
+    # passive_deletes: the database cascades, the ORM doesn't load rows to delete them
+    grades = relationship("Grade", back_populates="student", passive_deletes=True)
     user = relationship("User", back_populates="student_profile")
 
 class Subject(Base):
@@ -20,8 +21,8 @@ class Subject(Base):
     name = Column(String, unique=True, index=True)
     weighting = Column(Float, default=1.0)
 
-    grades = relationship("Grade", back_populates="subject")
-    topics = relationship("Topic", back_populates="subject")
+    grades = relationship("Grade", back_populates="subject", passive_deletes=True)
+    topics = relationship("Topic", back_populates="subject", passive_deletes=True)
 
 class Topic(Base):
     __tablename__ = "topics"
@@ -29,19 +30,25 @@ class Topic(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     is_completed = Column(Integer, default=0) # 0 = false, 1 = true (SQLite has no bool)
-    subject_id = Column(Integer, ForeignKey("subjects.id"))
+    subject_id = Column(Integer, ForeignKey("subjects.id", ondelete="CASCADE"), index=True)
 
     subject = relationship("Subject", back_populates="topics")
 
 class Grade(Base):
     __tablename__ = "grades"
+    __table_args__ = (
+        # Every hot query filters on student_id, most also on subject/type
+        Index("ix_grades_student_subject_type", "student_id", "subject_id", "type"),
+        # Keyset pagination / sorted history: WHERE student_id = ? ORDER BY date, id
+        Index("ix_grades_student_date_id", "student_id", "date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     value = Column(Float)
     date = Column(Date)
     type = Column(String) # e.g., "Exam", "Oral"
-    student_id = Column(Integer, ForeignKey("students.id"))
-    subject_id = Column(Integer, ForeignKey("subjects.id"))
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"))
+    subject_id = Column(Integer, ForeignKey("subjects.id", ondelete="CASCADE"))
 
     student = relationship("Student", back_populates="grades")
     subject = relationship("Subject", back_populates="grades")
@@ -57,4 +64,78 @@ class User(Base):
 
     children = relationship("User", back_populates="parent", remote_side=[id])
     parent = relationship("User", back_populates="children", remote_side=[parent_id])
-    student_profile = relationship("Student", back_populates="user", uselist=False)
+    student_profile = relationship("Student", back_populates="user", uselist=False, passive_deletes=True)
+
+class StudentScoreAggregate(Base):
+    # Running per-(student, subject, type) totals, maintained by the grade write endpoints
+    __tablename__ = "student_score_aggregates"
+
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id", ondelete="CASCADE"), primary_key=True)
+    type = Column(String, primary_key=True)
+    value_sum = Column(Float, default=0.0)
+    value_count = Column(Integer, default=0)
+    weighted_sum = Column(Float, default=0.0) # sum of value * subject.weighting
+
+class DataVersion(Base):
+    # Change counters behind the ETags: "student:<id>", "subjects", "topics", "epoch"
+    __tablename__ = "data_versions"
+
+    key = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+class AnalysisJob(Base):
+    # Exam scan analysis, queued by POST /analyze-exam and run in the background (see jobs.py)
+    __tablename__ = "analysis_jobs"
+    __table_args__ = (
+        # The dispatcher picks the oldest queued job
+        Index("ix_analysis_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, nullable=False, default="queued") # queued, running, done, failed
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), nullable=True)
+    create_grade = Column(Integer, default=0) # 1 = store the recognised grade on completion
+    filename = Column(String)
+    content_type = Column(String)
+    path = Column(String) # the scan on disk
+    size = Column(Integer)
+    analyzer = Column(String)
+    attempts = Column(Integer, default=0)
+    worker_pid = Column(Integer) # process running the job, to requeue it if that process died
+    worker_boot = Column(String) # jobs.BOOT_ID of that process; PIDs come back after a restart
+    result = Column(Text) # JSON from the analyzer
+    error = Column(String)
+    grade_id = Column(Integer) # grade created from the result, if any
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class ChangeLog(Base):
+    # One row per write to grades, subjects and topics; the id is the sync cursor (see sync.py)
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # GET /sync: a student's entries (and the shared ones, student_id NULL) after a cursor
+        Index("ix_change_log_student_id_id", "student_id", "id"),
+        Index("ix_change_log_entity", "entity", "entity_id"),
+        # Ids must never be handed out again after compaction deleted the newest rows
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False) # grade, subject, topic
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False) # upsert, delete
+    student_id = Column(Integer) # owner of a grade; NULL for subjects and topics. No FK: tombstones outlive the student
+    created_at = Column(DateTime, nullable=False)
+
+class SyncMutation(Base):
+    # Offline edits applied by POST /sync, by client-generated id, so a resent batch is not applied twice
+    __tablename__ = "sync_mutations"
+
+    client_id = Column(String, primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), index=True)
+    op = Column(String, nullable=False)
+    entity_id = Column(Integer) # grade or topic the edit created or changed
+    result = Column(Text) # JSON returned to the client
+    applied_at = Column(DateTime, nullable=False)
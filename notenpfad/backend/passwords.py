@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from passlib.context import CryptContext
+import metrics
+
+# Password hashing off the request threads.
+#
+# bcrypt costs ~250 ms of CPU per call. Running it inline in the sync
+# endpoints ties up Starlette's threadpool (40 threads) during a burst
+# of logins, and every other request queues behind the hashes. Instead
+# the work goes to a small dedicated process pool. At most
+# HASH_WORKERS + HASH_QUEUE_DEPTH calls may be in flight; anything
+# beyond that is refused right away with HashPoolBusy (-> 503), so the
+# number of request threads blocked on hashing stays bounded.
+#
+# Settings (environment):
+#   NOTENPFAD_BCRYPT_ROUNDS      bcrypt cost (default 12). Existing hashes
+#                                with another cost are rehashed on login.
+#   NOTENPFAD_HASH_WORKERS       worker processes (default min(4, cpus));
+#                                0 hashes in the calling thread instead.
+#   NOTENPFAD_HASH_QUEUE_DEPTH   extra calls allowed to wait (default 4 per worker)
+#   NOTENPFAD_HASH_TIMEOUT       seconds to wait for a result before giving
+#                                up with a 503 (default 10)
+#   NOTENPFAD_HASH_RETRY_AFTER   Retry-After seconds on 503 (default 1)
+#   NOTENPFAD_HASH_NICE          niceness added to the workers (default 5),
+#                                so request handling wins the CPU
+
+BCRYPT_ROUNDS = int(os.getenv("NOTENPFAD_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("NOTENPFAD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_DEPTH = int(os.getenv("NOTENPFAD_HASH_QUEUE_DEPTH", str(4 * max(HASH_WORKERS, 1))))
+HASH_TIMEOUT = float(os.getenv("NOTENPFAD_HASH_TIMEOUT", "10"))
+RETRY_AFTER = int(os.getenv("NOTENPFAD_HASH_RETRY_AFTER", "1"))
+HASH_NICE = int(os.getenv("NOTENPFAD_HASH_NICE", "5"))
+
+# min == max == default: a hash with any other cost "needs update"
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashPoolBusy(Exception):
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+_slots = threading.BoundedSemaphore(max(HASH_WORKERS, 1) + HASH_QUEUE_DEPTH)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Run inside the worker processes (module level so they can be pickled)
+def _init_worker(niceness):
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the server process already runs threads
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(HASH_NICE,),
+            )
+        return _executor
+
+
+def _run(operation, fn, *args):
+    if not _slots.acquire(blocking=False):
+        metrics.password_hash_rejected.inc(operation)
+        raise HashPoolBusy()
+    started = time.perf_counter()
+    try:
+        if HASH_WORKERS <= 0:
+            try:
+                return fn(*args)
+            finally:
+                _slots.release()
+        try:
+            future = _get_executor().submit(fn, *args)
+        except BaseException:
+            _slots.release()
+            raise
+        # The slot is freed when the pool is done with the call, not when
+        # we stop waiting: a hash that is already running can't be
+        # cancelled, and it still occupies a worker
+        future.add_done_callback(lambda _: _slots.release())
+        try:
+            return future.result(timeout=HASH_TIMEOUT)
+        except FutureTimeout:
+            future.cancel()
+            metrics.password_hash_rejected.inc(operation)
+            raise HashPoolBusy()
+    finally:
+        metrics.password_hash_time.observe(time.perf_counter() - started, operation)
+
+
+def hash_password(password):
+    return _run("hash", _hash, password)
+
+
+def verify_password(password, hashed_password):
+    # Returns (valid, new_hash). new_hash is set when the stored hash used
+    # another bcrypt cost and should be replaced.
+    return _run("verify", _verify_and_update, password, hashed_password)
+
+
+def start():
+    # Spawn the workers up front so the first login doesn't pay for it
+    if HASH_WORKERS > 0:
+        executor = _get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(HASH_WORKERS)]:
+            future.result()
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,187 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+
+# SQL query budgets per endpoint, and an N+1 detector.
+#
+# Endpoints declare how many statements a request may issue:
+#
+#     @app.get("/subjects/")
+#     @query_budget.max_queries(2)
+#     def read_subjects(...):
+#
+# (max_queries must sit below the route decorator, so FastAPI registers
+# the marked function.) Enforcement is opt-in via NOTENPFAD_QUERY_BUDGET:
+#   off    (default) nothing is recorded
+#   warn   log budget overruns and N+1 patterns, add X-Query-Count
+#   error  like warn, but a request over budget or with an N+1 pattern
+#          answers 500 instead, so verify scripts and tests fail loudly
+#          (the endpoint has already run; only the response is replaced)
+#
+# An N+1 pattern is the same SQL text executed N_PLUS_ONE_REPEATS or
+# more times with different parameters within one request, i.e. a
+# query in a loop. Statements run once per batch of rows rather than
+# once per row (executemany, or anything inside per_batch()) don't count.
+# For code outside a request (scripts, pytest) there is the
+# record_queries() context manager and the query_budget_guard fixture
+# (conftest.py).
+
+MODE = os.getenv("NOTENPFAD_QUERY_BUDGET", "off").lower()
+N_PLUS_ONE_REPEATS = int(os.getenv("NOTENPFAD_N_PLUS_ONE_REPEATS", "3"))
+
+logger = logging.getLogger("notenpfad.query_budget")
+
+_recorder = contextvars.ContextVar("notenpfad_query_recorder", default=None)
+_per_batch = contextvars.ContextVar("notenpfad_query_per_batch", default=False)
+_instrumented = set()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def max_queries(budget):
+    def mark(endpoint):
+        endpoint.__query_budget__ = budget
+        return endpoint
+    return mark
+
+
+class QueryRecorder:
+    def __init__(self):
+        # (sql text, parameters, batched) per executed statement
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def n_plus_one(self, repeats=None):
+        # -> [(sql text, times executed)] for statements run in a loop
+        repeats = repeats or N_PLUS_ONE_REPEATS
+        seen = {}
+        for statement, params, batched in self.statements:
+            if batched:
+                # executemany, or per_batch() (e.g. the bulk import's batches)
+                continue
+            entry = seen.setdefault(statement, [set(), 0])
+            entry[0].add(repr(params))
+            entry[1] += 1
+        return [(statement, times) for statement, (distinct, times) in seen.items() if len(distinct) >= repeats]
+
+    def problems(self, budget=None):
+        found = []
+        if budget is not None and self.count > budget:
+            found.append(f"{self.count} queries, budget is {budget}")
+        for statement, times in self.n_plus_one():
+            found.append(f"N+1: executed {times}x: {' '.join(statement.split())[:200]}")
+        return found
+
+
+def instrument_engine(engine):
+    if engine in _instrumented:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.statements.append((statement, parameters, executemany or _per_batch.get()))
+
+    _instrumented.add(engine)
+
+
+@contextlib.contextmanager
+def record_queries(engine=None):
+    # with record_queries() as recorder: ...  -> recorder.count, recorder.problems()
+    if engine is None:
+        import database
+        engine = database.engine
+    instrument_engine(engine)
+    recorder = QueryRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextlib.contextmanager
+def per_batch():
+    # with per_batch(): ...  -> statements that repeat once per batch of
+    # rows, not once per row, so they are no N+1 pattern
+    token = _per_batch.set(True)
+    try:
+        yield
+    finally:
+        _per_batch.reset(token)
+
+
+@contextlib.contextmanager
+def assert_max_queries(budget, engine=None):
+    with record_queries(engine) as recorder:
+        yield recorder
+    problems = recorder.problems(budget)
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems))
+
+
+class QueryBudgetMiddleware:
+    # Records the statements of each request. Headers go out once the
+    # endpoint has returned, so the count (and the budget check) covers
+    # everything but the body of a streaming response.
+
+    def __init__(self, app, mode=None):
+        self.app = app
+        self.mode = mode or MODE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        replaced = [False]
+
+        async def checked_send(message):
+            if replaced[0]:
+                return
+            if message["type"] == "http.response.start":
+                budget = getattr(scope.get("endpoint"), "__query_budget__", None)
+                problems = recorder.problems(budget)
+                if problems:
+                    logger.warning("%s %s: %s", scope["method"], scope["path"], "; ".join(problems))
+                if problems and self.mode == "error":
+                    replaced[0] = True
+                    body = json.dumps({"detail": "Query budget exceeded", "problems": problems}).encode()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"x-query-count", str(recorder.count).encode()),
+                        ],
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-query-count", str(recorder.count).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, checked_send)
+        finally:
+            _recorder.reset(token)
+
+
+def install(app, engine):
+    # Called by main before the CORS middleware is added, so this one
+    # sits inside it and its 500s still carry CORS headers
+    if MODE not in ("warn", "error"):
+        return
+    instrument_engine(engine)
+    app.add_middleware(QueryBudgetMiddleware)
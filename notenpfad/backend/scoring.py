@@ -0,0 +1,84 @@
+from sqlalchemy import func
+import models
+import scoring_rules
+
+# Gymi score, evaluated over per-(subject, type) buckets of (sum, count)
+# instead of the raw grade rows. The rules themselves are data
+# (scoring_rules.json), compiled once when this module is imported.
+
+RULES = scoring_rules.load()
+
+
+def load_buckets(db, student_id):
+    # Read the student's maintained aggregates -> {(subject_name, type): (sum, count)}
+    rows = (
+        db.query(
+            models.Subject.name,
+            models.StudentScoreAggregate.type,
+            models.StudentScoreAggregate.value_sum,
+            models.StudentScoreAggregate.value_count,
+        )
+        .join(models.Subject, models.StudentScoreAggregate.subject_id == models.Subject.id)
+        .filter(models.StudentScoreAggregate.student_id == student_id)
+        .all()
+    )
+    return {(name, g_type): (total, count) for name, g_type, total, count in rows}
+
+
+def load_family_buckets(db, student_ids):
+    # Buckets for several students from one grouped query over grades
+    # -> {student_id: ({(subject_name, type): (sum, count)}, grade_count, last_date)}
+    rows = (
+        db.query(
+            models.Grade.student_id,
+            models.Subject.name,
+            models.Grade.type,
+            func.sum(models.Grade.value),
+            func.count(models.Grade.value),
+            func.max(models.Grade.date),
+        )
+        .join(models.Subject, models.Grade.subject_id == models.Subject.id)
+        .filter(models.Grade.student_id.in_(student_ids))
+        .group_by(models.Grade.student_id, models.Subject.name, models.Grade.type)
+        .all()
+    )
+    family = {student_id: ({}, 0, None) for student_id in student_ids}
+    for student_id, name, g_type, total, count, last_date in rows:
+        buckets, grade_count, latest = family[student_id]
+        buckets[(name, g_type)] = (total, count)
+        if last_date is not None and (latest is None or last_date > latest):
+            latest = last_date
+        family[student_id] = (buckets, grade_count + count, latest)
+    return family
+
+
+def load_weighted_totals(db, student_id):
+    # (sum of value * weighting, sum of weightings) over the student's grades, one joined query
+    total_score, total_weight = (
+        db.query(
+            func.coalesce(func.sum(models.StudentScoreAggregate.weighted_sum), 0.0),
+            func.coalesce(func.sum(models.StudentScoreAggregate.value_count * models.Subject.weighting), 0.0),
+        )
+        .join(models.Subject, models.StudentScoreAggregate.subject_id == models.Subject.id)
+        .filter(models.StudentScoreAggregate.student_id == student_id)
+        .one()
+    )
+    return total_score, total_weight
+
+
+def required_grade(target, next_weight, total_score, total_weight):
+    # x = ( T * (W + w) - TotalScore ) / w
+    return round((target * (total_weight + next_weight) - total_score) / next_weight, 2)
+
+
+def add_grades(buckets, grades):
+    # Copy of buckets with hypothetical (subject_name, type, value) grades added
+    buckets = dict(buckets)
+    for subject, g_type, value in grades:
+        total, count = buckets.get((subject, g_type), (0.0, 0))
+        buckets[(subject, g_type)] = (total + value, count + 1)
+    return buckets
+
+
+def gymi_score(buckets):
+    return RULES.evaluate(buckets)
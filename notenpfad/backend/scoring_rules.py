@@ -0,0 +1,138 @@
+import json
+import os
+
+# Declarative score rules, compiled once into plain closures.
+#
+# The rules live in scoring_rules.json (or the file NOTENPFAD_SCORING_RULES
+# points to), so another school's formula is a config change, not code.
+# The tree has two node kinds:
+#
+#   {"key": "math", "subject": "Mathematik", "types": [...] or "<group>"}
+#       average over all grades of those types in that subject; a string
+#       names a list under "type_groups"
+#   {"key": "exam", "mean": [node, ...], "weights": [...]}
+#       weighted mean of the children that have a value. Weights default
+#       to 1 and are renormalised over the children present, so a missing
+#       part falls back to the others (50/50, or 100% of what exists)
+#
+# "score" is the root and must be a mean node. Every node below it shows
+# up in "details" under its key: leaves as their rounded value, mean
+# nodes as {"value": ..., <child keys>: ...}.
+#
+# Evaluation only reads bucket aggregates {(subject, type): (sum, count)},
+# so one scenario costs a few microseconds however many grades it covers.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+
+
+class RulesError(ValueError):
+    pass
+
+
+def _round(value):
+    return round(value, 2) if value else None
+
+
+def _compile_leaf(node, type_groups, path, leaves):
+    types = node.get("types")
+    if isinstance(types, str):
+        if types not in type_groups:
+            raise RulesError(f"{path}: unknown type group {types!r}")
+        types = type_groups[types]
+    if not isinstance(types, list) or not types:
+        raise RulesError(f"{path}: 'types' must be a non-empty list or a type group name")
+    # Summed in the listed order, so results are bit-for-bit reproducible
+    keys = [(node["subject"], grade_type) for grade_type in types]
+    leaves.append({"path": path, "subject": node["subject"], "types": list(types)})
+
+    def leaf(buckets):
+        total = 0.0
+        count = 0
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket:
+                total += bucket[0]
+                count += bucket[1]
+        value = total / count if count else None
+        return value, _round(value)
+
+    return leaf
+
+
+def _compile_mean(node, type_groups, path, leaves):
+    children = node["mean"]
+    if not isinstance(children, list) or not children:
+        raise RulesError(f"{path}: 'mean' must be a non-empty list")
+    weights = node.get("weights", [1] * len(children))
+    if len(weights) != len(children) or any(weight <= 0 for weight in weights):
+        raise RulesError(f"{path}: 'weights' needs one positive number per child")
+
+    parts = []
+    for index, child in enumerate(children):
+        key = child.get("key") if isinstance(child, dict) else None
+        if not key or key == "value":
+            raise RulesError(f"{path}[{index}]: every child needs a 'key' (other than 'value')")
+        parts.append((key, weights[index], _compile(child, type_groups, f"{path}.{key}", leaves)))
+
+    def mean(buckets):
+        details = {"value": None}
+        total = 0.0
+        weight = 0
+        for key, child_weight, evaluate in parts:
+            value, details[key] = evaluate(buckets)
+            if value is not None:
+                total += value * child_weight
+                weight += child_weight
+        value = total / weight if weight else None
+        details["value"] = _round(value)
+        return value, details
+
+    return mean
+
+
+def _compile(node, type_groups, path, leaves):
+    if not isinstance(node, dict):
+        raise RulesError(f"{path}: expected an object")
+    if "subject" in node:
+        return _compile_leaf(node, type_groups, path, leaves)
+    if "mean" in node:
+        return _compile_mean(node, type_groups, path, leaves)
+    raise RulesError(f"{path}: a node needs either 'subject' or 'mean'")
+
+
+class ScoreRules:
+    def __init__(self, spec):
+        self.name = spec.get("name", "")
+        self.pass_threshold = float(spec["pass_threshold"])
+        root = spec.get("score")
+        if not isinstance(root, dict) or "mean" not in root:
+            raise RulesError("score: the root must be a 'mean' node")
+        # Every leaf: {"path": "score.exam.math", "subject": ..., "types": [...]}
+        self.leaves = []
+        self._root = _compile(root, spec.get("type_groups", {}), "score", self.leaves)
+
+    def value(self, buckets):
+        # Unrounded score, None if no rule has any grade
+        return self._root(buckets)[0]
+
+    def evaluate(self, buckets):
+        # buckets: {(subject_name, type): (sum, count)} -> score dict as served by /average/
+        value, details = self._root(buckets)
+        del details["value"]
+        if value is None:
+            value = 0.0
+        return {
+            "average": round(value, 2),
+            "details": details,
+            "passed": value >= self.pass_threshold,
+        }
+
+
+def load(path=None):
+    path = path or os.getenv("NOTENPFAD_SCORING_RULES") or DEFAULT_PATH
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    try:
+        return ScoreRules(spec)
+    except (KeyError, TypeError) as e:
+        raise RulesError(f"{path}: invalid rules ({e!r})")
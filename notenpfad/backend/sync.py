@@ -0,0 +1,483 @@
+import base64
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, delete, func, insert, literal, or_, select, update
+import models, database, aggregates, versioning
+
+# Delta sync for offline-capable clients.
+#
+# Every write to grades, subjects and topics adds a change_log row in the
+# same transaction: (entity, entity_id, op), op "upsert" or "delete" (a
+# tombstone), plus the owning student for grades. The log id is the sync
+# cursor. Rows the database deletes by cascade (a subject's grades and
+# topics, a student's grades) are logged by the caller right before the
+# DELETE, with one INSERT ... SELECT.
+#
+# GET /sync?student_id=&since= answers with what changed after the
+# cursor. Only the newest entry per row counts: upserts carry the row as
+# it is now, deletes only its id. Without a cursor, with a cursor from
+# before the compaction floor or from another database, the client gets
+# a full snapshot and reset=true instead.
+#
+# Compaction runs every COMPACT_SECONDS in each worker (it is idempotent):
+#   - entries superseded by a later entry for the same row are deleted;
+#     that never changes what a client receives
+#   - entries older than RETENTION_DAYS are deleted and the floor raised
+#     past them; clients still behind it get a snapshot
+#
+# POST /sync applies a batch of edits a client queued while offline. Each
+# edit carries a client-generated id. Applied ids are kept in
+# sync_mutations (for RETENTION_DAYS), so a batch that is sent again
+# after a lost response is answered from there instead of applied twice.
+# Edits can refer to a grade or topic created earlier by its client id.
+#
+# Settings (environment):
+#   NOTENPFAD_SYNC_RETENTION_DAYS   how long the log covers (default 30)
+#   NOTENPFAD_SYNC_COMPACT_SECONDS  compaction interval (default 3600, 0 = off)
+
+RETENTION_DAYS = float(os.getenv("NOTENPFAD_SYNC_RETENTION_DAYS", "30"))
+COMPACT_SECONDS = float(os.getenv("NOTENPFAD_SYNC_COMPACT_SECONDS", "3600"))
+FLOOR = "sync_floor"  # data_versions key: log ids up to here are compacted away
+
+CL = models.ChangeLog
+SM = models.SyncMutation
+DV = models.DataVersion
+
+logger = logging.getLogger("notenpfad.sync")
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# --- Writing the log (caller commits) ---
+
+
+def record(db, entity, entity_ids, op, student_id=None):
+    if not entity_ids:
+        return
+    now = _now()
+    db.execute(insert(CL), [
+        {"entity": entity, "entity_id": entity_id, "op": op, "student_id": student_id, "created_at": now}
+        for entity_id in entity_ids
+    ])
+
+
+def record_grades(db, grades):
+    # grades: (id, student_id) pairs, e.g. from a bulk INSERT ... RETURNING
+    now = _now()
+    rows = [{"entity": "grade", "entity_id": grade_id, "op": "upsert", "student_id": student_id, "created_at": now}
+            for grade_id, student_id in grades]
+    if rows:
+        db.execute(insert(CL), rows)
+
+
+def _record_select(db, entity, op, id_column, student_column, *criteria):
+    # Log every row matching criteria, in one INSERT ... SELECT
+    db.execute(insert(CL).from_select(
+        ["entity", "entity_id", "op", "student_id", "created_at"],
+        select(literal(entity), id_column, literal(op), student_column, literal(_now())).where(*criteria),
+    ))
+
+
+def record_student_deleted(db, student_id):
+    # Before deleting a student or all their grades
+    G = models.Grade
+    _record_select(db, "grade", "delete", G.id, G.student_id, G.student_id == student_id)
+
+
+def record_subject_deleted(db, subject_id):
+    # Before deleting a subject: its grades and topics go with it
+    G, T = models.Grade, models.Topic
+    _record_select(db, "grade", "delete", G.id, G.student_id, G.subject_id == subject_id)
+    _record_select(db, "topic", "delete", T.id, literal(None), T.subject_id == subject_id)
+    record(db, "subject", [subject_id], "delete")
+
+
+def record_topics_reset(db):
+    # Before marking every completed topic as open again
+    T = models.Topic
+    _record_select(db, "topic", "upsert", T.id, literal(None), T.is_completed != 0)
+
+# --- Cursors ---
+
+
+def encode_cursor(epoch, log_id):
+    raw = f"{epoch}|{log_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Raises ValueError for anything that isn't a cursor we issued
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except UnicodeDecodeError:
+        raise ValueError("Invalid cursor")
+    epoch, _, log_id = raw.partition("|")
+    return int(epoch), int(log_id)
+
+# --- Reading ---
+
+
+def _states(db):
+    # -> (epoch, floor, newest log id)
+    rows = dict(db.query(DV.key, DV.version).filter(DV.key.in_((versioning.EPOCH, FLOOR))))
+    newest = db.query(func.max(CL.id)).scalar() or 0
+    return rows.get(versioning.EPOCH, 0), rows.get(FLOOR, 0), newest
+
+
+def snapshot(db, student_id, states=None):
+    # Everything the client holds, plus the cursor to continue from. The
+    # cursor is read first (same read transaction), so a write racing the
+    # snapshot is at worst sent again, never missed.
+    epoch, _, newest = states or _states(db)
+    return {
+        "cursor": encode_cursor(epoch, newest),
+        "reset": True,
+        "has_more": False,
+        "grades": {"upserts": db.query(models.Grade).filter(models.Grade.student_id == student_id).order_by(models.Grade.id).all(), "deletes": []},
+        "subjects": {"upserts": db.query(models.Subject).order_by(models.Subject.id).all(), "deletes": []},
+        "topics": {"upserts": db.query(models.Topic).order_by(models.Topic.id).all(), "deletes": []},
+    }
+
+
+def changes(db, student_id, cursor, limit):
+    # -> the response for GET /sync
+    if cursor is None:
+        return snapshot(db, student_id)
+    states = _states(db)
+    epoch, floor, newest = states
+    try:
+        epoch_seen, since = decode_cursor(cursor)
+    except ValueError:
+        return snapshot(db, student_id, states)
+    if epoch_seen != epoch or since < floor or since > max(newest, floor):
+        return snapshot(db, student_id, states)
+
+    entries = (
+        db.query(CL.id, CL.entity, CL.entity_id, CL.op)
+        .filter(CL.id > since, or_(CL.student_id == student_id, CL.student_id.is_(None)))
+        .order_by(CL.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    last = entries[-1].id if entries else since
+
+    # Newest entry per row wins
+    latest = {}
+    for entry in entries:
+        latest[(entry.entity, entry.entity_id)] = entry.op
+    ids = {"grade": [], "subject": [], "topic": []}
+    deletes = {"grade": [], "subject": [], "topic": []}
+    for (entity, entity_id), op in latest.items():
+        (ids if op == "upsert" else deletes)[entity].append(entity_id)
+
+    def rows(model, entity, *criteria):
+        if not ids[entity]:
+            return []
+        return db.query(model).filter(model.id.in_(ids[entity]), *criteria).order_by(model.id).all()
+
+    # A row deleted after this page's last entry is missing here; its
+    # tombstone comes with a later page
+    return {
+        "cursor": encode_cursor(epoch, last),
+        "reset": False,
+        "has_more": has_more,
+        "grades": {"upserts": rows(models.Grade, "grade", models.Grade.student_id == student_id), "deletes": sorted(deletes["grade"])},
+        "subjects": {"upserts": rows(models.Subject, "subject"), "deletes": sorted(deletes["subject"])},
+        "topics": {"upserts": rows(models.Topic, "topic"), "deletes": sorted(deletes["topic"])},
+    }
+
+# --- Offline edits (POST /sync) ---
+
+
+class MutationError(Exception):
+    pass
+
+
+class MutationBatch:
+    # Applies one POST /sync batch in the caller's session, with a fixed
+    # number of statements however many edits it holds: everything the
+    # edits refer to is read up front, the edits are then played in order
+    # against that state in memory, and the outcome is written with one
+    # executemany per kind of change. A rejected edit changes nothing and
+    # the others still go through. The caller commits, then publishes
+    # self.published.
+
+    REQUIRED = {
+        "grade.create": ("grade",),
+        "grade.delete": ("target",),
+        "topic.create": ("topic",),
+        "topic.set": ("target", "is_completed"),
+    }
+
+    def __init__(self, db, student_id):
+        self.db = db
+        self.student_id = student_id
+        self.published = []  # (topic, event, data) for events.publish after the commit
+
+    def _load(self, mutations):
+        db = self.db
+        client_ids = {m.id for m in mutations}
+        client_ids |= {m.target.client_id for m in mutations if m.target is not None and m.target.client_id}
+        self.done = {row.client_id: row for row in db.query(SM).filter(SM.client_id.in_(client_ids))}
+        self.weightings = dict(db.query(models.Subject.id, models.Subject.weighting))
+
+        # Rows the edits may change: by id, or by the client id of an earlier batch's edit
+        earlier = {client_id: row.entity_id for client_id, row in self.done.items() if row.student_id == self.student_id}
+        grade_ids, topic_ids = set(), set()
+        for m in mutations:
+            if m.target is None:
+                continue
+            target_id = m.target.id if m.target.id is not None else earlier.get(m.target.client_id)
+            if target_id is not None:
+                (grade_ids if m.op == "grade.delete" else topic_ids).add(target_id)
+        G, T = models.Grade, models.Topic
+        self.grades = {g.id: g for g in db.query(G.id, G.subject_id, G.type, G.value).filter(
+            G.id.in_(grade_ids), G.student_id == self.student_id)} if grade_ids else {}
+        self.topics = {t.id: {"id": t.id, "subject_id": t.subject_id, "name": t.name, "is_completed": bool(t.is_completed)}
+                       for t in db.query(T).filter(T.id.in_(topic_ids))} if topic_ids else {}
+
+    def _target(self, target, created):
+        # -> ("id", row id) or ("new", index into created) or raises MutationError
+        if target.id is not None:
+            return "id", target.id
+        if target.client_id is None:
+            raise MutationError("target needs an id or a client_id")
+        if target.client_id in created:
+            return "new", created[target.client_id]
+        previous = self.done.get(target.client_id)
+        if previous is None or previous.student_id != self.student_id or previous.entity_id is None:
+            raise MutationError(f"Unknown client id {target.client_id!r}")
+        return "id", previous.entity_id
+
+    def apply(self, mutations):
+        # -> one result per mutation, in order
+        self._load(mutations)
+        results = [None] * len(mutations)
+        new_grades, new_topics = [], []          # rows to insert, in order
+        grade_of, topic_of = {}, {}              # client id -> index into new_grades / new_topics
+        deleted_grades = {}                      # id -> row, existing grades to delete
+        deleted_new = set()                      # indexes of new grades deleted again
+        changed_topics = {}                      # id -> final state of existing topics
+        applied = []                             # (result index, kind, key)
+        seen = set()
+
+        for index, m in enumerate(mutations):
+            previous = self.done.get(m.id)
+            if previous is not None:
+                if previous.student_id != self.student_id:
+                    results[index] = {"id": m.id, "status": "error", "detail": "Client id already used"}
+                    continue
+                result = json.loads(previous.result)
+                result["status"] = "duplicate"
+                results[index] = result
+                continue
+            if m.id in seen:
+                results[index] = {"id": m.id, "status": "error", "detail": "Client id repeated in the batch"}
+                continue
+            seen.add(m.id)
+            try:
+                missing = [field for field in self.REQUIRED[m.op] if getattr(m, field) is None]
+                if missing:
+                    raise MutationError(f"{m.op} needs {', '.join(missing)}")
+
+                if m.op == "grade.create":
+                    if m.grade.subject_id not in self.weightings:
+                        raise MutationError("Subject not found")
+                    grade_of[m.id] = len(new_grades)
+                    new_grades.append({**m.grade.dict(), "student_id": self.student_id})
+                    applied.append((index, "new_grade", grade_of[m.id]))
+
+                elif m.op == "grade.delete":
+                    kind, key = self._target(m.target, grade_of)
+                    if kind == "new" and key not in deleted_new:
+                        deleted_new.add(key)
+                        applied.append((index, "deleted_grade", (kind, key)))
+                    elif kind == "id" and key in self.grades and key not in deleted_grades:
+                        deleted_grades[key] = self.grades[key]
+                        applied.append((index, "deleted_grade", (kind, key)))
+                    else:
+                        # Deleted already (online, or by an earlier edit): nothing left to do
+                        applied.append((index, "unchanged_grade", (kind, key)))
+
+                elif m.op == "topic.create":
+                    if m.topic.subject_id not in self.weightings:
+                        raise MutationError("Subject not found")
+                    topic_of[m.id] = len(new_topics)
+                    new_topics.append({"name": m.topic.name, "subject_id": m.topic.subject_id, "is_completed": bool(m.topic.is_completed)})
+                    applied.append((index, "new_topic", topic_of[m.id]))
+
+                elif m.op == "topic.set":
+                    # "set", not "toggle": applying the same edit twice gives the same state
+                    kind, key = self._target(m.target, topic_of)
+                    state = new_topics[key] if kind == "new" else changed_topics.get(key) or self.topics.get(key)
+                    if state is None:
+                        raise MutationError("Topic not found")
+                    if state["is_completed"] == m.is_completed:
+                        applied.append((index, "unchanged_topic", (kind, key)))
+                        continue
+                    if kind == "id":
+                        state = changed_topics[key] = {**state, "is_completed": m.is_completed}
+                    else:
+                        state["is_completed"] = m.is_completed
+                    applied.append((index, "set_topic", (kind, key)))
+            except MutationError as e:
+                results[index] = {"id": m.id, "status": "error", "detail": str(e)}
+
+        grade_ids, topic_ids = self._write(new_grades, deleted_new, deleted_grades, new_topics, changed_topics)
+
+        mutation_rows = []
+        now = _now()
+        for index, kind, key in applied:
+            m = mutations[index]
+            if kind == "new_grade":
+                entity_id = grade_ids[key]
+            elif kind == "new_topic":
+                entity_id = topic_ids[key]
+            elif kind in ("deleted_grade", "unchanged_grade"):
+                entity_id = grade_ids[key[1]] if key[0] == "new" else key[1]
+            else:
+                entity_id = topic_ids[key[1]] if key[0] == "new" else key[1]
+            status = "unchanged" if kind.startswith("unchanged") else "applied"
+            result = {"id": m.id, "op": m.op, "entity_id": entity_id, "status": status}
+            results[index] = result
+            mutation_rows.append({"client_id": m.id, "student_id": self.student_id, "op": m.op,
+                                  "entity_id": entity_id, "result": json.dumps(result), "applied_at": now})
+        if mutation_rows:
+            self.db.execute(insert(SM), mutation_rows)
+        return results
+
+    def _write(self, new_grades, deleted_new, deleted_grades, new_topics, changed_topics):
+        # -> (ids of new_grades, ids of new_topics), in order
+        db = self.db
+        G, T = models.Grade.__table__, models.Topic.__table__
+        grade_ids = topic_ids = []
+        log = []
+        deltas = {}
+
+        def delta(subject_id, g_type, value, count):
+            total = deltas.setdefault((subject_id, g_type), [0.0, 0])
+            total[0] += value
+            total[1] += count
+
+        if new_grades:
+            # sort_by_parameter_order: the ids come back in the order of
+            # new_grades, whatever order the database numbered the rows in
+            grade_ids = db.execute(G.insert().returning(G.c.id, sort_by_parameter_order=True), new_grades).scalars().all()
+            for index, (grade_id, grade) in enumerate(zip(grade_ids, new_grades)):
+                log.append(("grade", grade_id, "upsert", self.student_id))
+                if index in deleted_new:
+                    deleted_grades[grade_id] = None
+                else:
+                    delta(grade["subject_id"], grade["type"], grade["value"], 1)
+                    self.published.append((versioning.student_key(self.student_id), "grade.created",
+                                           {**grade, "id": grade_id, "date": grade["date"].isoformat()}))
+        if deleted_grades:
+            db.execute(delete(G).where(G.c.id.in_(list(deleted_grades))))
+            for grade_id, grade in deleted_grades.items():
+                log.append(("grade", grade_id, "delete", self.student_id))
+                if grade is None:
+                    continue  # created and deleted in this batch: nobody has seen it
+                delta(grade.subject_id, grade.type, -grade.value, -1)
+                self.published.append((versioning.student_key(self.student_id), "grade.deleted",
+                                       {"id": grade_id, "student_id": self.student_id}))
+        if new_topics:
+            topic_ids = db.execute(T.insert().returning(T.c.id, sort_by_parameter_order=True), new_topics).scalars().all()
+            for topic_id, topic in zip(topic_ids, new_topics):
+                log.append(("topic", topic_id, "upsert", None))
+                self.published.append((versioning.TOPICS, "topic.created", {**topic, "id": topic_id}))
+        if changed_topics:
+            db.execute(
+                update(T).where(T.c.id == bindparam("k_id")).values(is_completed=bindparam("v_completed")),
+                [{"k_id": topic_id, "v_completed": int(state["is_completed"])} for topic_id, state in changed_topics.items()],
+            )
+            for topic_id, state in changed_topics.items():
+                log.append(("topic", topic_id, "upsert", None))
+                self.published.append((versioning.TOPICS, "topic.updated", state))
+
+        aggregates.add_deltas(db, [
+            (self.student_id, subject_id, g_type, total, count, self.weightings.get(subject_id) or 0.0)
+            for (subject_id, g_type), (total, count) in deltas.items() if count
+        ])
+        if log:
+            now = _now()
+            db.execute(insert(CL), [
+                {"entity": entity, "entity_id": entity_id, "op": op, "student_id": student_id, "created_at": now}
+                for entity, entity_id, op, student_id in log
+            ])
+        keys = []
+        if new_grades or deleted_grades:
+            keys.append(versioning.student_key(self.student_id))
+        if new_topics or changed_topics:
+            keys.append(versioning.TOPICS)
+        versioning.bump(db, *keys)
+        return grade_ids, topic_ids
+
+# --- Compaction ---
+
+
+def compact(db, retention_days=None):
+    # -> (superseded entries deleted, expired entries deleted)
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    newest = select(func.max(CL.id)).group_by(CL.entity, CL.entity_id)
+    superseded = db.execute(delete(CL).where(CL.id.not_in(newest))).rowcount
+
+    cutoff = _now() - timedelta(days=retention_days)
+    expired_up_to = db.query(func.max(CL.id)).filter(CL.created_at < cutoff).scalar()
+    expired = 0
+    if expired_up_to is not None:
+        expired = db.execute(delete(CL).where(CL.id <= expired_up_to)).rowcount
+        _raise_floor(db, expired_up_to)
+    db.execute(delete(SM).where(SM.applied_at < cutoff))
+    db.commit()
+    return superseded, expired
+
+
+def _raise_floor(db, log_id):
+    updated = db.query(DV).filter(DV.key == FLOOR, DV.version < log_id).update(
+        {DV.version: log_id}, synchronize_session=False)
+    if not updated and db.query(DV.key).filter(DV.key == FLOOR).first() is None:
+        db.execute(insert(DV).values(key=FLOOR, version=log_id))
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _compact_loop():
+    while not _stop.wait(COMPACT_SECONDS):
+        db = database.SessionLocal()
+        try:
+            superseded, expired = compact(db)
+            if superseded or expired:
+                logger.info("Change log compacted: %d superseded, %d expired entries", superseded, expired)
+        except Exception:
+            # e.g. the database stayed locked past the busy timeout; next round
+            db.rollback()
+            logger.exception("Compacting the change log failed")
+        finally:
+            db.close()
+
+
+def start():
+    global _thread
+    if _thread is not None or COMPACT_SECONDS <= 0:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_compact_loop, name="notenpfad-sync-compaction", daemon=True)
+    _thread.start()
+
+
+def shutdown():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
@@ -0,0 +1,67 @@
+import datetime
+import os
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+import models
+import query_budget
+
+# The query_budget_guard fixture (conftest.py) against the real app, on
+# an in-memory database:
+#
+#   python -m pytest test_query_budget.py
+
+client = TestClient(main.app)
+
+
+def declared_budget(path):
+    route = next(route for route in main.app.routes if getattr(route, "path", None) == path)
+    return route.endpoint.__query_budget__
+
+
+@pytest.fixture(scope="module")
+def student_ids():
+    db = database.SessionLocal()
+    try:
+        subjects = [models.Subject(name=f"Budget {i}", weighting=1.0) for i in range(3)]
+        students = [models.Student(name=f"Budget Student {i}") for i in range(3)]
+        db.add_all(subjects + students)
+        db.flush()
+        for student in students:
+            for subject in subjects:
+                for day in range(1, 6):
+                    db.add(models.Grade(value=4.5, date=datetime.date(2024, 3, day), type="Exam",
+                                        student_id=student.id, subject_id=subject.id))
+        db.commit()
+        return [student.id for student in students]
+    finally:
+        db.close()
+
+
+def test_dashboard_within_budget(query_budget_guard, student_ids):
+    with query_budget_guard(declared_budget("/students/{student_id}/dashboard")) as recorder:
+        response = client.get(f"/students/{student_ids[0]}/dashboard")
+    assert response.status_code == 200
+    assert response.json()["grade_count"] == 15
+    assert recorder.count > 0
+
+
+def test_dashboard_over_budget(query_budget_guard, student_ids):
+    budget = declared_budget("/students/{student_id}/dashboard")
+    with pytest.raises(query_budget.QueryBudgetExceeded, match=f"budget is {budget - 1}"):
+        with query_budget_guard(budget - 1):
+            client.get(f"/students/{student_ids[0]}/dashboard")
+
+
+def test_grades_per_student_is_n_plus_one(query_budget_guard, student_ids):
+    # One list request per student runs the same SELECT with different
+    # parameters: the pattern a single grouped query should replace
+    with pytest.raises(query_budget.QueryBudgetExceeded, match="N\\+1"):
+        with query_budget_guard(None):
+            for student_id in student_ids:
+                assert client.get(f"/grades/?student_id={student_id}").status_code == 200
@@ -0,0 +1,130 @@
+from collections import deque
+
+from sqlalchemy import select
+import models
+
+# Grade trend series for the charts.
+#
+# One ordered pass over the student's grades (ix_grades_student_date_id)
+# feeds every series at once: the running average since the first grade
+# and the mean of the last `window` grades, per subject and overall.
+# Each series is then downsampled to at most max_points with LTTB
+# (Largest-Triangle-Three-Buckets), which keeps peaks and dips that
+# plain every-nth sampling would drop. The payload is bounded by
+# max_points whatever the length of the history.
+
+DEFAULT_WINDOW = 5
+DEFAULT_MAX_POINTS = 200
+
+
+class _Series:
+    def __init__(self, subject_id, name, window):
+        self.subject_id = subject_id
+        self.name = name
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+        self.recent_total = 0.0
+        # (date, value, running_avg, rolling_avg)
+        self.points = []
+
+    def add(self, grade_date, value):
+        self.total += value
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_total -= self.recent[0]
+        self.recent.append(value)
+        self.recent_total += value
+        self.points.append((
+            grade_date,
+            value,
+            self.total / (len(self.points) + 1),
+            self.recent_total / len(self.recent),
+        ))
+
+
+def lttb(points, max_points, x, y):
+    # First and last point are always kept; every bucket in between
+    # contributes the point forming the largest triangle with the point
+    # chosen before it and the average of the next bucket.
+    count = len(points)
+    if max_points >= count or max_points < 3:
+        return list(points)
+
+    xs = [x(point) for point in points]
+    ys = [y(point) for point in points]
+    sampled = [points[0]]
+    every = (count - 2) / (max_points - 2)
+    previous = 0
+    for bucket in range(max_points - 2):
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        px, py = xs[previous], ys[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((px - avg_x) * (ys[index] - py) - (px - xs[index]) * (avg_y - py))
+            if area > best_area:
+                best, best_area = index, area
+        sampled.append(points[best])
+        previous = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def _x(point):
+    return point[0].toordinal() if point[0] else 0
+
+
+def _y(point):
+    return point[1]
+
+
+def build_trend(db, student_id, subject_id=None, window=DEFAULT_WINDOW, max_points=DEFAULT_MAX_POINTS):
+    names = dict(db.query(models.Subject.id, models.Subject.name))
+    statement = (
+        select(models.Grade.date, models.Grade.subject_id, models.Grade.value)
+        .where(models.Grade.student_id == student_id, models.Grade.value.isnot(None))
+        .order_by(models.Grade.date, models.Grade.id)
+    )
+    if subject_id is not None:
+        statement = statement.where(models.Grade.subject_id == subject_id)
+
+    overall = _Series(None, None, window)
+    subjects = {}
+    # Core execution: plain tuples, no ORM row processing
+    for grade_date, grade_subject_id, value in db.connection().execute(statement):
+        if grade_subject_id not in subjects:
+            subjects[grade_subject_id] = _Series(grade_subject_id, names.get(grade_subject_id), window)
+        subjects[grade_subject_id].add(grade_date, value)
+        if subject_id is None:
+            overall.add(grade_date, value)
+
+    series = ([overall] if subject_id is None else []) + [subjects[key] for key in sorted(subjects)]
+    return {
+        "student_id": student_id,
+        "window": window,
+        "max_points": max_points,
+        "series": [
+            {
+                "subject_id": entry.subject_id,
+                "name": entry.name,
+                "count": len(entry.points),
+                "points": [
+                    {
+                        "date": grade_date,
+                        "value": value,
+                        "running_avg": round(running, 2),
+                        "rolling_avg": round(rolling, 2),
+                    }
+                    for grade_date, value, running, rolling in lttb(entry.points, max_points, _x, _y)
+                ],
+            }
+            for entry in series
+        ],
+    }
@@ -0,0 +1,86 @@
+import json
+import sys
+
+import chat
+
+# Regression check for the shipped intent catalogue (chat_intents.json),
+# no server or database needed:
+#   - every pattern and word, sent on its own, reaches its own intent
+#     (an earlier intent with an overlapping pattern would shadow it)
+#   - intent names are unique
+#   - templates only use fields the student context provides, and the
+#     last template of every intent (and the fallback) needs none, so an
+#     answer without student data always exists
+#   - typical messages keep reaching the intents they reach today
+#
+#   python verify_chat.py [path/to/catalogue.json]
+
+CONTEXT_FIELDS = {
+    "name", "average", "gap", "margin", "threshold", "grade_count", "subjects",
+    "weakest_subject", "weakest_average", "strongest_subject", "strongest_average",
+}
+
+EXPECTED = [
+    ("Hallo!", "greeting"),
+    ("Ich habe eine Sechs geschrieben!", "good_grade"),
+    ("Wie ist mein Schnitt?", "average"),
+    ("Ich habe Angst vor der Gymiprüfung nächste Woche", "exam_anxiety"),
+    ("Kannst du mir bei Brüchen helfen? Ich verstehe das Kürzen nicht.", "math_fractions"),
+    ("Reicht es für das Gymi, wenn ich im Aufsatz eine 5 schreibe?", "essay"),
+    ("Was ist mein schwächstes Fach?", "weakest_subject"),
+    ("Ich habe heute überhaupt keine Lust zu lernen", "study_plan"),
+    ("Wie viele Noten habe ich schon eingetragen?", "grade_count"),
+    ("Das Wetter ist heute schön und wir gehen nachher in die Badi", None),
+    ("Tschüss, bis morgen!", "goodbye"),
+]
+
+
+def name_of(catalogue, index):
+    return None if index is None else catalogue.intents[index][0]
+
+
+def check(path=None):
+    with open(path or chat.DEFAULT_PATH, encoding="utf-8") as f:
+        spec = json.load(f)
+    catalogue = chat.Catalogue(spec)
+    problems = []
+
+    names = [intent["name"] for intent in spec["intents"]]
+    problems += [f"intent {name!r} is defined more than once" for name in sorted({n for n in names if names.count(n) > 1})]
+
+    for index, intent in enumerate(spec["intents"]):
+        for kind in ("patterns", "words"):
+            for pattern in intent.get(kind, []):
+                found = catalogue.match(pattern)
+                if found != index:
+                    problems.append(f"{intent['name']}: {kind[:-1]} {pattern!r} reaches {name_of(catalogue, found)!r}")
+        for template in intent["responses"]:
+            unknown = chat._fields(template) - CONTEXT_FIELDS
+            if unknown:
+                problems.append(f"{intent['name']}: unknown field(s) {sorted(unknown)} in {template!r}")
+        if chat._fields(intent["responses"][-1]):
+            problems.append(f"{intent['name']}: the last response needs student data")
+    if any(chat._fields(template) for template in spec["fallback"]):
+        problems.append("the fallback must not use student data")
+
+    for message, expected in EXPECTED:
+        found = name_of(catalogue, catalogue.match(message))
+        if found != expected:
+            problems.append(f"{message!r} reaches {found!r}, expected {expected!r}")
+    return len(spec["intents"]), problems
+
+
+def run_test(path=None):
+    print("--- Starting Chat Catalogue Verification ---")
+    count, problems = check(path)
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        print(f"❌ Chat Catalogue Verification FAILED ({len(problems)} problems in {count} intents)")
+        return 1
+    print(f"✅ Chat Catalogue Verification PASSED ({count} intents)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_test(sys.argv[1] if len(sys.argv) > 1 else None))
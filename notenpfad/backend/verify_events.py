@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Checks GET /events (server-sent events) against a running server with
+# many idle subscribers:
+#   - N concurrent streams open and each gets its "ready" event
+#   - while they sit idle, the server's CPU and memory stay low (pass the
+#     server's --pid; it must run on this machine)
+#   - keep-alives arrive on every stream
+#   - a new grade reaches every subscriber; fan-out latency is reported
+#   - so does a grade stored by a scan job (POST /analyze-exam?create_grade=true)
+#   - closed streams are unsubscribed (notenpfad_events_subscribers on /metrics)
+#
+# Start one worker with a short heartbeat and enough file descriptors:
+#
+#   ulimit -n 4096
+#   NOTENPFAD_EVENTS_HEARTBEAT=2 python -m uvicorn main:app --port 8000 &
+#   python verify_events.py --subscribers 1000 --pid $!
+
+BASE_URL = "http://localhost:8000"
+PARENT_ID = 1  # admin; a temporary child account is created under it
+
+def req(endpoint, method="GET", data=None):
+    url = f"{BASE_URL}{endpoint}"
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    request = urllib.request.Request(url, data=body, method=method)
+    request.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(request) as response:
+            raw = response.read().decode()
+            return response.status, json.loads(raw) if raw.startswith(("{", "[")) else raw
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+def upload_scan(endpoint, body, content_type="image/png"):
+    request = urllib.request.Request(f"{BASE_URL}{endpoint}", data=body, method="POST")
+    request.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read().decode())
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+def subscriber_gauge():
+    _, text = req("/metrics")
+    for line in text.splitlines():
+        if line.startswith("notenpfad_events_subscribers"):
+            return int(float(line.split()[-1]))
+    return None
+
+def process_usage(pid):
+    # -> (rss in KiB, cpu seconds) of a local process, or None
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return rss, (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, StopIteration):
+        return None
+
+class Client:
+    # One raw HTTP/1.1 connection reading the event stream; it only looks
+    # for markers, which is enough since every event is a single chunk
+    def __init__(self, path):
+        self.path = path
+        self.ready = asyncio.Event()
+        self.keepalives = 0
+        self.seen = {}  # event name -> first arrival (perf_counter)
+        self.waiting = {}
+        self.writer = None
+
+    async def run(self, host, port):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(f"GET {self.path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        tail = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            text = tail + data
+            if b"event: ready" in text:
+                self.ready.set()
+            self.keepalives += data.count(b": keep-alive")
+            for name in list(self.waiting):
+                if f"event: {name}".encode() in text:
+                    self.seen[name] = time.perf_counter()
+                    self.waiting.pop(name).set()
+            tail = text[-64:]
+
+    def expect(self, name):
+        self.waiting[name] = asyncio.Event()
+        return self.waiting[name]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+async def run_test(args):
+    print("--- Starting Event Stream Verification ---")
+    url = urllib.parse.urlsplit(BASE_URL)
+    host, port = url.hostname, url.port or 80
+
+    status, child = await asyncio.to_thread(req, "/users/children", "POST", {
+        "username": "eventstest", "password": "eventstest", "name": "Events Test", "parent_id": PARENT_ID,
+    })
+    if status != 200:
+        raise Exception(f"Creating the test child answered {status}: {child}")
+    _, children = await asyncio.to_thread(req, f"/users/{PARENT_ID}/children")
+    student_id = next(c['student_profile']['id'] for c in children if c['id'] == child['id'])
+    _, subjects = await asyncio.to_thread(req, "/subjects/")
+
+    clients = []
+    tasks = []
+    try:
+        usage_before = process_usage(args.pid)
+        # Half watch as the parent, half as the child
+        started = time.perf_counter()
+        for i in range(args.subscribers):
+            user_id = PARENT_ID if i % 2 == 0 else child['id']
+            client = Client(f"/events?user_id={user_id}")
+            clients.append(client)
+            tasks.append(asyncio.create_task(client.run(host, port)))
+        await asyncio.wait_for(asyncio.gather(*(c.ready.wait() for c in clients)), timeout=120)
+        print(f"  {len(clients)} streams open in {time.perf_counter() - started:.2f}s "
+              f"(gauge: {await asyncio.to_thread(subscriber_gauge)})")
+
+        usage_open = process_usage(args.pid)
+        await asyncio.sleep(args.idle)
+        usage_idle = process_usage(args.pid)
+        keepalives = sum(c.keepalives for c in clients)
+        print(f"  {keepalives} keep-alives in {args.idle:.0f}s idle "
+              f"({sum(1 for c in clients if c.keepalives) } of {len(clients)} streams got one)")
+        if usage_before and usage_open and usage_idle:
+            per_stream = (usage_open[0] - usage_before[0]) / len(clients)
+            idle_cpu = (usage_idle[1] - usage_open[1]) / args.idle
+            print(f"  server RSS {usage_before[0] / 1024:.1f} -> {usage_open[0] / 1024:.1f} MiB "
+                  f"({per_stream:.1f} KiB per stream)")
+            print(f"  server CPU while idle: {idle_cpu * 100:.2f}% of one core")
+
+        waits = [c.expect("grade.created") for c in clients]
+        published = time.perf_counter()
+        status, grade = await asyncio.to_thread(req, f"/grades/?student_id={student_id}", "POST", {
+            "value": 5.5, "subject_id": subjects[0]['id'], "type": "Vornote", "date": "2024-05-01",
+        })
+        if status != 200:
+            raise Exception(f"Creating a grade answered {status}: {grade}")
+        await asyncio.wait_for(asyncio.gather(*(w.wait() for w in waits)), timeout=30)
+        latencies = sorted((c.seen["grade.created"] - published) * 1000 for c in clients)
+        print(f"  grade.created reached all {len(clients)} subscribers: "
+              f"p50 {latencies[len(latencies) // 2]:.1f} ms, max {latencies[-1]:.1f} ms (incl. the POST)")
+
+        # A grade stored by the scan job dispatcher, not by a request
+        waits = [c.expect("grade.created") for c in clients]
+        status, job = await asyncio.to_thread(
+            upload_scan, f"/analyze-exam?student_id={student_id}&create_grade=true&filename=scan.png", b"\x89PNG\r\n\x1a\n" + b"0" * 64)
+        if status != 202:
+            raise Exception(f"Uploading a scan answered {status}: {job}")
+        try:
+            await asyncio.wait_for(asyncio.gather(*(w.wait() for w in waits)), timeout=60)
+        except asyncio.TimeoutError:
+            _, job = await asyncio.to_thread(req, f"/jobs/{job['id']}")
+            print(f"❌ The grade of scan job {job['id']} reached no subscriber (job: {job})")
+            return
+        print(f"  grade.created of scan job {job['id']} reached all {len(clients)} subscribers")
+
+        if keepalives == 0:
+            print("❌ No keep-alives; start the server with NOTENPFAD_EVENTS_HEARTBEAT below --idle")
+            return
+    finally:
+        for client in clients:
+            client.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(req, f"/users/children/{child['id']}", "DELETE")
+
+    # Disconnects are noticed asynchronously
+    for _ in range(50):
+        remaining = await asyncio.to_thread(subscriber_gauge)
+        if remaining == 0:
+            break
+        await asyncio.sleep(0.1)
+    if remaining != 0:
+        print(f"❌ {remaining} subscribers still registered after the clients left")
+        return
+    print("✅ Event Stream Verification PASSED")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify GET /events with many idle subscribers")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--idle", type=float, default=10.0, help="seconds to sit idle with every stream open")
+    parser.add_argument("--pid", type=int, help="server process id, to report its memory and CPU")
+    asyncio.run(run_test(parser.parse_args()))
@@ -0,0 +1,103 @@
+import datetime
+import os
+import sys
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from sqlalchemy import select
+
+import database
+import models
+import pagination
+
+# Keyset pagination over grades with and without a date, against an
+# in-memory database (no server needed):
+#   - walking the pages, in both orders and at several page sizes, returns
+#     every grade exactly once, in the order of the unpaginated list
+#   - a cursor on a dated grade is a range seek on ix_grades_student_date_id
+#     (EXPLAIN shows "date<?" / "date>?", not just student_id=?), so deep
+#     pages cost the same as the first one
+#
+#   python verify_pagination.py
+
+STUDENT_ID = 1
+
+
+def seed(db):
+    db.add(models.Student(id=STUDENT_ID, name="Pagination Test"))
+    db.add(models.Student(id=STUDENT_ID + 1, name="Other"))
+    db.add(models.Subject(id=1, name="Mathematik"))
+    start = datetime.date(2024, 1, 1)
+    for i in range(40):
+        # every fourth grade undated, some dates shared by several grades
+        grade_date = None if i % 4 == 0 else start + datetime.timedelta(days=i // 3)
+        db.add(models.Grade(value=4 + i % 3 * 0.5, date=grade_date, type="Exam", student_id=STUDENT_ID, subject_id=1))
+        db.add(models.Grade(value=5.0, date=start, type="Exam", student_id=STUDENT_ID + 1, subject_id=1))
+    db.commit()
+
+
+def grades_query():
+    return select(models.Grade.id, models.Grade.date).where(models.Grade.student_id == STUDENT_ID)
+
+
+def walk(connection, descending, limit):
+    run = lambda page: connection.execute(page).all()
+    ids, cursor = [], None
+    while True:
+        rows, cursor = pagination.fetch_page(grades_query(), cursor, descending, limit, run)
+        ids += [row.id for row in rows]
+        if cursor is None:
+            return ids
+
+
+def plans(connection, cursor, descending):
+    # EXPLAIN QUERY PLAN of each query fetch_page runs for the cursor
+    found = []
+
+    def explain(page):
+        sql = page.compile(connection, compile_kwargs={"literal_binds": True})
+        found.append(" ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")))
+        return []
+
+    pagination.fetch_page(grades_query(), cursor, descending, 10, explain)
+    return found
+
+
+def run_test():
+    print("--- Starting Pagination Verification ---")
+    database.init_db()
+    db = database.SessionLocal()
+    problems = []
+    try:
+        seed(db)
+        connection = db.connection()
+        for descending in (True, False):
+            full = [row.id for row in connection.execute(pagination.order_grades(grades_query(), descending))]
+            for limit in (1, 3, 7, 10, 40, 100):
+                ids = walk(connection, descending, limit)
+                if ids != full:
+                    problems.append(f"{'desc' if descending else 'asc'} limit={limit}: pages give {ids}, expected {full}")
+
+        checks = [
+            (pagination.encode_cursor(datetime.date(2024, 1, 5), 20), True, "date<?"),
+            (pagination.encode_cursor(datetime.date(2024, 1, 5), 20), False, "date>?"),
+        ]
+        for cursor, descending, seek in checks:
+            plan = plans(connection, cursor, descending)[0]
+            print(f"  {'desc' if descending else 'asc'}: {plan}")
+            if "ix_grades_student_date_id" not in plan or seek not in plan:
+                problems.append(f"dated cursor ({'desc' if descending else 'asc'}) is no range seek: {plan}")
+    finally:
+        db.close()
+
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        print(f"❌ Pagination Verification FAILED ({len(problems)} problems)")
+        return 1
+    print("✅ Pagination Verification PASSED")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_test())
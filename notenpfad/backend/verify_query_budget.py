@@ -0,0 +1,100 @@
+import json
+import urllib.request
+import urllib.error
+
+# Checks that read endpoints issue a constant number of SQL statements,
+# however much data there is. Start the server with the budgets enforced:
+#
+#   NOTENPFAD_QUERY_BUDGET=error python -m uvicorn main:app --port 8000
+#
+# In that mode an endpoint over its @query_budget.max_queries budget, or
+# with an N+1 pattern, answers 500 and this script fails.
+
+BASE_URL = "http://localhost:8000"
+PARENT_ID = 1  # admin; a temporary child account is created under it
+
+def reads(student_id):
+    return [
+        "/subjects/",
+        f"/grades/?student_id={student_id}",
+        f"/grades/?student_id={student_id}&limit=5",
+        f"/average/?student_id={student_id}",
+        f"/students/{student_id}/subjects",
+        f"/students/{student_id}/dashboard",
+        f"/students/{student_id}/trend",
+        f"/users/{PARENT_ID}/children",
+        f"/users/{PARENT_ID}/overview",
+    ]
+
+def req(endpoint, method="GET", data=None):
+    # -> (status, x-query-count, parsed body)
+    url = f"{BASE_URL}{endpoint}"
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    request = urllib.request.Request(url, data=body, method=method)
+    request.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get("X-Query-Count"), json.loads(response.read().decode())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("X-Query-Count"), json.loads(e.read().decode() or "null")
+
+def query_counts(endpoints):
+    counts = {}
+    for endpoint in endpoints:
+        status, count, body = req(endpoint)
+        if status != 200:
+            raise Exception(f"{endpoint} answered {status}: {body}")
+        counts[endpoint] = int(count)
+    return counts
+
+def run_test():
+    print("--- Starting Query Budget Verification ---")
+
+    status, count, _ = req("/status")
+    if count is None:
+        print("❌ No X-Query-Count header. Start the server with NOTENPFAD_QUERY_BUDGET=error")
+        return
+
+    status, _, child = req("/users/children", "POST", {
+        "username": "budgettest", "password": "budgettest", "name": "Budget Test", "parent_id": PARENT_ID,
+    })
+    if status != 200:
+        raise Exception(f"Creating the test child answered {status}: {child}")
+    _, _, children = req(f"/users/{PARENT_ID}/children")
+    student_id = next(c['student_profile']['id'] for c in children if c['id'] == child['id'])
+    endpoints = reads(student_id)
+
+    subject_ids = []
+    try:
+        before = query_counts(endpoints)
+        for endpoint, count in before.items():
+            print(f"  {count:>2} queries  {endpoint}")
+
+        # Grow the data: more subjects, grades in each, topics
+        for i in range(3):
+            status, _, subject = req("/subjects/", "POST", {"name": f"BudgetTest {i}", "weighting": 1.0})
+            if status != 200:
+                raise Exception(f"Creating a subject answered {status}: {subject}")
+            subject_ids.append(subject['id'])
+            req("/topics/", "POST", {"name": f"Topic {i}", "subject_id": subject['id'], "is_completed": False})
+            for day in range(1, 6):
+                status, _, body = req(f"/grades/?student_id={student_id}", "POST", {
+                    "value": 4.0 + day / 4, "subject_id": subject['id'], "type": "Vornote", "date": f"2024-03-0{day}",
+                })
+                if status != 200:
+                    raise Exception(f"Creating a grade answered {status}: {body}")
+
+        after = query_counts(endpoints)
+        changed = {endpoint: (before[endpoint], after[endpoint]) for endpoint in endpoints if before[endpoint] != after[endpoint]}
+        if changed:
+            for endpoint, (old, new) in changed.items():
+                print(f"❌ {endpoint}: {old} -> {new} queries as the data grew")
+            return
+        print("✅ Query Budget Verification PASSED (counts constant, no budget overruns or N+1)")
+    finally:
+        for subject_id in subject_ids:
+            req(f"/subjects/{subject_id}", "DELETE")
+        req(f"/users/children/{child['id']}", "DELETE")
+
+if __name__ == "__main__":
+    run_test()
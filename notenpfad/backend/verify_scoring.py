@@ -0,0 +1,163 @@
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import aggregates
+import models
+import scoring
+
+# Compares the aggregate-based /average/ computation against the original
+# row-by-row implementation on randomized data, with the aggregates
+# maintained incrementally the way the endpoints do it. Runs against a
+# scratch in-memory database, no server needed.
+
+SUBJECTS = ["Mathematik", "Deutsch", "Englisch"]
+TYPES = [
+    "Vornote", "Schulprüfung", "Prüfung", "Gymiprüfung",
+    "Aufsatz", "Aufsatz (Prüfung)", "Aufsatz (Gymiprüfung)",
+    "Sprachbetrachtung", "Sprachbetrachtung (Prüfung)", "Sprachbetrachtung (Gymiprüfung)",
+    "Exam", "Oral",
+]
+
+
+def reference_average(db, student_id):
+    # The original calculate_average, kept verbatim as the oracle
+    grades = db.query(models.Grade).filter(models.Grade.student_id == student_id).all()
+
+    def get_grades(subj_name, g_types=None):
+        if isinstance(g_types, str):
+            g_types = [g_types]
+        return [g.value for g in grades if g.subject and g.subject.name == subj_name and (not g_types or g.type in g_types)]
+
+    def avg(values):
+        return sum(values) / len(values) if values else None
+
+    math_vornote = avg(get_grades("Mathematik", ["Vornote", "Schulprüfung"]))
+    deutsch_vornote = avg(get_grades("Deutsch", ["Vornote", "Schulprüfung"]))
+
+    overall_vornote = None
+    if math_vornote is not None and deutsch_vornote is not None:
+        overall_vornote = (math_vornote + deutsch_vornote) / 2
+    elif math_vornote is not None:
+        overall_vornote = math_vornote
+    elif deutsch_vornote is not None:
+        overall_vornote = deutsch_vornote
+
+    math_exam = avg(get_grades("Mathematik", ["Prüfung", "Gymiprüfung"]))
+    deutsch_aufsatz = avg(get_grades("Deutsch", ["Aufsatz", "Aufsatz (Prüfung)", "Aufsatz (Gymiprüfung)"]))
+    deutsch_sprach = avg(get_grades("Deutsch", ["Sprachbetrachtung", "Sprachbetrachtung (Prüfung)", "Sprachbetrachtung (Gymiprüfung)"]))
+
+    deutsch_exam = None
+    if deutsch_aufsatz is not None and deutsch_sprach is not None:
+        deutsch_exam = (deutsch_aufsatz + deutsch_sprach) / 2
+    elif deutsch_aufsatz is not None:
+        deutsch_exam = deutsch_aufsatz
+    elif deutsch_sprach is not None:
+        deutsch_exam = deutsch_sprach
+
+    overall_exam = None
+    if math_exam is not None and deutsch_exam is not None:
+        overall_exam = (math_exam + deutsch_exam) / 2
+    elif math_exam is not None:
+        overall_exam = math_exam
+    elif deutsch_exam is not None:
+        overall_exam = deutsch_exam
+
+    gesamtnote = 0.0
+    if overall_vornote is not None and overall_exam is not None:
+        gesamtnote = (overall_vornote + overall_exam) / 2
+    elif overall_vornote is not None:
+        gesamtnote = overall_vornote
+    elif overall_exam is not None:
+        gesamtnote = overall_exam
+
+    return {
+        "average": round(gesamtnote, 2),
+        "details": {
+            "vornote": {
+                "value": round(overall_vornote, 2) if overall_vornote else None,
+                "math": round(math_vornote, 2) if math_vornote else None,
+                "deutsch": round(deutsch_vornote, 2) if deutsch_vornote else None
+            },
+            "exam": {
+                "value": round(overall_exam, 2) if overall_exam else None,
+                "math": round(math_exam, 2) if math_exam else None,
+                "deutsch": {
+                    "value": round(deutsch_exam, 2) if deutsch_exam else None,
+                    "aufsatz": round(deutsch_aufsatz, 2) if deutsch_aufsatz else None,
+                    "sprachbetrachtung": round(deutsch_sprach, 2) if deutsch_sprach else None
+                }
+            }
+        },
+        "passed": gesamtnote >= 4.75
+    }
+
+
+def seed(db, rng, n_students):
+    for name in SUBJECTS:
+        db.add(models.Subject(name=name, weighting=1.0))
+    for i in range(n_students):
+        db.add(models.Student(name=f"Student {i}", target_school="Gymnasium"))
+    db.commit()
+
+    start = date(2024, 1, 1)
+    # subject_id 99 does not exist: such grades must be ignored like before
+    subject_ids = [1, 2, 3, 99]
+    for student_id in range(1, n_students + 1):
+        # Sparse students exercise the fallback branches, dense ones the averages
+        n_grades = rng.choice([0, 1, 2, 3, 5, 10, 40])
+        types = rng.sample(TYPES, rng.randint(1, len(TYPES)))
+        for _ in range(n_grades):
+            grade = models.Grade(
+                value=rng.randint(4, 24) / 4,  # 1.0 .. 6.0 in quarter steps
+                date=start + timedelta(days=rng.randint(0, 500)),
+                type=rng.choice(types),
+                student_id=student_id,
+                subject_id=rng.choice(subject_ids),
+            )
+            db.add(grade)
+            aggregates.add_grade(db, grade)
+    db.commit()
+
+    # Delete a random share again, like DELETE /grades/{id} does
+    for grade in db.query(models.Grade).all():
+        if rng.random() < 0.2:
+            db.delete(grade)
+            aggregates.remove_grade(db, grade)
+    db.commit()
+
+
+def run_test(n_students=500, seed_value=2024):
+    print("--- Starting Scoring Regression (randomized) ---")
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    rng = random.Random(seed_value)
+    seed(db, rng, n_students)
+
+    mismatches = 0
+    for student_id in range(1, n_students + 1):
+        expected = reference_average(db, student_id)
+        actual = scoring.gymi_score(scoring.load_buckets(db, student_id))
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"Student {student_id}:\n  expected {expected}\n  actual   {actual}")
+
+    drift = aggregates.verify(db)
+    db.close()
+
+    try:
+        assert mismatches == 0, f"{mismatches} of {n_students} students differ"
+        assert not drift, f"{len(drift)} aggregate bucket(s) drifted from grades"
+        print(f"✅ Scoring Regression PASSED ({n_students} students)")
+    except AssertionError as e:
+        print(f"❌ Scoring Regression FAILED: {e}")
+
+
+if __name__ == "__main__":
+    run_test()
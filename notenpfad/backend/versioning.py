@@ -0,0 +1,86 @@
+import hashlib
+import secrets
+
+from sqlalchemy import insert
+import models
+
+# Data versions for conditional GETs.
+#
+# Every write endpoint bumps the counters of what it touched, in the same
+# transaction as the write itself. A read endpoint derives its ETag from
+# the counters it depends on, which is one primary-key lookup, so a
+# matching If-None-Match can be answered with 304 before the real query
+# runs.
+#
+# Keys:
+#   student:<id>  grades (and so scores) of one student
+#   subjects      subject list and weightings; also part of every student
+#                 ETag, since deleting a subject deletes grades
+#   topics        topic lists and their completion state
+#   accounts      which student profiles exist and whose children they
+#                 are (cached per process, see cache.py)
+#   epoch         random per database, so a recreated database never
+#                 reuses ETags handed out for the old one
+
+SUBJECTS = "subjects"
+TOPICS = "topics"
+ACCOUNTS = "accounts"
+EPOCH = "epoch"
+
+DV = models.DataVersion
+
+
+def student_key(student_id):
+    return f"student:{student_id}"
+
+
+def student_keys(student_id):
+    # What everything derived from a student's grades depends on
+    return (student_key(student_id), SUBJECTS)
+
+
+def bump(db, *keys):
+    # "version = version + 1" so concurrent writers never lose a bump;
+    # one UPDATE for all keys, plus an INSERT for keys seen the first time
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return
+    updated = db.query(DV).filter(DV.key.in_(keys)).update(
+        {DV.version: DV.version + 1}, synchronize_session=False)
+    if updated < len(keys):
+        present = {key for (key,) in db.query(DV.key).filter(DV.key.in_(keys))}
+        db.execute(insert(DV), [{"key": key, "version": 1} for key in keys if key not in present])
+
+
+def read(db, *keys):
+    # Missing keys count as version 0
+    rows = dict(db.query(DV.key, DV.version).filter(DV.key.in_((EPOCH,) + keys)))
+    return [rows.get(EPOCH, 0)] + [rows.get(key, 0) for key in keys]
+
+
+def ensure_epoch(db):
+    if db.query(DV.key).filter(DV.key == EPOCH).first() is None:
+        db.execute(insert(DV).values(key=EPOCH, version=secrets.randbits(31)))
+        db.commit()
+
+
+def make_etag(versions, variant=""):
+    # variant separates representations built from the same data (path, query).
+    # Weak: the tag stands for the data, and the gzip middleware may send
+    # it with differently encoded bytes.
+    raw = ":".join(str(v) for v in versions) + "|" + variant
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def _opaque(tag):
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored on both sides
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return _opaque(etag) in (_opaque(tag) for tag in candidates)
@@ -12,11 +12,15 @@ import Login from './pages/Login';
 
 import Kids from './pages/Kids';
 
+const API_URL = 'http://localhost:8000';
+
 function App() {
   const [user, setUser] = useState(null);
   const [view, setView] = useState('dashboard');
   const [selectedSubject, setSelectedSubject] = useState(null);
   const [viewingChild, setViewingChild] = useState(null);
+  // Bumped on every server event, so the open page refetches
+  const [liveVersion, setLiveVersion] = useState(0);
 
   useEffect(() => {
     const storedUser = localStorage.getItem('user');
@@ -25,6 +29,23 @@ function App() {
     }
   }, []);
 
+  // Live updates: grades, topics and children changed elsewhere (GET /events)
+  useEffect(() => {
+    const userId = user?.id || user?.user_id;
+    if (!userId || !window.EventSource) return;
+    const source = new EventSource(`${API_URL}/events?user_id=${userId}`);
+    const refresh = () => setLiveVersion(v => v + 1);
+    ['grade.created', 'grade.deleted', 'grades.imported', 'grades.reset', 'subject.created', 'subject.deleted',
+      'topic.created', 'topic.updated', 'topics.reset', 'child.created', 'child.deleted'].forEach(name => source.addEventListener(name, refresh));
+    // After a reconnect, catch up on whatever was missed
+    let connected = false;
+    source.addEventListener('ready', () => {
+      if (connected) refresh();
+      connected = true;
+    });
+    return () => source.close();
+  }, [user]);
+
   const handleLogin = (userData) => {
     setUser(userData);
     localStorage.setItem('user', JSON.stringify(userData));
@@ -59,14 +80,14 @@ function App() {
 
   const renderView = () => {
     switch (view) {
-      case 'dashboard': return <Dashboard studentId={currentStudentId} onSelectSubject={handleSelectSubject} onViewHistory={() => setView('history')} />;
+      case 'dashboard': return <Dashboard studentId={currentStudentId} liveVersion={liveVersion} onSelectSubject={handleSelectSubject} onViewHistory={() => setView('history')} />;
       case 'history': return <GradeHistory studentId={currentStudentId} onBack={() => setView('dashboard')} />;
       case 'simulator': return <Simulator studentId={currentStudentId} />;
-      case 'scan': return <ScanExam />;
-      case 'chat': return <ChatBot />;
+      case 'scan': return <ScanExam studentId={currentStudentId} />;
+      case 'chat': return <ChatBot studentId={currentStudentId} />;
       case 'certificate': return <Certificate studentId={currentStudentId} />;
       case 'profile': return <Profile user={user} onReset={() => setView('dashboard')} onLogout={handleLogout} />;
-      case 'kids': return <Kids user={user} onViewChild={handleViewChild} />;
+      case 'kids': return <Kids user={user} liveVersion={liveVersion} onViewChild={handleViewChild} />;
       case 'subjectDetail':
         return <SubjectDetail studentId={currentStudentId} subject={selectedSubject} onBack={() => setView('dashboard')} />;
       default: return <Dashboard studentId={currentStudentId} onSelectSubject={handleSelectSubject} />;
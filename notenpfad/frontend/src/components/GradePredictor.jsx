@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from 'react';
 
+const API_URL = 'http://localhost:8000';
+
 const GradePredictor = ({ studentId }) => {
     // Inputs
     const [mathV, setMathV] = useState('');
@@ -10,55 +12,49 @@ const GradePredictor = ({ studentId }) => {
 
     const [result, setResult] = useState(null);
 
-    // Live calculation
+    // Live calculation with the server's score rules (same as /average/)
     useEffect(() => {
-        calculate();
+        let cancelled = false;
+        calculate().then(next => {
+            // Ignore answers that arrive after a newer input
+            if (!cancelled) setResult(next);
+        });
+        return () => { cancelled = true; };
     }, [mathV, deutV, mathExam, deutAufsatz, deutSprach]);
 
-    const calculate = () => {
-        // Parse floats or use null
-        const mv = mathV ? parseFloat(mathV) : null;
-        const dv = deutV ? parseFloat(deutV) : null;
-        const me = mathExam ? parseFloat(mathExam) : null;
-        const da = deutAufsatz ? parseFloat(deutAufsatz) : null;
-        const ds = deutSprach ? parseFloat(deutSprach) : null;
-
-        // Vornote (50%)
-        let vornote = null;
-        if (mv !== null && dv !== null) vornote = (mv + dv) / 2;
-        else if (mv !== null) vornote = mv;
-        else if (dv !== null) vornote = dv;
-
-        // Deutsch Exam
-        let deutExam = null;
-        if (da !== null && ds !== null) deutExam = (da + ds) / 2;
-        else if (da !== null) deutExam = da;
-        else if (ds !== null) deutExam = ds;
-
-        // Exam (50%)
-        let exam = null;
-        if (me !== null && deutExam !== null) exam = (me + deutExam) / 2;
-        else if (me !== null) exam = me;
-        else if (deutExam !== null) exam = deutExam;
-
-        // Total
-        let total = null;
-        if (vornote !== null && exam !== null) total = (vornote + exam) / 2;
-        else if (vornote !== null) total = vornote; // optimistic? No, just showing what we have
-        else if (exam !== null) total = exam;
-
-        // Only show result if we have at least ONE value? 
-        // Or specific rule: Show if we have at least partial data.
-
-        if (total !== null) {
-            setResult({
-                total: total.toFixed(2),
-                passed: total >= 4.75,
-                vornote: vornote ? vornote.toFixed(2) : '-',
-                exam: exam ? exam.toFixed(2) : '-'
+    const calculate = async () => {
+        // One hypothetical grade per filled-in field
+        const grades = [
+            ['Mathematik', 'Vornote', mathV],
+            ['Deutsch', 'Vornote', deutV],
+            ['Mathematik', 'Prüfung', mathExam],
+            ['Deutsch', 'Aufsatz', deutAufsatz],
+            ['Deutsch', 'Sprachbetrachtung', deutSprach]
+        ]
+            .filter(([, , value]) => value !== '' && !isNaN(parseFloat(value)))
+            .map(([subject, type, value]) => ({ subject, type, value: parseFloat(value) }));
+
+        // Only show a result once there is at least one value
+        if (grades.length === 0) return null;
+
+        try {
+            const res = await fetch(`${API_URL}/score/evaluate`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ scenarios: [{ grades }] })
             });
-        } else {
-            setResult(null);
+            if (!res.ok) return null;
+            const score = (await res.json()).results[0];
+            const { vornote, exam } = score.details;
+            return {
+                total: score.average.toFixed(2),
+                passed: score.passed,
+                vornote: vornote && vornote.value ? vornote.value.toFixed(2) : '-',
+                exam: exam && exam.value ? exam.value.toFixed(2) : '-'
+            };
+        } catch (error) {
+            console.error("Error evaluating score:", error);
+            return null;
         }
     };
 
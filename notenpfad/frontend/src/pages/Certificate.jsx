@@ -13,35 +13,12 @@ const Certificate = ({ studentId }) => {
 
     const fetchData = async () => {
         try {
-            const [subjRes, gradesRes] = await Promise.all([
-                fetch(`${API_URL}/subjects/`),
-                fetch(`${API_URL}/grades/?student_id=${studentId}`)
-            ]);
+            // Per-subject averages and the Zeugnisschnitt are computed by the server
+            const res = await fetch(`${API_URL}/students/${studentId}/subjects`);
+            const data = await res.json();
 
-            const subjects = await subjRes.json();
-            const grades = await gradesRes.json();
-
-            // Calculate average per subject
-            const subjectStats = subjects.map(sub => {
-                const subGrades = grades.filter(g => g.subject_id === sub.id);
-                const avg = subGrades.length > 0
-                    ? subGrades.reduce((acc, curr) => acc + curr.value, 0) / subGrades.length
-                    : null;
-                return {
-                    ...sub,
-                    average: avg
-                };
-            }); // Removed filter here to show all subjects
-
-            setStats(subjectStats);
-
-            // Calculate overall Zeugnis average (average of averages)
-            const validAverages = subjectStats.map(s => s.average).filter(a => a !== null);
-            const totalAvg = validAverages.length > 0
-                ? validAverages.reduce((acc, curr) => acc + curr, 0) / validAverages.length
-                : 0;
-
-            setOverallAvg(totalAvg);
+            setStats(data.subjects);
+            setOverallAvg(data.zeugnisschnitt || 0);
 
         } catch (error) {
             console.error("Error fetching certificate data:", error);
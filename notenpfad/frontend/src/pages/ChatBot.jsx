@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 
 const API_URL = 'http://localhost:8000';
 
-const ChatBot = () => {
+const ChatBot = ({ studentId }) => {
     const [messages, setMessages] = useState([
         { sender: 'bot', text: 'Hallo! Ich bin dein Lern-Coach. Wie kann ich dir heute helfen? 🤖' }
     ]);
@@ -28,7 +28,7 @@ const ChatBot = () => {
             const res = await fetch(`${API_URL}/chat`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: input })
+                body: JSON.stringify({ message: input, student_id: studentId })
             });
             const data = await res.json();
 
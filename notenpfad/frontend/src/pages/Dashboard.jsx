@@ -13,32 +13,37 @@ import AddGradeModal from '../components/AddGradeModal';
 import GradeList from '../components/GradeList';
 
 const API_URL = 'http://localhost:8000';
+const RECENT_GRADES = 5;
+const CHART_POINTS = 100;
 
-const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
+const Dashboard = ({ studentId, liveVersion, onSelectSubject, onViewHistory }) => {
     const [stats, setStats] = useState(null); // Changed from average number to stats object
     const [subjects, setSubjects] = useState([]);
     const [grades, setGrades] = useState([]);
+    const [gradeCount, setGradeCount] = useState(0);
+    const [trendPoints, setTrendPoints] = useState([]);
     const [loading, setLoading] = useState(true);
     const [isModalOpen, setIsModalOpen] = useState(false);
 
     useEffect(() => {
         fetchData();
-    }, [studentId]);
+    }, [studentId, liveVersion]);
 
     const fetchData = async () => {
         try {
-            const avgRes = await fetch(`${API_URL}/average/?student_id=${studentId}`);
-            const avgData = await avgRes.json();
-            setStats(avgData); // Expecting { average, details, passed }
-
-            const subjRes = await fetch(`${API_URL}/subjects/`);
-            const subjData = await subjRes.json();
-            setSubjects(subjData);
-
-            const gradesRes = await fetch(`${API_URL}/grades/?student_id=${studentId}`);
-            const gradesData = await gradesRes.json();
-            const sortedGrades = gradesData.sort((a, b) => new Date(b.date) - new Date(a.date));
-            setGrades(sortedGrades);
+            // Score, subject summaries and the newest grades in one request
+            // (the chart series comes pre-averaged and downsampled, in parallel)
+            const [res, trendRes] = await Promise.all([
+                fetch(`${API_URL}/students/${studentId}/dashboard?recent=${RECENT_GRADES}`),
+                fetch(`${API_URL}/students/${studentId}/trend?max_points=${CHART_POINTS}`)
+            ]);
+            const data = await res.json();
+            const trend = await trendRes.json();
+            setTrendPoints(trend.series.length > 0 ? trend.series[0].points : []); // overall series
+            setStats(data.score); // Expecting { average, details, passed }
+            setSubjects(data.subjects);
+            setGrades(data.recent_grades); // newest first
+            setGradeCount(data.grade_count);
 
         } catch (error) {
             console.error("Error fetching data:", error);
@@ -180,7 +185,7 @@ const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
                     <h3>📈 Verlauf</h3>
                     <div style={{ width: '100%', height: 200, marginTop: '1rem' }}>
                         <ResponsiveContainer width="100%" height="100%">
-                            <LineChart data={grades}>
+                            <LineChart data={trendPoints}>
                                 <CartesianGrid strokeDasharray="3 3" vertical={false} stroke="#e2e8f0" />
                                 <XAxis dataKey="date" hide />
                                 <YAxis domain={[1, 6]} hide />
@@ -195,6 +200,14 @@ const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
                                     dot={{ fill: 'var(--color-primary)', r: 4 }}
                                     activeDot={{ r: 6 }}
                                 />
+                                <Line
+                                    type="monotone"
+                                    dataKey="rolling_avg"
+                                    name="Ø (gleitend)"
+                                    stroke="var(--color-secondary)"
+                                    strokeWidth={2}
+                                    dot={false}
+                                />
                             </LineChart>
                         </ResponsiveContainer>
                     </div>
@@ -206,13 +219,13 @@ const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
                         onDelete={handleDeleteGrade}
                     />
 
-                    {grades.length > 5 && (
+                    {gradeCount > 5 && (
                         <button
                             className="btn"
                             style={{ width: '100%', marginTop: '1rem', background: '#f1f5f9' }}
                             onClick={onViewHistory}
                         >
-                            Alle anzeigen ({grades.length})
+                            Alle anzeigen ({gradeCount})
                         </button>
                     )}
                 </div>
@@ -228,10 +241,7 @@ const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
             ) : (
                 <div>
                     {subjects.map(sub => {
-                        const subGrades = grades.filter(g => g.subject_id === sub.id);
-                        const subAvg = subGrades.length > 0
-                            ? (subGrades.reduce((acc, curr) => acc + curr.value, 0) / subGrades.length).toFixed(2)
-                            : '-';
+                        const subAvg = sub.average != null ? sub.average.toFixed(2) : '-';
 
                         return (
                             <div
@@ -244,7 +254,7 @@ const Dashboard = ({ studentId, onSelectSubject, onViewHistory }) => {
                                     onClick={() => onSelectSubject && onSelectSubject(sub)}
                                 >
                                     <span style={{ fontWeight: '600', display: 'block' }}>{sub.name}</span>
-                                    {subGrades.length > 0 && (
+                                    {sub.grade_count > 0 && (
                                         <span style={{ fontSize: '0.9rem', color: '#64748b' }}>
                                             Ø {subAvg}
                                         </span>
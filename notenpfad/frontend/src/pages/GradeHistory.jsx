@@ -1,34 +1,35 @@
 import React, { useState, useEffect } from 'react';
 import GradeList from '../components/GradeList';
-
-const API_URL = 'http://localhost:8000';
+import { flush, gradeList, loadStore, pull, queueMutation, subjectList } from '../sync';
 
 const GradeHistory = ({ studentId, onBack }) => {
     const [grades, setGrades] = useState([]);
     const [subjects, setSubjects] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [offline, setOffline] = useState(false);
 
     useEffect(() => {
         fetchData();
+        // Back online: send queued edits and catch up
+        window.addEventListener('online', fetchData);
+        return () => window.removeEventListener('online', fetchData);
     }, [studentId]);
 
+    const show = (store) => {
+        setGrades(gradeList(store));
+        setSubjects(subjectList(store));
+    };
+
     const fetchData = async () => {
+        // The local copy first, then only what changed on the server
+        show(loadStore(studentId));
         try {
-            const [gradesRes, subjRes] = await Promise.all([
-                fetch(`${API_URL}/grades/?student_id=${studentId}`),
-                fetch(`${API_URL}/subjects/`)
-            ]);
-
-            const gradesData = await gradesRes.json();
-            const subjData = await subjRes.json();
-
-            // Sort by date descending (newest first)
-            const sortedGrades = gradesData.sort((a, b) => new Date(b.date) - new Date(a.date));
-
-            setGrades(sortedGrades);
-            setSubjects(subjData);
+            await flush(studentId);
+            show(await pull(studentId));
+            setOffline(false);
         } catch (error) {
-            console.error("Error fetching history:", error);
+            console.error("Error syncing history:", error);
+            setOffline(true);
         } finally {
             setLoading(false);
         }
@@ -37,9 +38,8 @@ const GradeHistory = ({ studentId, onBack }) => {
     const handleDeleteGrade = async (gradeId) => {
         if (!confirm("Note wirklich löschen?")) return;
 
-        await fetch(`${API_URL}/grades/${gradeId}`, {
-            method: 'DELETE'
-        });
+        // Queued, so it also works offline
+        queueMutation(studentId, { op: 'grade.delete', target: { id: gradeId } });
         fetchData();
     };
 
@@ -56,6 +56,10 @@ const GradeHistory = ({ studentId, onBack }) => {
                 <h2 style={{ margin: 0 }}>Notenverlauf</h2>
             </div>
 
+            {offline && (
+                <p style={{ color: '#b45309', marginBottom: '1rem' }}>Offline: gespeicherte Noten, Änderungen werden später übertragen.</p>
+            )}
+
             <div className="card">
                 {loading ? (
                     <p>Laden...</p>
@@ -2,8 +2,9 @@ import React, { useState, useEffect } from 'react';
 
 const API_URL = 'http://127.0.0.1:8000';
 
-const Kids = ({ user, onViewChild }) => {
+const Kids = ({ user, liveVersion, onViewChild }) => {
     const [children, setChildren] = useState([]);
+    const [overview, setOverview] = useState({}); // user id -> { average, passed, last_activity }
     const [showAddForm, setShowAddForm] = useState(false);
     const [newChildName, setNewChildName] = useState('');
     const [newChildUsername, setNewChildUsername] = useState('');
@@ -17,16 +18,23 @@ const Kids = ({ user, onViewChild }) => {
 
     useEffect(() => {
         fetchChildren();
-    }, [user]);
+    }, [user, liveVersion]);
 
     const fetchChildren = async () => {
         try {
             const userId = user.id || user.user_id;
-            const response = await fetch(`${API_URL}/users/${userId}/children`);
+            const [response, overviewRes] = await Promise.all([
+                fetch(`${API_URL}/users/${userId}/children`),
+                fetch(`${API_URL}/users/${userId}/overview`)
+            ]);
             if (response.ok) {
                 const data = await response.json();
                 setChildren(data);
             }
+            if (overviewRes.ok) {
+                const data = await overviewRes.json();
+                setOverview(Object.fromEntries(data.children.map(c => [c.id, c])));
+            }
         } catch (err) {
             console.error("Failed to fetch children", err);
         }
@@ -250,7 +258,14 @@ const Kids = ({ user, onViewChild }) => {
                         </div>
                         <div className="child-info">
                             <h3>{child.student_profile?.name || child.username}</h3>
-                            <p>Klicke um Noten anzusehen</p>
+                            {overview[child.id]?.average != null ? (
+                                <p>
+                                    Ø {overview[child.id].average.toFixed(2)} {overview[child.id].passed ? '🎉' : '🛑'}
+                                    {overview[child.id].last_activity && ` · zuletzt ${overview[child.id].last_activity}`}
+                                </p>
+                            ) : (
+                                <p>Klicke um Noten anzusehen</p>
+                            )}
                         </div>
                         <button
                             className="btn-icon"
@@ -1,27 +1,129 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 
 const API_URL = 'http://localhost:8000';
+const POLL_MS = 2000;
 
-const ScanExam = () => {
+const ScanExam = ({ studentId }) => {
     const [analyzing, setAnalyzing] = useState(false);
     const [result, setResult] = useState(null);
+    const [job, setJob] = useState(null);
+    const [error, setError] = useState(null);
+    const [autoSave, setAutoSave] = useState(false);
+    const [saved, setSaved] = useState(false);
+    const fileInput = useRef(null);
+    const stopWaiting = useRef(null);
 
-    const handleMockScan = async () => {
-        setAnalyzing(true);
-        // Simulate network delay
-        setTimeout(async () => {
+    // Stop listening when the page is left
+    useEffect(() => () => stopWaiting.current && stopWaiting.current(), []);
+
+    const finish = (data) => {
+        setJob(data);
+        setAnalyzing(false);
+        if (data.status === 'done') {
+            setResult(data.result);
+            setSaved(Boolean(data.grade_id));
+            if (data.error) setError(data.error);
+        } else {
+            setError(data.error || 'Die Analyse ist fehlgeschlagen.');
+        }
+    };
+
+    const poll = (jobId) => {
+        const timer = setInterval(async () => {
             try {
-                const res = await fetch(`${API_URL}/analyze-exam`, {
-                    method: 'POST',
-                });
+                const res = await fetch(`${API_URL}/jobs/${jobId}`);
                 const data = await res.json();
-                setResult(data);
-            } catch (error) {
-                console.error("Scan error", error);
-            } finally {
+                if (data.status === 'done' || data.status === 'failed') {
+                    clearInterval(timer);
+                    finish(data);
+                }
+            } catch (err) {
+                console.error("Job status error", err);
+            }
+        }, POLL_MS);
+        stopWaiting.current = () => clearInterval(timer);
+    };
+
+    const waitFor = (jobId) => {
+        if (!window.EventSource) {
+            poll(jobId);
+            return;
+        }
+        const source = new EventSource(`${API_URL}/jobs/${jobId}/events`);
+        stopWaiting.current = () => source.close();
+        const onFinished = (event) => {
+            source.close();
+            finish(JSON.parse(event.data));
+        };
+        source.addEventListener('status', (event) => setJob(JSON.parse(event.data)));
+        source.addEventListener('done', onFinished);
+        source.addEventListener('failed', onFinished);
+        source.addEventListener('gone', () => {
+            source.close();
+            setAnalyzing(false);
+            setError('Der Auftrag wurde gelöscht.');
+        });
+        source.onerror = () => {
+            // Connection lost: fall back to polling
+            source.close();
+            poll(jobId);
+        };
+    };
+
+    const handleFile = async (event) => {
+        const file = event.target.files[0];
+        event.target.value = '';
+        if (!file) return;
+        setAnalyzing(true);
+        setResult(null);
+        setJob(null);
+        setError(null);
+        setSaved(false);
+        try {
+            const params = new URLSearchParams({ filename: file.name, create_grade: autoSave });
+            if (studentId) params.set('student_id', studentId);
+            const res = await fetch(`${API_URL}/analyze-exam?${params}`, {
+                method: 'POST',
+                headers: { 'Content-Type': file.type || 'application/octet-stream' },
+                body: file
+            });
+            const data = await res.json();
+            if (!res.ok) {
+                setError(data.detail || 'Upload fehlgeschlagen.');
                 setAnalyzing(false);
+                return;
             }
-        }, 1500);
+            setJob(data);
+            waitFor(data.id);
+        } catch (err) {
+            console.error("Scan error", err);
+            setError('Upload fehlgeschlagen.');
+            setAnalyzing(false);
+        }
+    };
+
+    const handleSave = async () => {
+        try {
+            const subjects = await (await fetch(`${API_URL}/subjects/`)).json();
+            const subject = subjects.find(s => s.name === result.subject);
+            if (!subject) {
+                setError(`Unbekanntes Fach: ${result.subject}`);
+                return;
+            }
+            const res = await fetch(`${API_URL}/grades/?student_id=${studentId}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    value: result.grade,
+                    subject_id: subject.id,
+                    type: result.type || 'Prüfung',
+                    date: result.date || new Date().toISOString().split('T')[0]
+                })
+            });
+            if (res.ok) setSaved(true);
+        } catch (err) {
+            console.error("Save error", err);
+        }
     };
 
     return (
@@ -29,17 +131,26 @@ const ScanExam = () => {
             <h2>Prüfung Scannen 📸</h2>
             <p style={{ marginBottom: '1.5rem' }}>Fotografiere deine Prüfung, um die Note automatisch zu erfassen und Tipps zu erhalten (Demo).</p>
 
+            <input
+                ref={fileInput}
+                type="file"
+                accept="image/*,application/pdf"
+                capture="environment"
+                style={{ display: 'none' }}
+                onChange={handleFile}
+            />
+
             <div className="card flex-center" style={{
                 height: '300px',
                 border: '2px dashed var(--color-border)',
                 backgroundColor: '#f1f5f9',
                 flexDirection: 'column',
-                cursor: 'pointer'
-            }} onClick={handleMockScan}>
+                cursor: analyzing ? 'default' : 'pointer'
+            }} onClick={() => !analyzing && fileInput.current.click()}>
                 {analyzing ? (
                     <div style={{ textAlign: 'center' }}>
                         <span style={{ fontSize: '3rem', display: 'block', marginBottom: '1rem' }} className="animate-pulse">🧠</span>
-                        <p>Analysiere Prüfung...</p>
+                        <p>{job && job.status === 'running' ? 'Analysiere Prüfung...' : 'In der Warteschlange...'}</p>
                     </div>
                 ) : (
                     <>
@@ -49,6 +160,17 @@ const ScanExam = () => {
                 )}
             </div>
 
+            <label style={{ display: 'flex', alignItems: 'center', gap: '0.5rem', marginBottom: '1rem' }}>
+                <input type="checkbox" checked={autoSave} onChange={e => setAutoSave(e.target.checked)} disabled={analyzing} />
+                Note automatisch speichern
+            </label>
+
+            {error && (
+                <div className="card" style={{ border: '2px solid #ef4444', color: '#b91c1c' }}>
+                    {error}
+                </div>
+            )}
+
             {result && (
                 <div className="card animate-fade-in" style={{ border: '2px solid var(--color-primary)' }}>
                     <h3>Ergebnis</h3>
@@ -56,12 +178,18 @@ const ScanExam = () => {
                         <p>Erkannte Note: <strong style={{ color: 'var(--color-primary)', fontSize: '1.2rem' }}>{result.grade}</strong></p>
                         <p>Fach: <strong>{result.subject}</strong></p>
                     </div>
-                    <div style={{ background: '#eff6ff', padding: '1rem', borderRadius: '8px' }}>
-                        <p style={{ color: '#1e40af', fontSize: '0.9rem' }}>💡 <strong>AI Tipp:</strong> {result.feedback}</p>
-                    </div>
-                    <button className="btn btn-primary" style={{ marginTop: '1rem' }} onClick={() => alert('Note gespeichert!')}>
-                        Note übernehmen
-                    </button>
+                    {result.feedback && (
+                        <div style={{ background: '#eff6ff', padding: '1rem', borderRadius: '8px' }}>
+                            <p style={{ color: '#1e40af', fontSize: '0.9rem' }}>💡 <strong>AI Tipp:</strong> {result.feedback}</p>
+                        </div>
+                    )}
+                    {saved ? (
+                        <p style={{ marginTop: '1rem', color: 'var(--color-primary)' }}>✓ Note gespeichert</p>
+                    ) : (
+                        <button className="btn btn-primary" style={{ marginTop: '1rem' }} onClick={handleSave}>
+                            Note übernehmen
+                        </button>
+                    )}
                 </div>
             )}
         </div>
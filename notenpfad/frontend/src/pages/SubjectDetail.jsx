@@ -19,11 +19,10 @@ const SubjectDetail = ({ studentId, subject, onBack }) => {
     };
 
     const fetchGrades = async () => {
-        // Fetch all grades and filter (inefficient but simple for demo)
-        // Or adding a specific endpoint would be better, but sticking to existing pattern
-        const res = await fetch(`${API_URL}/grades/?student_id=${studentId}`);
+        // Filtered and sorted (newest first) by the server
+        const res = await fetch(`${API_URL}/grades/?student_id=${studentId}&subject_id=${subject.id}`);
         const data = await res.json();
-        setSubjectGrades(data.filter(g => g.subject_id === subject.id));
+        setSubjectGrades(data);
     };
 
     const handleAddTopic = async () => {
@@ -0,0 +1,91 @@
+// Offline copy of a student's grades, subjects and topics (GET/POST /sync).
+//
+// pull() asks the server only for what changed since the stored cursor
+// and merges it into the copy in localStorage; the first call (or one
+// after the server compacted its log) gets a full snapshot instead.
+// Edits made offline are queued with a client-generated id and sent by
+// flush(); the server applies each id only once, so a flush that is
+// interrupted can simply be repeated.
+
+const API_URL = 'http://localhost:8000';
+
+const storeKey = (studentId) => `notenpfad-sync-${studentId}`;
+const queueKey = (studentId) => `notenpfad-sync-queue-${studentId}`;
+
+const read = (key, fallback) => {
+    try {
+        return JSON.parse(localStorage.getItem(key)) || fallback;
+    } catch {
+        return fallback;
+    }
+};
+
+const emptyStore = () => ({ cursor: null, grades: {}, subjects: {}, topics: {} });
+
+export const loadStore = (studentId) => read(storeKey(studentId), emptyStore());
+
+const saveStore = (studentId, store) => localStorage.setItem(storeKey(studentId), JSON.stringify(store));
+
+const merge = (rows, changes) => {
+    changes.upserts.forEach(row => { rows[row.id] = row; });
+    changes.deletes.forEach(id => { delete rows[id]; });
+};
+
+export const pull = async (studentId) => {
+    let store = loadStore(studentId);
+    let hasMore = true;
+    while (hasMore) {
+        const params = new URLSearchParams({ student_id: studentId });
+        if (store.cursor) params.set('since', store.cursor);
+        const res = await fetch(`${API_URL}/sync?${params}`);
+        if (!res.ok) throw new Error(`Sync failed: ${res.status}`);
+        const data = await res.json();
+        if (data.reset) store = emptyStore();
+        merge(store.grades, data.grades);
+        merge(store.subjects, data.subjects);
+        merge(store.topics, data.topics);
+        store.cursor = data.cursor;
+        hasMore = data.has_more;
+    }
+    saveStore(studentId, store);
+    return store;
+};
+
+// Newest first, like GET /grades/
+export const gradeList = (store) => Object.values(store.grades)
+    .sort((a, b) => (b.date || '').localeCompare(a.date || '') || b.id - a.id);
+
+export const subjectList = (store) => Object.values(store.subjects).sort((a, b) => a.id - b.id);
+
+export const queueMutation = (studentId, mutation) => {
+    const queue = read(queueKey(studentId), []);
+    const id = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    queue.push({ id, ...mutation });
+    localStorage.setItem(queueKey(studentId), JSON.stringify(queue));
+
+    // Show the edit right away; the next pull brings the server's version
+    const store = loadStore(studentId);
+    if (mutation.op === 'grade.delete' && mutation.target.id !== undefined) {
+        delete store.grades[mutation.target.id];
+        saveStore(studentId, store);
+    }
+    return id;
+};
+
+export const flush = async (studentId) => {
+    const queue = read(queueKey(studentId), []);
+    if (queue.length === 0) return [];
+    const res = await fetch(`${API_URL}/sync`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ student_id: studentId, mutations: queue })
+    });
+    if (!res.ok) throw new Error(`Sync failed: ${res.status}`);
+    const { results } = await res.json();
+    // Everything sent got an answer (applied, duplicate or rejected); keep only what was queued meanwhile
+    const sent = new Set(queue.map(m => m.id));
+    const remaining = read(queueKey(studentId), []).filter(m => !sent.has(m.id));
+    localStorage.setItem(queueKey(studentId), JSON.stringify(remaining));
+    results.filter(r => r.status === 'error').forEach(r => console.warn("Offline edit rejected", r));
+    return results;
+};